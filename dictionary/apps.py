@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class DictionaryConfig(AppConfig):
+    name = 'dictionary'
+
+    def ready(self):
+        # connect the signal handlers that keep copied columns and the
+        # search indexes up to date
+        from dictionary import (signals, keyword_index, tag_index,  # noqa
+            positions, fuzzy, definition_search, phonology,
+            similarity, relations)
@@ -0,0 +1,138 @@
+"""
+Validators for conditional GETs of the dictionary pages, and the surrogate
+keys that let a caching proxy in front of the site purge them.
+
+Pages depend on two kinds of revision. Each gloss has its own (the revision
+and modified columns), which changes whenever its entry does. The dictionary
+as a whole has another, kept in the cache named by INDEX_CACHE_ALIAS, which
+changes with anything that moves a sign or changes what a search finds
+(keywords, translations, publishing, sign numbers, tags). It is the time of
+the last such edit in milliseconds, so it doubles as a Last-Modified date.
+
+Every response lists its surrogate keys in a Surrogate-Key header: the
+'dictionary' key, and a 'gloss-<id>' key for each gloss it shows. When an
+edit is committed, each of the callables named in the PURGE_HOOKS setting
+is called with the keys of the pages it has made out of date.
+"""
+import hashlib
+import logging
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django.utils.six.moves.urllib.request import Request, urlopen
+
+
+logger = logging.getLogger(__name__)
+
+REVISION_KEY = 'dictionary:revision'
+
+DICTIONARY_KEY = 'dictionary'
+
+
+def _cache():
+    return caches[getattr(settings, 'INDEX_CACHE_ALIAS', 'default')]
+
+
+def _now():
+    return int(time.time() * 1000)
+
+
+def dictionary_revision():
+    """Return the revision of the dictionary as a whole"""
+    cache = _cache()
+    revision = cache.get(REVISION_KEY)
+    if revision is None:
+        # nobody knows when the last edit was, so say it was now
+        cache.add(REVISION_KEY, _now(), None)
+        revision = cache.get(REVISION_KEY)
+    return revision
+
+
+def dictionary_modified():
+    """Return the time of the last edit to the dictionary as a whole"""
+    return datetime.fromtimestamp(dictionary_revision() / 1000.0,
+                                  timezone.utc)
+
+
+def digest(*parts):
+    """Return a hash of some values, for use in a key"""
+    text = u':'.join(u'%s' % part for part in parts)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def make_etag(*parts):
+    """Return a strong ETag made from the parts of a page's identity"""
+    return '"%s"' % digest(*parts)
+
+
+def latest(*times):
+    """Return the latest of some times, ignoring any that are None"""
+    times = [t for t in times if t is not None]
+    return max(times) if times else None
+
+
+def gloss_key(gloss_id):
+    return 'gloss-%d' % gloss_id
+
+
+def surrogate_keys(gloss_ids):
+    """Return the Surrogate-Key header of a page showing these glosses"""
+    return ' '.join([DICTIONARY_KEY] +
+                    [gloss_key(gloss_id) for gloss_id in sorted(set(gloss_ids))])
+
+
+def purge(keys):
+    """
+    Call every purge hook with a list of surrogate keys once the current
+    transaction has been committed, so that the proxy can't fetch the
+    pages again before the edit can be seen
+    """
+    hooks = getattr(settings, 'PURGE_HOOKS', ())
+    if not hooks or not keys:
+        return
+    keys = list(keys)
+
+    def run_hooks():
+        for hook in hooks:
+            try:
+                import_string(hook)(keys)
+            except Exception:
+                # a proxy that can't be reached mustn't stop an edit
+                logger.exception('Purge hook %s failed', hook)
+    transaction.on_commit(run_hooks)
+
+
+def dictionary_changed():
+    """
+    Give the dictionary a new revision and purge every page once the
+    current transaction has been committed, so that no page, or count
+    cached under the revision, is made from the dictionary before the edit
+    under the revision after it
+    """
+    def bump():
+        cache = _cache()
+        revision = max(_now(), (cache.get(REVISION_KEY) or 0) + 1)
+        cache.set(REVISION_KEY, revision, None)
+    transaction.on_commit(bump)
+    purge([DICTIONARY_KEY])
+
+
+def glosses_changed(gloss_ids):
+    """Purge the pages showing these glosses"""
+    purge([gloss_key(gloss_id) for gloss_id in sorted(set(gloss_ids))])
+
+
+def http_purge(keys):
+    """
+    A purge hook that sends a PURGE request with the keys in a
+    Surrogate-Key header to the proxy at the PURGE_URL setting
+    """
+    request = Request(settings.PURGE_URL,
+                      headers={'Surrogate-Key': ' '.join(keys)})
+    request.get_method = lambda: 'PURGE'
+    urlopen(request, timeout=getattr(settings, 'PURGE_TIMEOUT', 5)).close()
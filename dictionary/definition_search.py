@@ -0,0 +1,352 @@
+"""
+Full-text search of the text of definitions, ranked by BM25.
+
+A definition is broken into the roots of its words (see stemming.py), so a
+search for "running" finds a definition about "runs". A search finds the
+definitions containing every word of the query, best first. Unpublished
+definitions are only found if asked for.
+
+The DEFINITION_SEARCH_BACKEND setting is the dotted path of the class that
+answers searches:
+
+* DefinitionIndex (the default) keeps an inverted index of the words of
+  every definition in the memory of each process, loaded on first use and
+  kept up to date by the signal handlers below like the other indexes.
+* FTS5DefinitionIndex keeps the words in an SQLite FTS5 table, for sites
+  whose database is SQLite. The rebuild_definition_index command makes
+  and fills the table.
+
+Both score a definition with the formula FTS5's bm25() uses, so they rank
+the same definitions the same way.
+
+A definition's words are kept in its 'words' column, set when it is saved,
+so neither backend tokenizes the text of every definition when it loads.
+The rebuild_definition_index command tokenizes them all again, in
+parallel, for when the stemming changes.
+"""
+import multiprocessing
+import re
+from math import log
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from dictionary.indexes import InMemoryIndex
+from dictionary.keyword_index import fold
+from dictionary.models import Definition
+from dictionary.stemming import stem
+
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# the BM25 parameters, as FTS5 sets them
+K1 = 1.2
+B = 0.75
+
+CHUNK_SIZE = 500
+
+
+def tokenize(text):
+    """Return the roots of the words of a definition or query, in order"""
+    return [stem(word) for word in WORD_RE.findall(fold(text))]
+
+
+def index_words(text):
+    """Return the words of a definition as its 'words' column keeps them"""
+    return u' '.join(tokenize(text))
+
+
+def _tokenize_rows(rows):
+    return [(did, words, index_words(text)) for (did, words, text) in rows]
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def tokenize_definitions(processes=1):
+    """
+    Set the 'words' column of every definition again, tokenizing them in
+    'processes' worker processes if it is more than 1, and return how many
+    definitions there are
+    """
+    if processes > 1:
+        # start the workers before the query, so they don't inherit it
+        pool = multiprocessing.Pool(processes)
+    else:
+        pool = None
+    count = 0
+    try:
+        # read before any is updated, so no query is open while they are
+        rows = list(Definition.objects.order_by('id')
+                    .values_list('id', 'words', 'text'))
+        for chunks in _chunks(_chunks(rows, CHUNK_SIZE), 4 * processes):
+            # the rows are read here rather than by the pool's workers,
+            # which would each need their own database connection
+            if pool is None:
+                chunks = [_tokenize_rows(chunk) for chunk in chunks]
+            else:
+                chunks = pool.map(_tokenize_rows, chunks)
+            with transaction.atomic():
+                for chunk in chunks:
+                    for (did, old, words) in chunk:
+                        if words != old:
+                            Definition.objects.filter(pk=did).update(words=words)
+                    count += len(chunk)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return count
+
+
+def definition_words():
+    """Yield (definition id, published, words) for every definition"""
+    rows = (Definition.objects.order_by('id')
+            .values_list('id', 'published', 'words').iterator())
+    for (did, published, words) in rows:
+        yield (did, published, words.split())
+
+
+def idf(total, containing):
+    """
+    Return the inverse document frequency of a word that 'containing' of
+    'total' definitions contain. Like FTS5, a word in more than half of
+    them still counts for a little.
+    """
+    value = log((total - containing + 0.5) / (containing + 0.5))
+    return value if value > 0 else 1e-6
+
+
+class DefinitionSearchBackend(object):
+    """The interface of the classes that answer definition searches"""
+
+    def search(self, query, include_unpublished=False, limit=None):
+        """
+        Return a list of (definition id, score) pairs for the definitions
+        containing every word of 'query', best first
+        """
+        raise NotImplementedError
+
+    def definition_saved(self, definition):
+        raise NotImplementedError
+
+    def definition_deleted(self, pk):
+        raise NotImplementedError
+
+    def invalidate(self):
+        """Index every definition again, from the words it has stored"""
+        raise NotImplementedError
+
+    def rebuild(self, processes=1):
+        """
+        Tokenize every definition again in 'processes' processes and index
+        them all again, and return how many there are
+        """
+        count = tokenize_definitions(processes)
+        self.invalidate()
+        return count
+
+
+class DefinitionIndex(InMemoryIndex, DefinitionSearchBackend):
+    """
+    For each word, the number of times each definition containing it uses
+    it, and the length and published flag of every definition.
+    """
+    name = 'definitions'
+
+    def build(self):
+        self._load(definition_words())
+
+    def _load(self, rows):
+        self._postings = {}
+        self._words = {}
+        self._length = {}
+        self._published = {}
+        self._total_length = 0
+        for (did, published, words) in rows:
+            self._add(did, published, words)
+
+    def _add(self, did, published, words):
+        counts = {}
+        for word in words:
+            counts[word] = counts.get(word, 0) + 1
+        for (word, count) in counts.items():
+            self._postings.setdefault(word, {})[did] = count
+        self._words[did] = list(counts)
+        self._length[did] = len(words)
+        self._published[did] = published
+        self._total_length += len(words)
+
+    def _remove(self, did):
+        if did not in self._words:
+            return
+        for word in self._words.pop(did):
+            postings = self._postings[word]
+            del postings[did]
+            if not postings:
+                del self._postings[word]
+        self._total_length -= self._length.pop(did)
+        del self._published[did]
+
+    def _put(self, did, published, words):
+        self._remove(did)
+        self._add(did, published, words)
+
+    def definition_saved(self, definition):
+        self.update(self._put, definition.pk, definition.published,
+                    definition.words.split())
+
+    def definition_deleted(self, pk):
+        self.update(self._remove, pk)
+
+    def search(self, query, include_unpublished=False, limit=None):
+        words = set(tokenize(query))
+        if not words:
+            return []
+        self.ensure_built()
+        with self._lock:
+            total = len(self._length)
+            postings = [self._postings.get(word, {}) for word in words]
+            postings.sort(key=len)
+            found = set(postings[0])
+            for posting in postings[1:]:
+                found.intersection_update(posting)
+            if not include_unpublished:
+                found = [did for did in found if self._published[did]]
+            if not found:
+                return []
+            average = float(self._total_length) / total
+            weights = [(posting, idf(total, len(posting))) for posting in postings]
+            scored = []
+            for did in found:
+                norm = K1 * (1 - B + B * self._length[did] / average)
+                score = sum(weight * posting[did] * (K1 + 1) / (posting[did] + norm)
+                            for (posting, weight) in weights)
+                scored.append((-score, did))
+        scored.sort()
+        return [(did, -score) for (score, did) in scored[:limit]]
+
+
+class FTS5DefinitionIndex(DefinitionSearchBackend):
+    """
+    The words of every definition in an SQLite FTS5 table whose rowids are
+    the ids of the definitions.
+    """
+    table = 'dictionary_definition_fts'
+
+    def __init__(self):
+        if connection.vendor != 'sqlite':
+            raise ImproperlyConfigured(
+                'FTS5DefinitionIndex needs an SQLite database')
+
+    def _exists(self, cursor):
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s",
+                       [self.table])
+        return cursor.fetchone() is not None
+
+    def _create(self, cursor):
+        # the words are tokenized already, so FTS5 need only split them
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(words, "
+            "published UNINDEXED, "
+            "tokenize = \"unicode61 remove_diacritics 0 tokenchars '_'\")"
+            % self.table)
+
+    def _fill(self, cursor):
+        cursor.execute("DELETE FROM %s" % self.table)
+        for chunk in _chunks(definition_words(), CHUNK_SIZE):
+            cursor.executemany(
+                "INSERT INTO %s (rowid, words, published) VALUES (%%s, %%s, %%s)"
+                % self.table,
+                [(did, u' '.join(words), int(published))
+                 for (did, published, words) in chunk])
+
+    def definition_saved(self, definition):
+        with connection.cursor() as cursor:
+            if self._exists(cursor):
+                cursor.execute("DELETE FROM %s WHERE rowid = %%s" % self.table,
+                               [definition.pk])
+                cursor.execute(
+                    "INSERT INTO %s (rowid, words, published) VALUES (%%s, %%s, %%s)"
+                    % self.table, [definition.pk, definition.words,
+                                   int(definition.published)])
+
+    def definition_deleted(self, pk):
+        with connection.cursor() as cursor:
+            if self._exists(cursor):
+                cursor.execute("DELETE FROM %s WHERE rowid = %%s" % self.table,
+                               [pk])
+
+    def invalidate(self):
+        # the rows are replaced rather than the table dropped, so nothing
+        # but rebuild() changes the schema
+        with transaction.atomic(), connection.cursor() as cursor:
+            if self._exists(cursor):
+                self._fill(cursor)
+
+    def rebuild(self, processes=1):
+        count = tokenize_definitions(processes)
+        with transaction.atomic(), connection.cursor() as cursor:
+            self._create(cursor)
+            self._fill(cursor)
+        return count
+
+    def search(self, query, include_unpublished=False, limit=None):
+        words = sorted(set(tokenize(query)))
+        if not words:
+            return []
+        sql = ("SELECT rowid, bm25(%s) FROM %s WHERE %s MATCH %%s"
+               % (self.table, self.table, self.table))
+        if not include_unpublished:
+            sql += " AND published = 1"
+        sql += " ORDER BY bm25(%s), rowid LIMIT %%s" % self.table
+        with connection.cursor() as cursor:
+            if not self._exists(cursor):
+                raise ImproperlyConfigured(
+                    'There is no %s table; run the rebuild_definition_index '
+                    'command to make it' % self.table)
+            cursor.execute(sql, [u' '.join(u'"%s"' % word for word in words),
+                                 -1 if limit is None else limit])
+            return [(did, -rank) for (did, rank) in cursor.fetchall()]
+
+
+_backends = {}
+
+
+def definition_search():
+    """Return the backend named by the DEFINITION_SEARCH_BACKEND setting"""
+    path = getattr(settings, 'DEFINITION_SEARCH_BACKEND',
+                   'dictionary.definition_search.DefinitionIndex')
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
+
+
+@receiver(pre_save, sender=Definition)
+def definition_saving(sender, instance, **kwargs):
+    # fixtures too, since this only depends on the text
+    instance.words = index_words(instance.text)
+
+
+@receiver(post_save, sender=Definition)
+def definition_saved(sender, instance, **kwargs):
+    # a definition is indexed from its own row, so one from a fixture is
+    # indexed like any other
+    definition_search().definition_saved(instance)
+
+
+@receiver(post_delete, sender=Definition)
+def definition_deleted(sender, instance, **kwargs):
+    definition_search().definition_deleted(instance.pk)
@@ -0,0 +1,125 @@
+"""
+A cache of the rendered sign entry block of the word and gloss pages.
+
+An entry is stored under the revision of its gloss, which is bumped whenever
+the gloss, its keywords, definitions or relations change (see signals.py),
+so an edit never has to find and delete the copies it makes out of date;
+they are simply no longer asked for. The page around the entry, with the
+sign's position and the previous/next links, is not cached.
+
+The most recently used entries are kept in the memory of the process, up to
+ENTRY_CACHE_SIZE of them, in front of the Django cache named by the
+ENTRY_CACHE_ALIAS setting, which can be any backend.
+"""
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.safestring import mark_safe
+
+from dictionary.models import viewer
+
+
+STAFF_VIEWER = 'staff'
+USER_VIEWER = 'logged-in'
+ANONYMOUS_VIEWER = 'anonymous'
+ANONYMOUS_SAFE_VIEWER = 'anonymous-safe'
+
+VERSION_KEY = 'dictionary:entry:version'
+
+
+def entry_viewer(request):
+    """Return which of the kinds of viewer an entry is rendered for"""
+    user = viewer(request)
+    if user.staff:
+        return STAFF_VIEWER
+    if user.authenticated:
+        return USER_VIEWER
+    if user.safe_search:
+        return ANONYMOUS_SAFE_VIEWER
+    return ANONYMOUS_VIEWER
+
+
+class EntryCache(object):
+    """
+    Rendered entries, keyed by gloss, revision, keyword and viewer, in a
+    bounded least-recently-used dictionary in front of a Django cache.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._recent = OrderedDict()
+        self._version = uuid.uuid4().hex
+
+    def _backend(self):
+        alias = getattr(settings, 'ENTRY_CACHE_ALIAS', 'default')
+        if alias:
+            return caches[alias]
+        return None
+
+    def _current_version(self):
+        backend = self._backend()
+        if backend is None:
+            return self._version
+        version = backend.get(VERSION_KEY)
+        if version is None:
+            backend.add(VERSION_KEY, self._version, None)
+            version = backend.get(VERSION_KEY)
+        return version
+
+    def key(self, gloss, keyword_id, n, viewer):
+        """
+        Return the key of the entry for 'gloss' as reached from its
+        n'th translation of keyword 'keyword_id' (both None when the
+        gloss is looked at directly), rendered for 'viewer'
+        """
+        return 'dictionary:entry:%s:%d:%d:%d:%d:%s' % (
+            self._current_version(), gloss.pk, gloss.revision,
+            keyword_id or 0, n or 0, viewer)
+
+    def get(self, key):
+        """Return the entry stored under 'key', or None"""
+        with self._lock:
+            html = self._recent.pop(key, None)
+            if html is not None:
+                self._recent[key] = html
+                return html
+        backend = self._backend()
+        if backend is None:
+            return None
+        html = backend.get(key)
+        if html is not None:
+            html = mark_safe(html)
+            self._remember(key, html)
+        return html
+
+    def set(self, key, html):
+        self._remember(key, html)
+        backend = self._backend()
+        if backend is not None:
+            backend.set(key, html, getattr(settings, 'ENTRY_CACHE_TIMEOUT',
+                                           24*60*60))
+
+    def _remember(self, key, html):
+        with self._lock:
+            self._recent.pop(key, None)
+            self._recent[key] = html
+            size = getattr(settings, 'ENTRY_CACHE_SIZE', 500)
+            while len(self._recent) > size:
+                self._recent.popitem(last=False)
+
+    def clear(self):
+        """
+        Throw every cached entry away, in every process, for when the
+        revisions can't be trusted (after a fixture is loaded, say)
+        """
+        with self._lock:
+            self._recent.clear()
+            self._version = uuid.uuid4().hex
+            backend = self._backend()
+            if backend is not None:
+                backend.set(VERSION_KEY, self._version, None)
+
+
+entry_cache = EntryCache()
@@ -0,0 +1,121 @@
+"""
+Writing every sign out as CSV, in the columns the importer reads (see
+importer.py), with the labels of the phonology choices rather than their
+codes and the tags of each sign as well. The unpublished definitions, if
+they are exported, have columns of their own, so they are imported again
+as unpublished.
+
+The rows are made as they are written: the glosses are read from the
+database with iterator(), and for each chunk of them the keywords,
+definitions, tags, regions and relations are read with one query each, so
+the memory an export takes doesn't grow with the dictionary.
+"""
+import csv
+from itertools import islice
+
+from django.conf import settings
+from django.utils import six
+
+from dictionary.models import (Gloss, Translation, Definition, Region,
+    Relation, RELATION_ROLE_CHOICES)
+from dictionary.importer import gloss_fields, join
+from dictionary.tag_index import gloss_tags
+
+
+CHUNK_SIZE = 500
+
+
+class Echo(object):
+    """A file that gives back what is written to it, for a csv.writer"""
+    def write(self, value):
+        return value
+
+
+def export_columns(include_unpublished=True):
+    """Return the names of the columns of an export, and the gloss fields"""
+    fields = sorted(gloss_fields().values(), key=lambda field: field.creation_counter)
+    columns = ([field.name for field in fields] + ['keywords', 'tags', 'dialects'] +
+               ['definition:%s' % role for (role, name)
+                in settings.DEFINITION_ROLE_CHOICES])
+    if include_unpublished:
+        columns += ['definition:%s:unpublished' % role for (role, name)
+                    in settings.DEFINITION_ROLE_CHOICES]
+    columns += ['relation:%s' % role for (role, name) in RELATION_ROLE_CHOICES]
+    return (columns, fields)
+
+
+def _group(pairs):
+    groups = {}
+    for (key, value) in pairs:
+        groups.setdefault(key, []).append(value)
+    return groups
+
+
+def _chunk_rows(glosses, fields, include_unpublished):
+    ids = [gloss.pk for gloss in glosses]
+    keywords = _group(Translation.objects.filter(gloss__in=ids)
+                      .order_by('gloss', 'index')
+                      .values_list('gloss', 'translation__text'))
+    definitions = Definition.objects.filter(gloss__in=ids)
+    if not include_unpublished:
+        definitions = definitions.filter(published=True)
+    definitions = _group(((gloss_id, role, published), text)
+                         for (gloss_id, role, published, text)
+                         in definitions.order_by('gloss', 'role', 'count')
+                         .values_list('gloss', 'role', 'published', 'text'))
+    tags = _group(gloss_tags().filter(object_id__in=ids).order_by('tag__name')
+                  .values_list('object_id', 'tag__name'))
+    dialects = _group(Region.objects.filter(gloss__in=ids)
+                      .order_by('gloss', 'dialect__name')
+                      .values_list('gloss', 'dialect__name'))
+    relations = _group(((source_id, role), target) for (source_id, role, target)
+                       in Relation.objects.filter(source__in=ids)
+                       .order_by('source', 'role', 'target__idgloss')
+                       .values_list('source', 'role', 'target__idgloss'))
+    for gloss in glosses:
+        row = []
+        for field in fields:
+            if field.choices:
+                value = getattr(gloss, 'get_%s_display' % field.name)()
+            else:
+                value = getattr(gloss, field.attname)
+            row.append(u'' if value is None else u'%s' % value)
+        row.append(join(keywords.get(gloss.pk, ())))
+        row.append(join(tags.get(gloss.pk, ())))
+        row.append(join(dialects.get(gloss.pk, ())))
+        for (role, name) in settings.DEFINITION_ROLE_CHOICES:
+            row.append(join(definitions.get((gloss.pk, role, True), ())))
+        if include_unpublished:
+            for (role, name) in settings.DEFINITION_ROLE_CHOICES:
+                row.append(join(definitions.get((gloss.pk, role, False), ())))
+        for (role, name) in RELATION_ROLE_CHOICES:
+            row.append(join(relations.get((gloss.pk, role), ())))
+        yield row
+
+
+def export_rows(include_unpublished=True, chunk_size=CHUNK_SIZE):
+    """
+    Yield the header and then a row for each gloss, in idgloss order.
+    Unpublished definitions are left out unless 'include_unpublished'.
+    """
+    (columns, fields) = export_columns(include_unpublished)
+    yield columns
+    glosses = Gloss.objects.order_by('idgloss', 'pk').iterator()
+    while True:
+        chunk = list(islice(glosses, chunk_size))
+        if not chunk:
+            break
+        for row in _chunk_rows(chunk, fields, include_unpublished):
+            yield row
+
+
+def export_csv(out, include_unpublished=True, chunk_size=CHUNK_SIZE):
+    """
+    Yield the lines of the CSV export as written by csv.writer(out); an
+    Echo gives them back to be sent on
+    """
+    writer = csv.writer(out)
+    for row in export_rows(include_unpublished, chunk_size):
+        if six.PY2:
+            row = [value.encode('utf-8') for value in row]
+        yield writer.writerow(row)
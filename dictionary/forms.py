@@ -1,13 +1,29 @@
 from django import forms
 from django.conf import settings
 
+from dictionary.models import Gloss
+from dictionary.phonology import PHONOLOGY_FIELDS
+
+
+def with_allowed_tags(choices):
+    """Add the ALLOWED_TAGS that aren't already in 'choices'"""
+    listed = dict(choices)
+    return tuple(choices) + tuple((t, t) for t in settings.ALLOWED_TAGS
+                                  if t and t not in listed)
+
+
 class UserSignSearchForm(forms.Form):
     # category choices are tag values that we'll restrict search to
     CATEGORY_CHOICES = (('all', 'All Signs'),
         ('semantic:health', 'Only Health Related Signs'),
         ('semantic:education', 'Only Education Related Signs'))
     query = forms.CharField(label='Keywords starting with', max_length=100, widget=forms.TextInput(attrs={'class': 'form-control'}))
-    category = forms.ChoiceField(label='Search', choices=CATEGORY_CHOICES, required=False, widget=forms.Select(attrs={'class': 'form-control'}))
+    category = forms.ChoiceField(label='Search', choices=with_allowed_tags(CATEGORY_CHOICES), required=False, widget=forms.Select(attrs={'class': 'form-control'}))
+    fuzzy = forms.BooleanField(label='Include close matches', required=False)
+
+
+class DefinitionSearchForm(forms.Form):
+    query = forms.CharField(label='Definitions mentioning', max_length=100, widget=forms.TextInput(attrs={'class': 'form-control'}))
     
 
 class TagUpdateForm(forms.Form):
@@ -15,3 +31,25 @@ class TagUpdateForm(forms.Form):
     tag = forms.ChoiceField(widget=forms.Select(attrs={'class': 'form-control'}), 
                             choices=[(t, t) for t in settings.ALLOWED_TAGS])
     delete = forms.BooleanField(required=False, widget=forms.HiddenInput)
+
+
+class PhonologySearchForm(forms.Form):
+    """
+    Find signs by their form: any of the values picked for a field, and
+    every field (or any of them) that has values picked
+    """
+    MATCH_CHOICES = (('all', 'Every feature'), ('any', 'Any feature'))
+    match = forms.ChoiceField(label='Match', choices=MATCH_CHOICES, required=False, widget=forms.Select(attrs={'class': 'form-control'}))
+
+    def __init__(self, *args, **kwargs):
+        super(PhonologySearchForm, self).__init__(*args, **kwargs)
+        for name in PHONOLOGY_FIELDS:
+            field = Gloss._meta.get_field(name)
+            self.fields[name] = forms.MultipleChoiceField(
+                label=field.verbose_name, required=False,
+                choices=[(u'%s' % value, label) for (value, label) in field.choices],
+                widget=forms.SelectMultiple(attrs={'class': 'form-control'}))
+
+    def criteria(self):
+        """Return a dictionary from each field to the values picked for it"""
+        return dict((name, self.cleaned_data[name]) for name in PHONOLOGY_FIELDS)
@@ -0,0 +1,171 @@
+"""
+An index of keyword trigrams for finding keywords that are spelled like a
+search term that doesn't match any keyword.
+
+Each keyword is broken into the trigrams of its case-folded text, padded
+like PostgreSQL's pg_trgm does, and the index keeps the set of keywords
+containing each trigram. A keyword is a close match for a term if the
+trigrams they share are at least FUZZY_THRESHOLD of all their trigrams
+(their Jaccard similarity), or if it is within FUZZY_DISTANCE edits of the
+term. An edit changes at most three trigrams, so the distance allowed for a
+short term is smaller, and either way a close match shares a known number
+of trigrams with the term and must contain one of its rarest few.
+Candidates are only drawn from those postings, and at most
+FUZZY_CANDIDATES of them are compared with the term, which keeps a lookup
+cheap however many keywords there are. A term whose rarest trigrams are
+all common may miss some close matches.
+"""
+from itertools import islice
+from math import ceil
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from dictionary.indexes import InMemoryIndex
+from dictionary.keyword_index import fold
+from dictionary.models import Keyword
+
+
+def trigrams(text):
+    """Return the set of trigrams of a keyword or search term"""
+    padded = u'  %s ' % fold(text).strip()
+    return frozenset(padded[i:i+3] for i in range(len(padded) - 2))
+
+
+def edit_distance(a, b, limit):
+    """
+    Return the Levenshtein distance between 'a' and 'b', or limit + 1
+    if it is more than 'limit'
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for (i, ca) in enumerate(a, 1):
+        current = [i]
+        for (j, cb) in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j-1] + 1,
+                               previous[j-1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+def shared_needed(term):
+    """
+    Return how many trigrams a keyword must share with 'term' to be
+    similar enough to it
+    """
+    threshold = getattr(settings, 'FUZZY_THRESHOLD', 0.3)
+    # shared / (n + m - shared) >= threshold, and shared <= m
+    return max(1, int(ceil(threshold * len(trigrams(term)))))
+
+
+def allowed_distance(term):
+    """
+    Return how many edits away from 'term' a keyword may be. An edit
+    changes at most three trigrams, so short terms allow fewer, so that a
+    keyword within them shares as many trigrams as a similar one would.
+    """
+    return max(0, min(getattr(settings, 'FUZZY_DISTANCE', 2),
+                      (len(trigrams(term)) - shared_needed(term)) // 3))
+
+
+class FuzzyIndex(InMemoryIndex):
+    """
+    The trigrams of every keyword and, for each trigram, the ids of the
+    keywords that contain it.
+    """
+    name = 'fuzzy'
+
+    def build(self):
+        self._text = {}
+        self._trigrams = {}
+        self._postings = {}
+        for (kid, text) in Keyword.objects.values_list('id', 'text'):
+            self._add(kid, text)
+
+    def _add(self, kid, text):
+        self._text[kid] = fold(text)
+        self._trigrams[kid] = trigrams(text)
+        for trigram in self._trigrams[kid]:
+            self._postings.setdefault(trigram, set()).add(kid)
+
+    def _remove(self, kid):
+        self._text.pop(kid, None)
+        for trigram in self._trigrams.pop(kid, ()):
+            postings = self._postings[trigram]
+            postings.discard(kid)
+            if not postings:
+                del self._postings[trigram]
+
+    def _put(self, kid, text):
+        self._remove(kid)
+        self._add(kid, text)
+
+    def keyword_saved(self, keyword):
+        self.update(self._put, keyword.pk, keyword.text)
+
+    def keyword_deleted(self, pk):
+        self.update(self._remove, pk)
+
+    def search(self, term):
+        """
+        Return the ids of the keywords that are close matches for 'term',
+        closest first: by edit distance, then by trigram similarity. At
+        most FUZZY_CANDIDATES keywords are compared with the term.
+        """
+        threshold = getattr(settings, 'FUZZY_THRESHOLD', 0.3)
+        max_distance = allowed_distance(term)
+        wanted = trigrams(term)
+        folded = fold(term).strip()
+        if not folded:
+            return []
+        self.ensure_built()
+        with self._lock:
+            # a close match shares at least 'needed' trigrams with the
+            # term, so has one of its len(wanted) - needed + 1 rarest ones
+            needed = shared_needed(term)
+            rarest = sorted(wanted,
+                            key=lambda t: len(self._postings.get(t, ())))
+            # but a term whose rarest trigrams are common, such as a short
+            # one, would be compared with most of the keywords, so only the
+            # first FUZZY_CANDIDATES keywords found are
+            limit = getattr(settings, 'FUZZY_CANDIDATES', 5000)
+            candidates = set()
+            for trigram in rarest[:len(wanted) - needed + 1]:
+                postings = self._postings.get(trigram, ())
+                if len(candidates) + len(postings) > limit:
+                    candidates.update(islice(postings.difference(candidates),
+                                             limit - len(candidates)))
+                    break
+                candidates.update(postings)
+            ranked = []
+            for kid in candidates:
+                keyword_trigrams = self._trigrams[kid]
+                shared = len(wanted & keyword_trigrams)
+                similarity = float(shared) / (len(wanted) +
+                                              len(keyword_trigrams) - shared)
+                distance = edit_distance(folded, self._text[kid],
+                                         max_distance)
+                if similarity >= threshold or distance <= max_distance:
+                    ranked.append((distance, -similarity, self._text[kid], kid))
+        ranked.sort()
+        return [kid for (distance, similarity, text, kid) in ranked]
+
+
+fuzzy_index = FuzzyIndex()
+
+
+@receiver(post_save, sender=Keyword)
+def keyword_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        fuzzy_index.invalidate()
+    elif instance.has_changed('text'):
+        fuzzy_index.keyword_saved(instance)
+
+
+@receiver(post_delete, sender=Keyword)
+def keyword_deleted(sender, instance, **kwargs):
+    fuzzy_index.keyword_deleted(instance.pk)
@@ -0,0 +1,462 @@
+"""
+Loading signs in bulk from a spreadsheet (CSV) or a JSON Lines file.
+
+Each record describes one gloss, found by its idgloss, and the keywords,
+tags, definitions, regions and relations it has. Only the fields a record
+gives are changed: a gloss that exists is updated, one that doesn't is
+created, and a record with keywords, tags, definitions, regions or
+relations replaces the ones the gloss had.
+
+In a JSON Lines file each line is an object such as::
+
+    {"idgloss": "Adam", "sn": 5, "inWeb": true,
+     "keywords": ["Adam", "man"], "tags": ["semantic:people"],
+     "definitions": [{"role": "general", "text": "A man's name."}],
+     "regions": [{"dialect": "Southern", "frequency": "high"}],
+     "relations": [{"role": "homophone", "target": "Adam2"}]}
+
+In a CSV file the columns are the fields of a gloss, plus 'keywords',
+'tags' and 'dialects' and a 'definition:<role>' or 'relation:<role>'
+column for each role; a 'definition:<role>:unpublished' column holds the
+definitions of a role that are not published. Several keywords, tags,
+dialects, definitions or targets in one cell are separated by '|', and a
+'|' or '\\' in one of them is written '\\|' or '\\\\'. The export (see
+exporter.py) writes files in this form.
+
+Records are read as they are needed and written a chunk at a time, each
+chunk in its own transaction, with bulk inserts and updates that send no
+signals. The keywords, translation counts, revisions, caches and indexes
+that the signal handlers would have kept up to date are brought up to date
+once at the end instead.
+"""
+import csv
+import io
+import json
+import sys
+from itertools import islice
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.core.exceptions import ValidationError
+from django.utils import six
+
+from tagging.models import Tag, TaggedItem
+
+from dictionary.models import (Gloss, Keyword, Translation, Definition,
+    Dialect, Region, Relation, PublicTranslation, update_keyword_translations,
+    bump_revisions, refresh_public_glosses, bulk_update)
+from dictionary.keyword_index import fold
+from dictionary.stemming import stem
+from dictionary.indexes import invalidate_all
+from dictionary.definition_search import definition_search, index_words
+from dictionary.conditional import dictionary_changed
+
+
+# fields of a gloss that are worked out rather than imported
+DERIVED_FIELDS = ('id', 'revision', 'modified')
+
+# the most objects in one UPDATE or IN (...), to stay under the number
+# of parameters a query may have
+BATCH_SIZE = 100
+
+SEPARATOR = '|'
+ESCAPE = '\\'
+
+
+class RecordError(Exception):
+    """A record that can't be imported, and the line it is on"""
+    def __init__(self, line, message):
+        super(RecordError, self).__init__('line %s: %s' % (line, message))
+
+
+def gloss_fields():
+    """Return the fields of a gloss a record may set, by name"""
+    return dict((field.name, field) for field in Gloss._meta.concrete_fields
+                if field.name not in DERIVED_FIELDS)
+
+
+def distinct(items):
+    """Return the distinct items of a list, in the order they first appear"""
+    seen = set()
+    return [item for item in items if not (item in seen or seen.add(item))]
+
+
+def batches(items, size=BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def delete_rows(queryset):
+    """
+    Delete the rows of a queryset without sending signals or cascading.
+    Only the public copies of translations refer to the rows the importer
+    replaces, and they are deleted first.
+    """
+    # QuerySet.delete() would first load every row to send the signals the
+    # finishing pass stands in for. _raw_delete() is private, but it is the
+    # single DELETE that delete() itself runs when nothing refers to the
+    # rows or listens for their deletion, and the tests cover its use here
+    queryset._raw_delete(queryset.db)
+
+
+def open_input(path):
+    """Open a file, or standard input for '-', to read text from"""
+    if path == '-':
+        return sys.stdin
+    if six.PY2:
+        return open(path, 'rb')
+    return io.open(path, encoding='utf-8', newline='')
+
+
+def join(values):
+    """Return the text of a cell holding 'values'"""
+    return SEPARATOR.join(
+        (u'%s' % value).replace(ESCAPE, ESCAPE * 2)
+        .replace(SEPARATOR, ESCAPE + SEPARATOR) for value in values)
+
+
+def split(cell):
+    """Return the values in a cell, without the empty ones"""
+    values = []
+    value = []
+    i = 0
+    while i < len(cell):
+        if cell[i] == ESCAPE and cell[i + 1:i + 2] in (ESCAPE, SEPARATOR):
+            value.append(cell[i + 1])
+            i += 2
+            continue
+        if cell[i] == SEPARATOR:
+            values.append(u''.join(value))
+            value = []
+        else:
+            value.append(cell[i])
+        i += 1
+    values.append(u''.join(value))
+    return [value.strip() for value in values if value.strip()]
+
+
+def read_jsonl(stream):
+    """Yield (line number, record) for the lines of a JSON Lines file"""
+    for (line, text) in enumerate(stream, 1):
+        if text.strip():
+            try:
+                yield (line, json.loads(text))
+            except ValueError as e:
+                raise RecordError(line, e)
+
+
+def read_csv(stream):
+    """Yield (line number, record) for the rows of a CSV file"""
+    reader = csv.DictReader(stream)
+    for row in reader:
+        if six.PY2:
+            row = dict((key.decode('utf-8'), (value or '').decode('utf-8'))
+                       for (key, value) in row.items())
+        record = {}
+        for (column, cell) in row.items():
+            cell = cell or ''
+            if column in ('keywords', 'tags'):
+                record[column] = split(cell)
+            elif column == 'dialects':
+                record['regions'] = [{'dialect': name} for name in split(cell)]
+            elif column.startswith('definition:'):
+                (role, colon, state) = column.split(':', 1)[1].partition(':')
+                record.setdefault('definitions', []).extend(
+                    {'role': role, 'text': text,
+                     'published': state != 'unpublished'}
+                    for text in split(cell))
+            elif column.startswith('relation:'):
+                record.setdefault('relations', []).extend(
+                    {'role': column.split(':', 1)[1], 'target': target}
+                    for target in split(cell))
+            else:
+                record[column] = cell
+        yield (reader.line_num, record)
+
+
+class SignImporter(object):
+    """
+    Imports records a chunk at a time. The ids of the glosses, keywords and
+    dialects are looked up once, and kept up to date as rows are added.
+    """
+    def __init__(self):
+        self.fields = gloss_fields()
+        # an export gives the labels of the choices of a field
+        self.labels = dict((name, dict((u'%s' % label, value)
+                                       for (value, label) in field.flatchoices))
+                           for (name, field) in self.fields.items() if field.choices)
+        self.glosses = {}
+        for (pk, idgloss) in Gloss.objects.order_by('-pk').values_list('pk', 'idgloss'):
+            self.glosses[idgloss] = pk
+        self.keywords = dict(Keyword.objects.values_list('text', 'pk'))
+        self.dialects = {}
+        for (pk, name, language) in Dialect.objects.values_list(
+                'pk', 'name', 'language__name'):
+            self.dialects[name] = pk
+            self.dialects['%s/%s' % (language, name)] = pk
+        # what has to be brought up to date at the end
+        self.changed_glosses = set()
+        self.changed_keywords = set()
+        # relations to glosses that haven't been read yet
+        self.pending_relations = []
+        self.created = 0
+        self.updated = 0
+
+    def run(self, records, chunk_size=500):
+        """
+        Import (line number, record) pairs, 'chunk_size' records per
+        transaction. If a record can't be imported, the chunks before it
+        are kept, and the RecordError is raised once they are up to date.
+        """
+        records = iter(records)
+        try:
+            while True:
+                chunk = list(islice(records, chunk_size))
+                if not chunk:
+                    break
+                with transaction.atomic():
+                    self.import_chunk(chunk)
+            with transaction.atomic():
+                self.import_relations(self.pending_relations, final=True)
+        finally:
+            self.finish()
+
+    def import_chunk(self, chunk):
+        # a gloss given twice in a chunk is imported as the last record
+        records = {}
+        lines = {}
+        for (line, record) in chunk:
+            idgloss = record.get('idgloss')
+            if not idgloss:
+                raise RecordError(line, 'no idgloss')
+            records.setdefault(idgloss, {}).update(record)
+            lines[idgloss] = line
+        ids = self.import_glosses(records, lines)
+        self.changed_glosses.update(ids.values())
+        with_keywords = dict((ids[idgloss], record['keywords'])
+                             for (idgloss, record) in records.items()
+                             if 'keywords' in record)
+        self.import_translations(with_keywords)
+        self.import_tags(dict((ids[idgloss], record['tags'])
+                              for (idgloss, record) in records.items()
+                              if 'tags' in record))
+        self.import_definitions(dict((ids[idgloss], record['definitions'])
+                                     for (idgloss, record) in records.items()
+                                     if 'definitions' in record), lines, ids)
+        self.import_regions(dict((ids[idgloss], record['regions'])
+                                 for (idgloss, record) in records.items()
+                                 if 'regions' in record), lines, ids)
+        relations = []
+        for (idgloss, record) in records.items():
+            if 'relations' in record:
+                old = Relation.objects.filter(source=ids[idgloss])
+                # the entries of the signs it was related to change too
+                self.changed_glosses.update(old.values_list('target', flat=True))
+                delete_rows(old)
+                for relation in record['relations']:
+                    relations.append((lines[idgloss], ids[idgloss],
+                                      relation.get('role', ''), relation.get('target')))
+        self.import_relations(relations)
+
+    def gloss_values(self, record, line):
+        values = {}
+        for (name, value) in record.items():
+            if name in ('keywords', 'tags', 'definitions', 'regions', 'relations'):
+                continue
+            if name not in self.fields:
+                raise RecordError(line, 'a gloss has no field %r' % name)
+            field = self.fields[name]
+            if value == '' and field.null:
+                # an empty cell of a spreadsheet
+                value = None
+            elif name in self.labels:
+                value = self.labels[name].get(value, value)
+            try:
+                values[field.attname] = field.to_python(value)
+            except ValidationError as e:
+                raise RecordError(line, '%s: %s' % (name, '; '.join(e.messages)))
+        return values
+
+    def import_glosses(self, records, lines):
+        """Create or update the glosses and return their ids by idgloss"""
+        new = []
+        updates = {}
+        for (idgloss, record) in records.items():
+            values = self.gloss_values(record, lines[idgloss])
+            if idgloss in self.glosses:
+                gloss = Gloss(pk=self.glosses[idgloss], **values)
+                updates.setdefault(tuple(sorted(values)), []).append(gloss)
+            else:
+                new.append(Gloss(**values))
+        for (fields, glosses) in updates.items():
+            bulk_update(glosses, fields)
+            self.updated += len(glosses)
+        if new:
+            Gloss.objects.bulk_create(new, batch_size=BATCH_SIZE)
+            self.created += len(new)
+            # not every database tells bulk_create the new ids
+            for batch in batches(gloss.idgloss for gloss in new):
+                self.glosses.update((idgloss, pk) for (pk, idgloss) in
+                                    Gloss.objects.filter(idgloss__in=batch)
+                                    .values_list('pk', 'idgloss'))
+        return dict((idgloss, self.glosses[idgloss]) for idgloss in records)
+
+    def add_keywords(self, texts):
+        """Create the keywords that don't exist yet"""
+        new = sorted(set(text for text in texts if text not in self.keywords))
+        if new:
+            # the fields the Keyword pre_save signal handler would set
+            Keyword.objects.bulk_create(
+                [Keyword(text=text, folded=fold(text), stem=stem(text))
+                 for text in new], batch_size=BATCH_SIZE)
+            for batch in batches(new):
+                self.keywords.update(Keyword.objects.filter(text__in=batch)
+                                     .values_list('text', 'pk'))
+
+    def import_translations(self, keywords):
+        """Replace the translations of glosses, given by gloss id"""
+        if not keywords:
+            return
+        for batch in batches(keywords):
+            old = Translation.objects.filter(gloss__in=batch)
+            self.changed_keywords.update(old.values_list('translation', flat=True))
+            delete_rows(PublicTranslation.objects.filter(gloss__in=batch))
+            delete_rows(old)
+        self.add_keywords(text for texts in keywords.values() for text in texts)
+        translations = []
+        for (gloss_id, texts) in keywords.items():
+            # a keyword is only a translation of a gloss once
+            for (index, text) in enumerate(distinct(texts), 1):
+                translations.append(Translation(gloss_id=gloss_id,
+                                                translation_id=self.keywords[text],
+                                                index=index))
+                self.changed_keywords.add(self.keywords[text])
+        Translation.objects.bulk_create(translations, batch_size=BATCH_SIZE)
+
+    def import_tags(self, tags):
+        """Replace the tags of glosses, given by gloss id"""
+        if not tags:
+            return
+        names = sorted(set(name for names in tags.values() for name in names))
+        known = {}
+        for batch in batches(names):
+            known.update(Tag.objects.filter(name__in=batch).values_list('name', 'pk'))
+        new = [name for name in names if name not in known]
+        Tag.objects.bulk_create([Tag(name=name) for name in new],
+                                batch_size=BATCH_SIZE)
+        for batch in batches(new):
+            known.update(Tag.objects.filter(name__in=batch).values_list('name', 'pk'))
+        content_type = ContentType.objects.get_for_model(Gloss)
+        for batch in batches(tags):
+            delete_rows(TaggedItem.objects.filter(content_type=content_type,
+                                                  object_id__in=batch))
+        TaggedItem.objects.bulk_create(
+            [TaggedItem(tag_id=known[name], content_type=content_type,
+                        object_id=gloss_id)
+             for (gloss_id, names) in tags.items() for name in distinct(names)],
+            batch_size=BATCH_SIZE)
+
+    def import_definitions(self, definitions, lines, ids):
+        """
+        Replace the definitions of glosses, given by gloss id. A definition
+        that is already there, with the same role and number, is updated.
+        """
+        if not definitions:
+            return
+        existing = {}
+        for batch in batches(definitions):
+            for (pk, gloss_id, role, count) in Definition.objects.filter(
+                    gloss__in=batch).values_list('pk', 'gloss', 'role', 'count'):
+                existing[(gloss_id, role, count)] = pk
+        line_of = dict((ids[idgloss], lines[idgloss]) for idgloss in ids)
+        new = []
+        updated = []
+        for (gloss_id, items) in definitions.items():
+            counts = {}
+            for item in items:
+                role = item.get('role')
+                if not item.get('text') or not role:
+                    raise RecordError(line_of[gloss_id],
+                                      'a definition needs a role and a text')
+                counts[role] = counts.get(role, 0) + 1
+                definition = Definition(gloss_id=gloss_id, role=role,
+                                        count=int(item.get('count', counts[role])),
+                                        text=item['text'],
+                                        published=item.get('published', True),
+                                        words=index_words(item['text']))
+                key = (gloss_id, role, definition.count)
+                if key in existing:
+                    definition.pk = existing.pop(key)
+                    updated.append(definition)
+                else:
+                    new.append(definition)
+        # the ones the records no longer have
+        for batch in batches(existing.values()):
+            delete_rows(Definition.objects.filter(pk__in=batch))
+        bulk_update(updated, ['text', 'published', 'words'])
+        Definition.objects.bulk_create(new, batch_size=BATCH_SIZE)
+
+    def import_regions(self, regions, lines, ids):
+        """Replace the regions of glosses, given by gloss id"""
+        if not regions:
+            return
+        line_of = dict((ids[idgloss], lines[idgloss]) for idgloss in ids)
+        new = []
+        for (gloss_id, items) in regions.items():
+            for item in items:
+                if item.get('dialect') not in self.dialects:
+                    raise RecordError(line_of[gloss_id],
+                                      'no dialect %r' % item.get('dialect'))
+                new.append(Region(gloss_id=gloss_id,
+                                  dialect_id=self.dialects[item['dialect']],
+                                  frequency=item.get('frequency', ''),
+                                  traditional=item.get('traditional', False)))
+        for batch in batches(regions):
+            delete_rows(Region.objects.filter(gloss__in=batch))
+        Region.objects.bulk_create(new, batch_size=BATCH_SIZE)
+
+    def import_relations(self, relations, final=False):
+        """
+        Create relations given as (line, source id, role, target idgloss).
+        Those whose target hasn't been read yet are kept for later, and
+        are an error if it still hasn't been at the end.
+        """
+        new = []
+        for (line, source_id, role, target) in relations:
+            if target in self.glosses:
+                new.append(Relation(source_id=source_id, role=role,
+                                    target_id=self.glosses[target]))
+                self.changed_glosses.add(self.glosses[target])
+            elif final:
+                raise RecordError(line, 'no gloss %r to relate to' % target)
+            else:
+                self.pending_relations.append((line, source_id, role, target))
+        if final:
+            self.pending_relations = []
+        Relation.objects.bulk_create(new, batch_size=BATCH_SIZE)
+
+    def finish(self):
+        """
+        Bring what the signal handlers would have kept up to date up to
+        date, once for the whole import
+        """
+        # a batch at a time, each in its own transaction, so a failure
+        # leaves every batch either up to date or as the import left it
+        for batch in batches(self.changed_glosses):
+            with transaction.atomic():
+                refresh_public_glosses(batch)
+                bump_revisions(batch)
+        # publishing a gloss or tagging it crude changes the counts and
+        # ordinals of all its keywords, not just those it was given
+        for batch in batches(self.changed_glosses):
+            self.changed_keywords.update(Translation.objects.filter(
+                gloss__in=batch).values_list('translation', flat=True))
+        for batch in batches(self.changed_keywords):
+            with transaction.atomic():
+                update_keyword_translations(batch)
+        if self.changed_glosses or self.changed_keywords:
+            invalidate_all()
+            definition_search().invalidate()
+            dictionary_changed()
+
@@ -0,0 +1,156 @@
+"""
+In-process indexes over the dictionary tables.
+
+An index is loaded from the database the first time it is used and is then
+kept up to date by signal handlers in the process that makes an edit. Every
+edit also stores a new generation token in the Django cache named by the
+INDEX_CACHE_ALIAS setting; another process that sees a token it didn't
+build from throws its copy away and reloads it on its next lookup. Use a
+cache that is shared between processes (memcached, redis, the database)
+when the site runs more than one worker.
+
+An edit made in a transaction only reaches the index, and the token, once
+the transaction commits, so that no process holds rows that were rolled
+back, or loads the index from before an edit under the token that says it
+is up to date. A copy loaded while an edit of this process was waiting to
+commit may hold its uncommitted rows, and is thrown away if the edit is
+rolled back.
+
+An index is always loaded from the default database, never from a read
+replica that may be behind it (see routers.py).
+"""
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+def _primary():
+    # routers.py imports the models, which import this module
+    from dictionary.routers import primary
+    return primary()
+
+
+# every index that has been created, so they can all be reset together
+_registry = []
+
+
+class InMemoryIndex(object):
+    """
+    Base class for an index that lives in the memory of a process.
+
+    Subclasses set 'name' and implement build(), which loads the whole
+    index from the database, and call update() to apply an incremental
+    change made by this process.
+    """
+    name = None
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._token = None
+        # (connection, callback) for each edit waiting for its
+        # transaction to commit
+        self._pending = []
+        # whether this copy was loaded while an edit was waiting
+        self._uncommitted = False
+        _registry.append(self)
+
+    def build(self):
+        """Load the index from the database"""
+        raise NotImplementedError
+
+    def _cache(self):
+        return caches[getattr(settings, 'INDEX_CACHE_ALIAS', 'default')]
+
+    def _cache_key(self):
+        return 'dictionary:index:%s' % self.name
+
+    def _shared_token(self):
+        cache = self._cache()
+        token = cache.get(self._cache_key())
+        if token is None:
+            # nobody has built this index since the cache was emptied
+            cache.add(self._cache_key(), uuid.uuid4().hex, None)
+            token = cache.get(self._cache_key())
+        return token
+
+    def _forget_rolled_back(self):
+        # an edit that is neither waiting nor applied was rolled back,
+        # and a copy loaded before then may hold its rows
+        waiting = []
+        for (connection, callback) in self._pending:
+            if any(func is callback for (sids, func) in connection.run_on_commit):
+                waiting.append((connection, callback))
+            elif self._uncommitted:
+                self._built = False
+        self._pending = waiting
+
+    def ensure_built(self):
+        """Build the index if this process doesn't hold a current copy"""
+        token = self._shared_token()
+        with self._lock:
+            self._forget_rolled_back()
+            if not self._built or token != self._token:
+                with _primary():
+                    self.build()
+                self._built = True
+                self._token = token
+                self._uncommitted = bool(self._pending)
+
+    def _apply(self, func, args):
+        token = self._shared_token()
+        with self._lock:
+            if self._built and token == self._token and not self._uncommitted:
+                with _primary():
+                    func(*args)
+            else:
+                self._built = False
+            self._token = uuid.uuid4().hex
+            self._cache().set(self._cache_key(), self._token, None)
+
+    def update(self, func, *args):
+        """
+        Apply an incremental change to this process's copy with func(*args)
+        and tell the other processes that their copies are out of date,
+        once the transaction making it commits. A copy that was already
+        stale is thrown away instead.
+        """
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            self._apply(func, args)
+            return
+
+        def committed():
+            with self._lock:
+                self._pending = [(c, callback) for (c, callback) in self._pending
+                                 if callback is not committed]
+                self._apply(func, args)
+        with self._lock:
+            self._pending.append((connection, committed))
+        transaction.on_commit(committed)
+
+    def invalidate(self):
+        """Throw the index away in every process"""
+        with self._lock:
+            self._built = False
+            self._cache().set(self._cache_key(), uuid.uuid4().hex, None)
+
+    def clear(self):
+        """Throw this process's copy away; it is rebuilt on the next lookup"""
+        with self._lock:
+            self._built = False
+
+
+def clear_all():
+    """Throw away this process's copy of every index"""
+    for index in _registry:
+        index.clear()
+
+
+def invalidate_all():
+    """Throw every index away in every process"""
+    for index in _registry:
+        index.invalidate()
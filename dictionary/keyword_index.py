@@ -0,0 +1,297 @@
+"""
+A sorted, case-folded index of keywords for prefix searches.
+
+The search view used to run an 'istartswith' query for every request, which
+the database answers with a scan over keyword, translation and gloss. This
+index keeps one sorted list of keywords for each visibility tier, so a
+prefix search is a pair of bisects. The signal handlers at the bottom of
+this module keep it up to date as keywords, translations and glosses change.
+"""
+from bisect import bisect_left, bisect_right, insort
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from tagging.models import TaggedItem
+
+from dictionary.indexes import InMemoryIndex
+from dictionary.models import (Keyword, Translation, Gloss, STAFF_TIER,
+    PUBLIC_TIER, TIERS, CRUDE_TAG, crude_glosses, tag_ids)
+
+# sorts after any character a keyword is likely to contain
+_HIGHEST = u'\uffff'
+
+
+def fold(text):
+    """Return the case-folded form of 'text' that the index is sorted by"""
+    return text.lower()
+
+
+class KeywordIndex(InMemoryIndex):
+    """
+    For each tier, a sorted list of (folded text, text, keyword id) entries
+    for the keywords that tier can see, and the ids of the keywords with
+    each stem.
+    """
+    name = 'keywords'
+
+    def build(self):
+        self._crude = set(crude_glosses().values_list('object_id', flat=True))
+        self._text = {}
+        self._stem = {}
+        self._stems = {}
+        for (kid, text, stem) in Keyword.objects.values_list('id', 'text',
+                                                             'stem'):
+            self._text[kid] = text
+            self._add_stem(kid, stem)
+        self._translations = dict((kid, []) for kid in self._text)
+        for (kid, gloss_id, in_web) in Translation.objects.values_list(
+                'translation_id', 'gloss_id', 'gloss__inWeb'):
+            self._translations[kid].append((gloss_id, bool(in_web)))
+        self._entries = dict((tier, []) for tier in TIERS)
+        self._placed = {}
+        for kid in self._text:
+            self._placed[kid] = self._tiers(kid)
+            for tier in self._placed[kid]:
+                self._entries[tier].append(self._entry(kid))
+        for entries in self._entries.values():
+            entries.sort()
+
+    def _add_stem(self, kid, stem):
+        self._stem[kid] = stem
+        self._stems.setdefault(stem, set()).add(kid)
+
+    def _entry(self, kid):
+        text = self._text[kid]
+        return (fold(text), text, kid)
+
+    def _can_see(self, tier, gloss_id, in_web):
+        if tier == STAFF_TIER:
+            return True
+        if tier == PUBLIC_TIER:
+            return in_web
+        return in_web and gloss_id not in self._crude
+
+    def _tiers(self, kid):
+        """Return the tiers that can see keyword 'kid'"""
+        translations = self._translations.get(kid, ())
+        return [tier for tier in TIERS
+                if any(self._can_see(tier, gloss_id, in_web)
+                       for (gloss_id, in_web) in translations)]
+
+    def _remove(self, kid):
+        if kid not in self._text:
+            return
+        entry = self._entry(kid)
+        for tier in self._placed.pop(kid):
+            entries = self._entries[tier]
+            i = bisect_left(entries, entry)
+            if i < len(entries) and entries[i] == entry:
+                del entries[i]
+        del self._text[kid]
+        del self._translations[kid]
+        stem = self._stem.pop(kid)
+        self._stems[stem].discard(kid)
+        if not self._stems[stem]:
+            del self._stems[stem]
+
+    def _reload(self, keyword_ids):
+        keyword_ids = set(keyword_ids)
+        text = {}
+        stems = {}
+        for (kid, keyword_text, stem) in (Keyword.objects
+                .filter(pk__in=keyword_ids).values_list('id', 'text', 'stem')):
+            text[kid] = keyword_text
+            stems[kid] = stem
+        translations = dict((kid, []) for kid in text)
+        for (kid, gloss_id, in_web) in (Translation.objects
+                .filter(translation_id__in=keyword_ids)
+                .values_list('translation_id', 'gloss_id', 'gloss__inWeb')):
+            if kid in translations:
+                translations[kid].append((gloss_id, bool(in_web)))
+        for kid in keyword_ids:
+            self._remove(kid)
+            if kid in text:
+                self._text[kid] = text[kid]
+                self._add_stem(kid, stems[kid])
+                self._translations[kid] = translations[kid]
+                self._placed[kid] = self._tiers(kid)
+                for tier in self._placed[kid]:
+                    insort(self._entries[tier], self._entry(kid))
+
+    def _retag(self, gloss_id, crude):
+        if crude:
+            self._crude.add(gloss_id)
+        else:
+            self._crude.discard(gloss_id)
+        self._reload(Translation.objects.filter(gloss_id=gloss_id)
+                     .values_list('translation_id', flat=True))
+
+    def refresh(self, keyword_ids):
+        """Reload the given keywords from the database"""
+        keyword_ids = [kid for kid in keyword_ids if kid is not None]
+        if keyword_ids:
+            self.update(self._reload, keyword_ids)
+
+    def set_crude(self, gloss_id, crude):
+        """Record whether a gloss is tagged crude"""
+        self.update(self._retag, gloss_id, crude)
+
+    def lookup(self, prefix, tier):
+        """
+        Return the ids of the keywords visible to 'tier' that start with
+        'prefix', ignoring case, in alphabetical order
+        """
+        self.ensure_built()
+        prefix = fold(prefix)
+        with self._lock:
+            entries = self._entries[tier]
+            lo = bisect_left(entries, (prefix,))
+            hi = bisect_left(entries, (prefix + _HIGHEST,))
+            return [kid for (folded, text, kid) in entries[lo:hi]]
+
+    def complete(self, prefix, tier, limit):
+        """
+        Return the texts of the first 'limit' keywords visible to 'tier'
+        that start with 'prefix', ignoring case, without touching the
+        database or copying more than 'limit' entries
+        """
+        self.ensure_built()
+        prefix = fold(prefix)
+        with self._lock:
+            entries = self._entries[tier]
+            lo = bisect_left(entries, (prefix,))
+            return [text for (folded, text, kid) in entries[lo:lo+limit]
+                    if folded.startswith(prefix)]
+
+    def stemmed(self, stem, tier):
+        """
+        Return the ids of the keywords visible to 'tier' with the stem
+        'stem', in alphabetical order
+        """
+        self.ensure_built()
+        with self._lock:
+            return sorted((kid for kid in self._stems.get(stem, ())
+                           if tier in self._placed.get(kid, ())),
+                          key=lambda kid: self._entry(kid))
+
+    def visible(self, keyword_ids, tier):
+        """Return the ids among 'keyword_ids' that 'tier' can see"""
+        self.ensure_built()
+        with self._lock:
+            return [kid for kid in keyword_ids
+                    if tier in self._placed.get(kid, ())]
+
+    def sort_key(self, kid):
+        """Return the key keyword 'kid' is sorted by"""
+        with self._lock:
+            text = self._text.get(kid, u'')
+        return (fold(text), text)
+
+    def glosses(self, keyword_ids, tier):
+        """
+        Return a list of (keyword id, gloss ids) pairs giving the glosses
+        of each of 'keyword_ids' that 'tier' can see
+        """
+        self.ensure_built()
+        with self._lock:
+            return [(kid, [gloss_id for (gloss_id, in_web)
+                           in self._translations.get(kid, ())
+                           if self._can_see(tier, gloss_id, in_web)])
+                    for kid in keyword_ids]
+
+    def search(self, prefix, tier):
+        """Like lookup() but return the keywords as a lazy sequence"""
+        return KeywordList(self.lookup(prefix, tier))
+
+
+class KeywordList(object):
+    """
+    A sequence of keywords given by their ids that only fetches
+    the keywords it is asked for, so it can be paginated cheaply
+    """
+    chunk_size = 100
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _fetch(self, ids):
+        keywords = Keyword.objects.in_bulk(ids)
+        return [keywords[kid] for kid in ids if kid in keywords]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._fetch(self.ids[key])
+        return Keyword.objects.get(pk=self.ids[key])
+
+    def __iter__(self):
+        for start in range(0, len(self.ids), self.chunk_size):
+            for keyword in self._fetch(self.ids[start:start+self.chunk_size]):
+                yield keyword
+
+    def after(self, text):
+        """
+        Return a KeywordList of the keywords in this one that sort after
+        'text', which needn't be a keyword itself
+        """
+        i = bisect_right(_SortKeys(self.ids), (fold(text), text))
+        return KeywordList(self.ids[i:])
+
+
+class _SortKeys(object):
+    """The sort keys of a list of keyword ids, for bisecting it"""
+    def __init__(self, ids):
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        return keyword_index.sort_key(self.ids[i])
+
+
+keyword_index = KeywordIndex()
+
+
+@receiver(post_save, sender=Keyword)
+@receiver(post_delete, sender=Keyword)
+def keyword_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        # a fixture is being loaded, the other tables may not be there yet
+        keyword_index.invalidate()
+    else:
+        keyword_index.refresh([instance.pk])
+
+
+@receiver(post_save, sender=Translation)
+@receiver(post_delete, sender=Translation)
+def translation_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        keyword_index.invalidate()
+    else:
+        keyword_index.refresh([instance.translation_id,
+                               instance.loaded_value('translation_id')])
+
+
+@receiver(post_save, sender=Gloss)
+def gloss_changed(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        keyword_index.invalidate()
+    elif not created and instance.has_changed('inWeb'):
+        keyword_index.refresh(instance.translation_set
+                              .values_list('translation_id', flat=True))
+
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def tag_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        keyword_index.invalidate()
+    elif (instance.content_type_id == ContentType.objects.get_for_model(Gloss).pk
+          and instance.tag_id == tag_ids.get(CRUDE_TAG)):
+        crude = crude_glosses().filter(object_id=instance.object_id).exists()
+        keyword_index.set_crude(instance.object_id, crude)
@@ -0,0 +1,51 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dictionary.models import Gloss, PUBLIC_TIER
+from dictionary.phonology import PHONOLOGY_FIELDS
+from dictionary.similarity import SimilarityIndex, available
+
+
+class Command(BaseCommand):
+    help = ('Time the similar-sign search over made-up signs with random '
+            'phonology, without touching the database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--glosses', type=int, default=50000,
+            help='The number of made-up signs (default: 50000).')
+        parser.add_argument(
+            '--queries', type=int, default=200,
+            help='The number of searches to time (default: 200).')
+        parser.add_argument(
+            '-k', type=int, default=10,
+            help='The number of similar signs each search finds (default: 10).')
+
+    def handle(self, *args, **options):
+        if not available():
+            raise CommandError('Finding similar signs needs NumPy')
+        count = max(1, options['glosses'])
+        rng = random.Random(0)
+        choices = dict((field, [value for (value, label)
+                                in Gloss._meta.get_field(field).choices])
+                       for field in PHONOLOGY_FIELDS)
+
+        def made_up(pk):
+            values = dict((field, rng.choice(values))
+                          for (field, values) in choices.items())
+            values.update(sn=pk, idgloss='sign%d' % pk, inWeb=rng.random() < 0.8)
+            return (pk, values, False)
+
+        index = SimilarityIndex()
+        started = time.time()
+        index._load(made_up(pk) for pk in range(1, count + 1))
+        loaded = time.time() - started
+        pks = [rng.randint(1, count) for i in range(max(1, options['queries']))]
+        started = time.time()
+        for pk in pks:
+            index._similar(pk, PUBLIC_TIER, options['k'])
+        each = (time.time() - started) / len(pks)
+        self.stdout.write('Loaded %d signs in %.2f seconds; a search took %.2f ms'
+                          % (count, loaded, each * 1000))
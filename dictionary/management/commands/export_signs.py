@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.utils import six
+
+from dictionary.exporter import export_csv, CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = ('Write every sign, with its keywords, definitions, tags, '
+            'regions and relations, as CSV.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-',
+                            help="The file to write, or '-' (the default) "
+                                 "for standard output.")
+        parser.add_argument(
+            '--published-only', action='store_true',
+            help='Leave out unpublished definitions.')
+        parser.add_argument(
+            '--chunk-size', type=int, default=CHUNK_SIZE,
+            help='The number of glosses to read at a time (default: %d).'
+                 % CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if path == '-':
+            out = self.stdout
+        elif six.PY2:
+            out = open(path, 'wb')
+        else:
+            out = open(path, 'w', encoding='utf-8', newline='')
+        try:
+            # each row is written to 'out' as it is made
+            for line in export_csv(out, not options['published_only'],
+                                   max(1, options['chunk_size'])):
+                pass
+        finally:
+            if path != '-':
+                out.close()
@@ -0,0 +1,57 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import six
+
+from dictionary.minimal_pairs import refresh_minimal_pairs, minimal_pairs_csv
+from dictionary.phonology import PHONOLOGY_FIELDS
+
+
+class Command(BaseCommand):
+    help = ('Find the pairs of signs whose phonology differs in exactly one '
+            'field, and write them out as CSV.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?',
+                            help="The file to write the report to, or '-' for "
+                                 "standard output (default: no report).")
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Only look again at the signs whose phonology has changed '
+                 'since the pairs were last found.')
+        parser.add_argument(
+            '--field', action='append', dest='fields', metavar='FIELD',
+            help='Only report the pairs that differ in FIELD; may be given '
+                 'more than once (default: every field).')
+        parser.add_argument(
+            '--processes', type=int, default=multiprocessing.cpu_count(),
+            help='The number of processes to group the signs in '
+                 '(default: the number of CPUs).')
+
+    def handle(self, *args, **options):
+        fields = options['fields'] or PHONOLOGY_FIELDS
+        for field in fields:
+            if field not in PHONOLOGY_FIELDS:
+                raise CommandError('%s is not a phonology field' % field)
+        started = time.time()
+        (glosses, pairs) = refresh_minimal_pairs(options['incremental'],
+                                                 max(1, options['processes']))
+        # the report may be going to standard output
+        self.stderr.write('Found %d minimal pairs of %d signs in %.1f seconds'
+                          % (pairs, glosses, time.time() - started))
+        path = options['path']
+        if path is None:
+            return
+        if path == '-':
+            out = self.stdout
+        elif six.PY2:
+            out = open(path, 'wb')
+        else:
+            out = open(path, 'w', encoding='utf-8', newline='')
+        try:
+            for line in minimal_pairs_csv(out, fields):
+                pass
+        finally:
+            if path != '-':
+                out.close()
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dictionary.importer import (SignImporter, RecordError, open_input,
+    read_csv, read_jsonl)
+
+
+class Command(BaseCommand):
+    help = ('Create or update signs, with their keywords, definitions, '
+            'regions and relations, from a CSV or JSON Lines file.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="The file to read, or '-' for "
+                                         "standard input.")
+        parser.add_argument(
+            '--format', choices=['csv', 'jsonl'],
+            help='The format of the file (default: csv if its name ends in '
+                 '.csv, jsonl otherwise).')
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='The number of records to write in each transaction '
+                 '(default: 500).')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        read = read_csv if format == 'csv' else read_jsonl
+        importer = SignImporter()
+        stream = open_input(path)
+        try:
+            importer.run(read(stream), max(1, options['chunk_size']))
+        except RecordError as e:
+            raise CommandError('%s (the chunks before it were imported)' % e)
+        finally:
+            if path != '-':
+                stream.close()
+            self.stdout.write('Created %d glosses and updated %d'
+                              % (importer.created, importer.updated))
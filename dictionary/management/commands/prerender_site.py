@@ -0,0 +1,35 @@
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from dictionary.prerender import prerender
+
+
+class Command(BaseCommand):
+    help = ('Render the word, gloss and A to Z search pages an anonymous '
+            'visitor sees to static HTML files.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory',
+                            help='The directory to write the pages to.')
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Only render the pages that have changed since the last '
+                 'run into the directory.')
+        parser.add_argument(
+            '--processes', type=int, default=multiprocessing.cpu_count(),
+            help='The number of processes to render pages in '
+                 '(default: the number of CPUs).')
+
+    def handle(self, *args, **options):
+        if settings.ALWAYS_REQUIRE_LOGIN:
+            raise CommandError('ALWAYS_REQUIRE_LOGIN is True, so no pages '
+                               'are public')
+        started = time.time()
+        (rendered, removed) = prerender(options['directory'],
+                                        max(1, options['processes']),
+                                        options['incremental'])
+        self.stdout.write('Rendered %d pages and removed %d in %.1f seconds'
+                          % (rendered, removed, time.time() - started))
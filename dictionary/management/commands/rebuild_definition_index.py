@@ -0,0 +1,24 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+
+from dictionary.definition_search import definition_search
+
+
+class Command(BaseCommand):
+    help = ('Tokenize the text of every definition again, in parallel, and '
+            'index them all again for the definition search. Every process '
+            'loads its index from the stored words rather than the text.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=multiprocessing.cpu_count(),
+            help='The number of processes to tokenize definitions in '
+                 '(default: the number of CPUs).')
+
+    def handle(self, *args, **options):
+        started = time.time()
+        count = definition_search().rebuild(max(1, options['processes']))
+        self.stdout.write('Indexed %d definitions in %.1f seconds'
+                          % (count, time.time() - started))
@@ -0,0 +1,52 @@
+"""
+Migration operations that change the columns of an SQLite table without
+breaking the foreign keys to it.
+
+Django before 2.1.5 changes a column of an SQLite table by renaming the
+table out of the way, making it again and copying the rows across. SQLite
+3.26 and later follow the rename in the foreign keys of the other tables,
+which are left pointing at the renamed table once it is dropped, unless
+the legacy_alter_table pragma is on. Earlier versions ignore the pragma.
+"""
+from contextlib import contextmanager
+
+from django.db import migrations
+
+
+@contextmanager
+def legacy_alter_table(schema_editor):
+    """Leave the foreign keys alone when SQLite renames a table"""
+    sqlite = schema_editor.connection.vendor == 'sqlite'
+    if sqlite:
+        schema_editor.execute('PRAGMA legacy_alter_table = ON')
+    try:
+        yield
+    finally:
+        if sqlite:
+            schema_editor.execute('PRAGMA legacy_alter_table = OFF')
+
+
+class LegacyAlterTableMixin(object):
+    """Run an operation with the legacy_alter_table pragma on"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        with legacy_alter_table(schema_editor):
+            super(LegacyAlterTableMixin, self).database_forwards(
+                app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        with legacy_alter_table(schema_editor):
+            super(LegacyAlterTableMixin, self).database_backwards(
+                app_label, schema_editor, from_state, to_state)
+
+
+class AddField(LegacyAlterTableMixin, migrations.AddField):
+    pass
+
+
+class RemoveField(LegacyAlterTableMixin, migrations.RemoveField):
+    pass
+
+
+class AlterField(LegacyAlterTableMixin, migrations.AlterField):
+    pass
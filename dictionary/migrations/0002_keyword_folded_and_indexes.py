@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+import dictionary.migration_operations
+from dictionary.keyword_index import fold
+from dictionary.stemming import stem
+
+
+def fold_keywords(apps, schema_editor):
+    # fill the columns the Keyword pre_save signal handler keeps up to date
+    Keyword = apps.get_model('dictionary', 'Keyword')
+    for keyword in Keyword.objects.only('id', 'text').iterator():
+        Keyword.objects.filter(pk=keyword.pk).update(
+            folded=fold(keyword.text), stem=stem(keyword.text))
+
+
+def count_translations(apps, schema_editor):
+    # number and count the translations of every keyword for each tier, as
+    # update_keyword_translations() keeps them up to date from now on
+    Keyword = apps.get_model('dictionary', 'Keyword')
+    Translation = apps.get_model('dictionary', 'Translation')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    TaggedItem = apps.get_model('tagging', 'TaggedItem')
+    crude = set(TaggedItem.objects.filter(
+        tag__name='lexis:crude',
+        content_type__in=ContentType.objects.filter(app_label='dictionary',
+                                                    model='gloss')
+        ).values_list('object_id', flat=True))
+    counts = {}
+    for (pk, kid, gloss_id, in_web) in Translation.objects.order_by(
+            'gloss__idgloss', 'index', 'pk').values_list(
+            'pk', 'translation', 'gloss', 'gloss__inWeb'):
+        # staff, the public and safe search
+        visible = (True, bool(in_web), bool(in_web) and gloss_id not in crude)
+        count = counts.setdefault(kid, [0, 0, 0])
+        ordinals = []
+        for (tier, seen) in enumerate(visible):
+            if seen:
+                count[tier] += 1
+                ordinals.append(count[tier])
+            else:
+                ordinals.append(None)
+        Translation.objects.filter(pk=pk).update(
+            staff_ordinal=ordinals[0], public_ordinal=ordinals[1],
+            safe_ordinal=ordinals[2])
+    for (kid, (staff, public, safe)) in counts.items():
+        Keyword.objects.filter(pk=kid).update(
+            translation_count=staff, inweb_count=public, safe_count=safe)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictionary', '0001_initial'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('tagging', '0003_adapt_max_tag_length'),
+    ]
+
+    operations = [
+        # the columns are added without breaking the foreign keys to their
+        # tables (see dictionary.migration_operations)
+        dictionary.migration_operations.AddField(
+            model_name='gloss',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        dictionary.migration_operations.AddField(
+            model_name='gloss',
+            name='modified',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        dictionary.migration_operations.AddField(
+            model_name='keyword',
+            name='folded',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+        ),
+        dictionary.migration_operations.AddField(
+            model_name='keyword',
+            name='stem',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+        ),
+        dictionary.migration_operations.AddField(
+            model_name='keyword',
+            name='translation_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        dictionary.migration_operations.AddField(
+            model_name='keyword',
+            name='inweb_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        dictionary.migration_operations.AddField(
+            model_name='keyword',
+            name='safe_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        dictionary.migration_operations.AddField(
+            model_name='translation',
+            name='staff_ordinal',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        dictionary.migration_operations.AddField(
+            model_name='translation',
+            name='public_ordinal',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        dictionary.migration_operations.AddField(
+            model_name='translation',
+            name='safe_ordinal',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(fold_keywords, migrations.RunPython.noop),
+        migrations.RunPython(count_translations, migrations.RunPython.noop),
+        migrations.AlterIndexTogether(
+            name='definition',
+            index_together=set([('gloss', 'role', 'count')]),
+        ),
+        dictionary.migration_operations.AlterField(
+            model_name='gloss',
+            name='idgloss',
+            field=models.CharField(db_index=True, help_text='\nThis is the unique identifying name of an entry of a sign form in the\ndatabase. No two Sign Entry Names can be exactly the same, but a "Sign\nEntry Name" can be (and often is) the same as the Annotation Idgloss.', max_length=50, verbose_name='ID Gloss'),
+        ),
+        migrations.AlterIndexTogether(
+            name='gloss',
+            index_together=set([('inWeb', 'sn')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='relation',
+            index_together=set([('source', 'role')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='translation',
+            index_together=set([('gloss', 'index'), ('translation', 'public_ordinal'), ('translation', 'safe_ordinal'), ('translation', 'staff_ordinal')]),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 13:01
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_public_glosses(apps, schema_editor):
+    # what refresh_public_glosses() and refresh_public_translations() keep
+    # up to date from now on
+    Gloss = apps.get_model('dictionary', 'Gloss')
+    Translation = apps.get_model('dictionary', 'Translation')
+    PublicGloss = apps.get_model('dictionary', 'PublicGloss')
+    PublicTranslation = apps.get_model('dictionary', 'PublicTranslation')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    TaggedItem = apps.get_model('tagging', 'TaggedItem')
+    crude = set(TaggedItem.objects.filter(
+        tag__name='lexis:crude',
+        content_type__in=ContentType.objects.filter(app_label='dictionary',
+                                                    model='gloss')
+        ).values_list('object_id', flat=True))
+    glosses = []
+    position = 0
+    for (pk, idgloss, sn) in Gloss.objects.filter(inWeb=True).order_by(
+            'sn').values_list('pk', 'idgloss', 'sn'):
+        if sn is not None:
+            position += 1
+        glosses.append(PublicGloss(gloss_id=pk, idgloss=idgloss, sn=sn,
+                                   position=position if sn is not None else None,
+                                   crude=pk in crude))
+    PublicGloss.objects.bulk_create(glosses)
+    PublicTranslation.objects.bulk_create(
+        [PublicTranslation(source_id=pk, translation_id=kid, gloss_id=gloss_id,
+                           index=index, public_ordinal=public, safe_ordinal=safe)
+         for (pk, kid, gloss_id, index, public, safe) in Translation.objects
+         .filter(gloss__inWeb=True).exclude(public_ordinal=None)
+         .values_list('pk', 'translation', 'gloss', 'index',
+                      'public_ordinal', 'safe_ordinal')])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictionary', '0002_keyword_folded_and_indexes'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('tagging', '0003_adapt_max_tag_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PublicGloss',
+            fields=[
+                ('gloss', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='public', serialize=False, to='dictionary.Gloss')),
+                ('idgloss', models.CharField(db_index=True, max_length=50)),
+                ('sn', models.IntegerField(db_index=True, null=True)),
+                ('position', models.IntegerField(db_index=True, null=True)),
+                ('crude', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PublicTranslation',
+            fields=[
+                ('source', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='public', serialize=False, to='dictionary.Translation')),
+                ('index', models.IntegerField()),
+                ('public_ordinal', models.IntegerField()),
+                ('safe_ordinal', models.IntegerField(null=True)),
+                ('gloss', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='translations', to='dictionary.PublicGloss')),
+                ('translation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='public_translations', to='dictionary.Keyword')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='publictranslation',
+            index_together=set([('translation', 'public_ordinal'), ('translation', 'safe_ordinal')]),
+        ),
+        migrations.RunPython(copy_public_glosses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 13:15
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictionary', '0003_public_projection'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MinimalPair',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=50)),
+                ('first', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='dictionary.Gloss')),
+                ('second', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='dictionary.Gloss')),
+            ],
+            options={
+                'unique_together': set([('first', 'second', 'field')]),
+            },
+        ),
+        migrations.CreateModel(
+            name='PhonologyDigest',
+            fields=[
+                ('gloss', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='dictionary.Gloss')),
+                ('digest', models.CharField(max_length=40)),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 13:33
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+import dictionary.migration_operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictionary', '0004_minimal_pairs'),
+    ]
+
+    operations = [
+        # without breaking the foreign keys of the public translations
+        dictionary.migration_operations.RemoveField(
+            model_name='publicgloss',
+            name='position',
+        ),
+    ]
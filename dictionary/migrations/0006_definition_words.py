@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 13:36
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from dictionary.definition_search import index_words
+
+
+def tokenize_definitions(apps, schema_editor):
+    # fill the column the Definition pre_save signal handler keeps up to date
+    Definition = apps.get_model('dictionary', 'Definition')
+    for definition in Definition.objects.only('id', 'text').iterator():
+        Definition.objects.filter(pk=definition.pk).update(
+            words=index_words(definition.text))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictionary', '0005_remove_publicgloss_position'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='definition',
+            name='words',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.RunPython(tokenize_definitions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,185 @@
+"""
+Finding the minimal pairs of the lexicon: the pairs of signs whose
+phonology differs in exactly one field, such as two signs with the same
+handshapes and location but different palm orientations.
+
+Comparing every sign with every other would take a time that grows with
+the square of the number of signs. Instead, for each field the signs are
+grouped by their phonology with that field left out, and the signs in a
+group that have different values of the field are minimal pairs for it.
+The fields are grouped in worker processes.
+
+The pairs are kept in the MinimalPair table, with a digest of each sign's
+phonology in PhonologyDigest. Finding them again incrementally only looks
+for the pairs of the signs whose phonology has changed since (or that are
+new), which costs one pass over the phonology of every sign rather than
+grouping them all. A field that isn't set never makes a pair, and nor do
+signs that have nothing set but the field they differ in.
+"""
+import csv
+import hashlib
+import multiprocessing
+
+from django.db import transaction
+from django.utils import six
+
+from dictionary.models import Gloss, MinimalPair, PhonologyDigest
+from dictionary.phonology import PHONOLOGY_FIELDS, UNSET, value_key
+
+
+# the number of rows written to the database at a time
+BATCH_SIZE = 500
+
+
+def gloss_forms():
+    """
+    Return a dictionary from the id of every gloss to its phonology, a
+    tuple of the value of each field or None where it isn't set
+    """
+    forms = {}
+    for row in Gloss.objects.values_list('pk', *PHONOLOGY_FIELDS).iterator():
+        values = [None if value is None else value_key(value) for value in row[1:]]
+        forms[row[0]] = tuple(None if value in UNSET else value for value in values)
+    return forms
+
+
+def form_digest(form):
+    text = u'\x1f'.join(u'' if value is None else value for value in form)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _masked(form, i):
+    return form[:i] + form[i + 1:]
+
+
+def field_pairs(task):
+    """
+    Return the minimal pairs for the field numbered 'i' among 'forms', a
+    list of (gloss id, phonology) pairs, as (lower id, higher id) pairs.
+    If 'changed' isn't None, only the pairs with a gloss in it are found.
+    """
+    (i, forms, changed) = task
+    if changed is not None:
+        wanted = set(_masked(form, i) for (pk, form) in forms
+                     if pk in changed and form[i] is not None)
+    groups = {}
+    for (pk, form) in forms:
+        if form[i] is None:
+            continue
+        key = _masked(form, i)
+        if not any(value is not None for value in key):
+            continue
+        if changed is not None and key not in wanted:
+            continue
+        groups.setdefault(key, {}).setdefault(form[i], []).append(pk)
+    pairs = []
+    for values in groups.values():
+        if len(values) < 2:
+            continue
+        values = list(values.values())
+        for (n, these) in enumerate(values):
+            for those in values[n + 1:]:
+                for a in these:
+                    for b in those:
+                        if changed is None or a in changed or b in changed:
+                            pairs.append((min(a, b), max(a, b)))
+    return pairs
+
+
+def find_pairs(forms, changed=None, processes=1):
+    """
+    Return a list of (field, first id, second id) for the minimal pairs
+    among 'forms' (see gloss_forms()), those with a gloss in 'changed' if
+    it isn't None, grouping the fields in 'processes' worker processes if
+    it is more than 1
+    """
+    forms = sorted(forms.items())
+    tasks = [(i, forms, changed) for i in range(len(PHONOLOGY_FIELDS))]
+    if processes < 2:
+        results = [field_pairs(task) for task in tasks]
+    else:
+        # the workers only group, so they never use the database
+        # connections they inherit
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(field_pairs, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    return [(field, first, second)
+            for (field, pairs) in zip(PHONOLOGY_FIELDS, results)
+            for (first, second) in pairs]
+
+
+def _save(pairs):
+    batch = []
+    count = 0
+    for (field, first, second) in pairs:
+        batch.append(MinimalPair(first_id=first, second_id=second, field=field))
+        if len(batch) == BATCH_SIZE:
+            MinimalPair.objects.bulk_create(batch)
+            count += len(batch)
+            batch = []
+    MinimalPair.objects.bulk_create(batch)
+    return count + len(batch)
+
+
+def refresh_minimal_pairs(incremental=False, processes=1):
+    """
+    Find the minimal pairs again, only those of the glosses whose
+    phonology has changed if 'incremental', and return the number of
+    glosses looked at and of pairs found for them
+    """
+    forms = gloss_forms()
+    digests = dict((pk, form_digest(form)) for (pk, form) in forms.items())
+    if incremental:
+        old = dict(PhonologyDigest.objects.values_list('gloss', 'digest'))
+        changed = set(pk for (pk, digest) in digests.items()
+                      if old.get(pk) != digest)
+    else:
+        changed = None
+    if changed is None or changed:
+        pairs = find_pairs(forms, changed, processes)
+    else:
+        pairs = []
+    with transaction.atomic():
+        if changed is None:
+            MinimalPair.objects.all().delete()
+            PhonologyDigest.objects.all().delete()
+            glosses = list(forms)
+        else:
+            glosses = sorted(changed)
+            for start in range(0, len(glosses), BATCH_SIZE):
+                batch = glosses[start:start + BATCH_SIZE]
+                MinimalPair.objects.filter(first__in=batch).delete()
+                MinimalPair.objects.filter(second__in=batch).delete()
+                PhonologyDigest.objects.filter(gloss__in=batch).delete()
+        count = _save(pairs)
+        for start in range(0, len(glosses), BATCH_SIZE):
+            PhonologyDigest.objects.bulk_create(
+                [PhonologyDigest(gloss_id=pk, digest=digests[pk])
+                 for pk in glosses[start:start + BATCH_SIZE]])
+    return (len(glosses), count)
+
+
+def minimal_pairs_csv(out, fields=PHONOLOGY_FIELDS):
+    """
+    Yield the lines of a CSV report of the minimal pairs found for
+    'fields', each written by csv.writer(out) as it is read
+    """
+    writer = csv.writer(out)
+    yield writer.writerow(['field', 'first', 'first value',
+                           'second', 'second value'])
+    for field in fields:
+        labels = dict((value_key(value), u'%s' % label) for (value, label)
+                      in Gloss._meta.get_field(field).choices)
+        for (first, a, second, b) in (MinimalPair.objects.filter(field=field)
+                                      .order_by('first__idgloss', 'second__idgloss')
+                                      .values_list('first__idgloss', 'first__' + field,
+                                                   'second__idgloss', 'second__' + field)
+                                      .iterator()):
+            row = [field, first, labels.get(value_key(a), u''),
+                   second, labels.get(value_key(b), u'')]
+            if six.PY2:
+                row = [value.encode('utf-8') for value in row]
+            yield writer.writerow(row)
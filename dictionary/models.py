@@ -2,25 +2,163 @@
 from django.http import Http404
 from django.db import models
 from django.conf import settings 
+from django.utils import timezone
+
+from django.contrib.contenttypes.models import ContentType
 
 from tagging.registry import AlreadyRegistered, register
-from tagging.models import Tag
+from tagging.models import Tag, TaggedItem
+
+from dictionary.indexes import InMemoryIndex
+
+
+# Visibility tiers for searching the dictionary: staff see every sign,
+# everyone else only sees the signs that are in the web dictionary, and
+# anonymous users under ANON_SAFE_SEARCH don't see signs tagged crude either.
+STAFF_TIER = 'staff'
+PUBLIC_TIER = 'public'
+SAFE_TIER = 'safe'
+TIERS = (STAFF_TIER, PUBLIC_TIER, SAFE_TIER)
+
+CRUDE_TAG = 'lexis:crude'
+
+
+class Viewer(object):
+    """
+    What the dictionary needs to know about the user making a request:
+    whether they are staff, logged in and under safe search, the tier
+    they see and whether they may see unpublished definitions
+    """
+    def __init__(self, user):
+        self.staff = user.has_perm('dictionary.search_gloss')
+        self.authenticated = user.is_authenticated()
+        self.safe_search = not self.authenticated and settings.ANON_SAFE_SEARCH
+        self.can_view_unpub_defs = user.has_perm('dictionary.can_view_unpub_defs')
+        if self.staff:
+            self.tier = STAFF_TIER
+        elif self.safe_search:
+            self.tier = SAFE_TIER
+        else:
+            self.tier = PUBLIC_TIER
+
+
+def viewer(request):
+    """
+    Return the Viewer of 'request', which is worked out the first time
+    it is asked for and kept on the request
+    """
+    if not hasattr(request, '_dictionary_viewer'):
+        request._dictionary_viewer = Viewer(request.user)
+    return request._dictionary_viewer
+
+
+def viewer_tier(request):
+    """Return the visibility tier of the user making 'request'"""
+    return viewer(request).tier
+
+
+class TagIds(InMemoryIndex):
+    """
+    The ids of the tags by name, so that finding what has a tag needn't
+    look the tag up. There are only ever a few tags.
+    """
+    name = 'tag_ids'
+
+    def build(self):
+        self._ids = dict(Tag.objects.values_list('name', 'id'))
+
+    def get(self, name):
+        """Return the id of the tag 'name', or None if there isn't one"""
+        self.ensure_built()
+        with self._lock:
+            return self._ids.get(name)
+
+
+tag_ids = TagIds()
+
+
+def crude_glosses():
+    """
+    Return a subquery of the ids of the glosses tagged crude, to be
+    used in a filter such as exclude(gloss__in=crude_glosses())
+    """
+    # there are none if the tag doesn't exist, and no tag_id is NULL
+    return TaggedItem.objects.filter(tag_id=tag_ids.get(CRUDE_TAG),
+        content_type=ContentType.objects.get_for_model(Gloss)
+        ).values('object_id')
+
+
+def visible_translations(tier):
+    """
+    Return the translations of the glosses that 'tier' can see. Those of
+    the public tiers come from the public copies of the translations,
+    whose 'translation' and 'gloss' are the keyword and gloss ids too.
+    """
+    if tier == STAFF_TIER:
+        return Translation.objects.all()
+    return PublicTranslation.objects.exclude(**{ORDINAL_FIELDS[tier]: None})
 
 
-class Keyword(models.Model):
+class LoadedValuesMixin(object):
+    """
+    Remember the values a model instance was loaded from the database with,
+    so that signal handlers can tell which fields a save has changed
+    """
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(LoadedValuesMixin, cls).from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super(LoadedValuesMixin, self).save(*args, **kwargs)
+        # the post_save handlers have seen the old values, now this
+        # instance matches its row again
+        self._loaded_values = dict((f.attname, getattr(self, f.attname))
+                                   for f in self._meta.concrete_fields)
+
+    def loaded_value(self, attname):
+        """
+        Return the value of 'attname' when this instance was loaded,
+        or None if the instance didn't come from the database
+        """
+        return getattr(self, '_loaded_values', {}).get(attname)
+
+    def has_changed(self, attname):
+        """Return True if 'attname' differs from its value in the database"""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None or attname not in loaded:
+            return True
+        return loaded[attname] != getattr(self, attname)
+
+
+class Keyword(LoadedValuesMixin, models.Model):
     """
     An english keyword that will be a translation of a sign
     """
     def __str__(self):
         return self.text
     text = models.CharField(max_length=100, unique=True)
+    # the case-folded text, set when the keyword is saved, so that a prefix
+    # search can be answered from an index
+    folded = models.CharField(max_length=100, db_index=True, editable=False,
+                              default='')
+    # the root of the text with its word endings taken off, worked out by
+    # dictionary.stemming when the keyword is saved
+    stem = models.CharField(max_length=100, db_index=True, editable=False,
+                            default='')
+    # the number of translations of this keyword that each tier can see,
+    # kept up to date by update_keyword_translations()
+    translation_count = models.IntegerField(default=0, editable=False)
+    inweb_count = models.IntegerField(default=0, editable=False)
+    safe_count = models.IntegerField(default=0, editable=False)
     
     def inWeb(self):
         """
         Return True if some gloss associated with this
         keyword is in the web version of the dictionary
         """
-        return len(self.translation_set.filter(gloss__inWeb__exact=True)) != 0
+        return self.inweb_count != 0
             
     class Meta:
         ordering = ['text']
@@ -35,60 +173,150 @@ class Keyword(models.Model):
         Returns a tuple (translation, count) where count is the total number
         of matches.
         """
-        if request.user.has_perm('dictionary.search_gloss'):
-            alltrans = self.translation_set.all()
-        else:
-            alltrans = self.translation_set.filter(gloss__inWeb__exact=True)     
-        # remove crude signs for non-authenticated users if ANON_SAFE_SEARCH is on
-        try:
-            crudetag = tagging.models.Tag.objects.get(name='lexis:crude')
-        except:
-            crudetag = None
-            
-        safe = (not request.user.is_authenticated()) and settings.ANON_SAFE_SEARCH
-        if safe and crudetag:
-            alltrans = [tr for tr in alltrans if not crudetag in tagging.models.Tag.objects.get_for_object(tr.gloss)]
-        
+        tier = viewer_tier(request)
+        total = getattr(self, COUNT_FIELDS[tier])
         # if there are no translations, generate a 404
-        if len(alltrans) == 0:
+        if total == 0:
             raise Http404
         # take the nth translation if n is in range
         # otherwise take the last
-        if n-1 < len(alltrans):
-            trans = alltrans[n-1]
-        else:
-            trans = alltrans[len(alltrans)-1]
-        return (trans, len(alltrans))
+        if not 0 < n <= total:
+            n = total
+        try:
+            if tier == STAFF_TIER:
+                trans = self.translation_set.select_related('gloss').get(
+                    **{ORDINAL_FIELDS[tier]: n})
+            else:
+                trans = self.public_translations.select_related(
+                    'source__gloss').get(**{ORDINAL_FIELDS[tier]: n}).source
+        except (Translation.DoesNotExist, PublicTranslation.DoesNotExist):
+            # the translations changed after this keyword was loaded
+            raise Http404
+        return (trans, total)
         
         
-class Translation(models.Model):
+class Translation(LoadedValuesMixin, models.Model):
     """
     An English translations of Auslan glosses
     """
     gloss = models.ForeignKey("Gloss")
     translation = models.ForeignKey("Keyword")
     index = models.IntegerField("Index")
+    # the position of this translation among the translations of its
+    # keyword that each tier can see, or None if the tier can't see it,
+    # kept up to date by update_keyword_translations()
+    staff_ordinal = models.IntegerField(null=True, editable=False)
+    public_ordinal = models.IntegerField(null=True, editable=False)
+    safe_ordinal = models.IntegerField(null=True, editable=False)
     
     def __str__(self):
         return str(self.gloss)+"-"+str(self.translation)
     
     def get_absolute_url(self):
         """Return a URL for a view of this translation."""
-        alltrans = self.translation.translation_set.all()
-        idx = 0
-        for tr in alltrans: 
-            if tr == self:
-                return "/dictionary/words/"+str(self.translation)+"-"+str(idx+1)+".html"
-            idx += 1
-        return "/dictionary/"
+        if self.staff_ordinal is None:
+            return "/dictionary/"
+        return "/dictionary/words/"+str(self.translation)+"-"+str(self.staff_ordinal)+".html"
         
     class Meta:
         ordering = ['gloss', 'index']
+        index_together = [['gloss', 'index'],
+                          ['translation', 'staff_ordinal'],
+                          ['translation', 'public_ordinal'],
+                          ['translation', 'safe_ordinal']]
         
     class Admin:
         list_display = ['gloss', 'translation']
         search_fields = ['gloss__idgloss']
     
+# the columns that number and count the translations of a keyword for each tier
+ORDINAL_FIELDS = {STAFF_TIER: 'staff_ordinal',
+                  PUBLIC_TIER: 'public_ordinal',
+                  SAFE_TIER: 'safe_ordinal'}
+COUNT_FIELDS = {STAFF_TIER: 'translation_count',
+                PUBLIC_TIER: 'inweb_count',
+                SAFE_TIER: 'safe_count'}
+
+
+# the most objects in one bulk UPDATE, to stay under the number of
+# parameters a query may have
+UPDATE_BATCH_SIZE = 100
+
+
+def bulk_update(objects, fields):
+    """
+    Save 'fields' of each of 'objects', all of one model, with an UPDATE
+    per batch of objects. It sends no signals.
+    """
+    objects = list(objects)
+    for start in range(0, len(objects), UPDATE_BATCH_SIZE):
+        batch = objects[start:start + UPDATE_BATCH_SIZE]
+        model = type(batch[0])
+        values = {}
+        for name in fields:
+            field = model._meta.get_field(name)
+            values[name] = models.Case(
+                *[models.When(pk=obj.pk, then=models.Value(getattr(obj, name)))
+                  for obj in batch], output_field=field)
+        model.objects.filter(pk__in=[obj.pk for obj in batch]).update(**values)
+
+
+def update_keyword_translations(keyword_ids=None):
+    """
+    Renumber and recount the translations of the given keywords for every
+    tier, or those of every keyword if 'keyword_ids' is None. The
+    translations of a keyword are numbered in gloss order, and only the
+    rows whose numbers or counts change are written, a batch at a time.
+    """
+    keywords = Keyword.objects.all()
+    if keyword_ids is not None:
+        keywords = keywords.filter(pk__in=keyword_ids)
+    count_fields = [COUNT_FIELDS[tier] for tier in TIERS]
+    old_counts = dict((row[0], row[1:]) for row in
+                      keywords.values_list('id', *count_fields))
+    counts = dict((kid, dict((tier, 0) for tier in COUNT_FIELDS))
+                  for kid in old_counts)
+    translations = (Translation.objects.filter(translation__in=keywords)
+                    .order_by('gloss__idgloss', 'index', 'pk'))
+    crude = set(crude_glosses().filter(
+        object_id__in=translations.values('gloss')
+        ).values_list('object_id', flat=True))
+    ordinal_fields = [ORDINAL_FIELDS[tier] for tier in TIERS]
+    renumbered = []
+    for row in translations.values_list('pk', 'translation', 'gloss',
+                                        'gloss__inWeb', *ordinal_fields):
+        (pk, kid, gloss_id, in_web) = row[:4]
+        visible = {STAFF_TIER: True,
+                   PUBLIC_TIER: bool(in_web),
+                   SAFE_TIER: bool(in_web) and gloss_id not in crude}
+        ordinals = []
+        for tier in TIERS:
+            if visible[tier]:
+                counts[kid][tier] += 1
+                ordinals.append(counts[kid][tier])
+            else:
+                ordinals.append(None)
+        if tuple(ordinals) != row[4:]:
+            renumbered.append(Translation(
+                pk=pk, **dict(zip(ordinal_fields, ordinals))))
+    bulk_update(renumbered, ordinal_fields)
+    bulk_update([Keyword(pk=kid, **dict((COUNT_FIELDS[tier], count[tier])
+                                        for tier in TIERS))
+                 for (kid, count) in counts.items()
+                 if tuple(count[tier] for tier in TIERS) != old_counts[kid]],
+                count_fields)
+    refresh_public_translations(None if keyword_ids is None else list(counts))
+
+
+def bump_revisions(gloss_ids):
+    """
+    Give the glosses with these ids a new revision, so that cached
+    copies of their entries are no longer used
+    """
+    Gloss.objects.filter(pk__in=gloss_ids).update(
+        revision=models.F('revision') + 1, modified=timezone.now())
+
+
 defn_role_choices = settings.DEFINITION_ROLE_CHOICES 
 class Definition(models.Model):
     """An English text associated with an Auslan glosses"""
@@ -101,9 +329,14 @@ class Definition(models.Model):
     role = models.CharField(max_length=20, choices=defn_role_choices)  
     count = models.IntegerField()
     published = models.BooleanField(default=True)
+    # the roots of the words of the text, separated by spaces, set when the
+    # definition is saved, which the definition search indexes (see
+    # dictionary.definition_search)
+    words = models.TextField(editable=False, default='')
 
     class Meta:
         ordering = ['gloss', 'role', 'count']
+        index_together = [['gloss', 'role', 'count']]
         
     class Admin:
         list_display = ['gloss', 'role', 'count', 'text']
@@ -257,7 +490,7 @@ relOrientationChoices = (
                     ('0', 'N/A'),  
                         )
     
-class Gloss(models.Model):
+class Gloss(LoadedValuesMixin, models.Model):
     class Meta:
         verbose_name_plural = "Glosses"
         ordering = ['idgloss']
@@ -270,6 +503,9 @@ class Gloss(models.Model):
                        ('view_advanced_properties', 'Include all properties in sign detail view'),
                        ('can_view_unpub_defs', 'Can view unpublished defs'),
                         )
+        # the previous/next sign links of the web dictionary look signs up
+        # by inWeb and sn
+        index_together = [['inWeb', 'sn']]
 
     def __str__(self):
         return "%s-%s" % (self.sn, self.idgloss)
@@ -286,7 +522,8 @@ class Gloss(models.Model):
                 pass
         return d
 
-    idgloss = models.CharField("ID Gloss", max_length=50, help_text="""
+    # the gloss page looks signs up by idgloss
+    idgloss = models.CharField("ID Gloss", max_length=50, db_index=True, help_text="""
 This is the unique identifying name of an entry of a sign form in the
 database. No two Sign Entry Names can be exactly the same, but a "Sign
 Entry Name" can be (and often is) the same as the Annotation Idgloss.""")    
@@ -348,15 +585,17 @@ minor or insignificant ways that can be ignored.""")
     sense = models.IntegerField("Sense Number", null=True, blank=True, help_text="If there is more than one sense of a sign enter a number here, all signs with sense>1 will use the same video as sense=1") 
     sense.list_filter_sense = True      
     StemSN = models.IntegerField(null=True, blank=True) 
+    # bumped by bump_revisions() whenever something shown on the entry
+    # page of this gloss changes, so cached copies of it can be told apart
+    revision = models.PositiveIntegerField(default=0, editable=False)
+    # when the revision was last bumped, for Last-Modified headers
+    modified = models.DateTimeField(null=True, editable=False)
    
     def navigation(self, is_staff):
         """Return a gloss navigation structure that can be used to
         generate next/previous links from within a template page"""
-    
-        result = dict() 
-        result['next'] = self.next_dictionary_gloss(is_staff)
-        result['prev'] = self.prev_dictionary_gloss(is_staff)
-        return result
+        from dictionary.positions import gloss_positions
+        return gloss_positions.neighbours(self, is_staff)
         
     def next_dictionary_gloss(self, staff=False):
         """Find the next gloss in dictionary order"""
@@ -365,11 +604,8 @@ minor or insignificant ways that can be ignored.""")
         elif staff:
             set =  Gloss.objects.filter(sn__gt=self.sn).order_by('sn')
         else:
-            set = Gloss.objects.filter(sn__gt=self.sn, inWeb__exact=True).order_by('sn')
-        if set:
-            return set[0]
-        else:
-            return None
+            set = Gloss.objects.filter(public__sn__gt=self.sn).order_by('public__sn')
+        return set.first()
  
     def prev_dictionary_gloss(self, staff=False):
         """Find the previous gloss in dictionary order"""
@@ -378,17 +614,14 @@ minor or insignificant ways that can be ignored.""")
         elif staff:
             set = Gloss.objects.filter(sn__lt=self.sn).order_by('-sn')
         else:
-            set = Gloss.objects.filter(sn__lt=self.sn, inWeb__exact=True).order_by('-sn')
-        if set:
-            return set[0]
-        else:
-            return None     
+            set = Gloss.objects.filter(public__sn__lt=self.sn).order_by('-public__sn')
+        return set.first()
             
     def definitions(self):
         """gather together the definitions for this gloss"""
         defs = dict()
         for d in self.definition_set.all().order_by('count'):
-            if not defs.has_key(d.role):
+            if d.role not in defs:
                 defs[d.role] = []
             defs[d.role].append(d.text)
         return defs            
@@ -421,3 +654,105 @@ class Relation(models.Model):
         
     class Meta:
         ordering = ['source']
+        index_together = [['source', 'role']]
+
+
+class PublicGloss(models.Model):
+    """
+    A copy of what the public dictionary shows of a gloss that is in the
+    web dictionary, so that the pages everyone but staff see needn't find
+    the published glosses among all of them. There is a row for each
+    gloss whose inWeb is True, kept up to date by refresh_public_glosses().
+    """
+    gloss = models.OneToOneField(Gloss, primary_key=True, related_name='public')
+    idgloss = models.CharField(max_length=50, db_index=True)
+    sn = models.IntegerField(null=True, db_index=True)
+    # tagged crude, so hidden from safe search
+    crude = models.BooleanField(default=False)
+
+    def __str__(self):
+        return self.idgloss
+
+
+class PublicTranslation(models.Model):
+    """
+    A copy of a translation of a public gloss, with its numbers among the
+    translations of its keyword that the public tiers can see, kept up to
+    date by refresh_public_translations()
+    """
+    source = models.OneToOneField(Translation, primary_key=True,
+                                  related_name='public')
+    # named like the columns of Translation, which this stands in for
+    translation = models.ForeignKey(Keyword, related_name='public_translations')
+    gloss = models.ForeignKey(PublicGloss, related_name='translations')
+    index = models.IntegerField()
+    public_ordinal = models.IntegerField()
+    safe_ordinal = models.IntegerField(null=True)
+
+    class Meta:
+        index_together = [['translation', 'public_ordinal'],
+                          ['translation', 'safe_ordinal']]
+
+
+def _copy_public_translations(translations):
+    PublicTranslation.objects.bulk_create(
+        [PublicTranslation(source_id=pk, translation_id=kid, gloss_id=gloss_id,
+                           index=index, public_ordinal=public, safe_ordinal=safe)
+         for (pk, kid, gloss_id, index, public, safe) in translations.exclude(
+             public_ordinal=None).values_list('pk', 'translation', 'gloss', 'index',
+                                              'public_ordinal', 'safe_ordinal')])
+
+
+def refresh_public_translations(keyword_ids=None):
+    """
+    Copy the translations of public glosses of the given keywords, or of
+    every keyword if 'keyword_ids' is None, into PublicTranslation
+    """
+    public = PublicTranslation.objects.all()
+    translations = Translation.objects.filter(gloss__public__isnull=False)
+    if keyword_ids is not None:
+        public = public.filter(translation__in=keyword_ids)
+        translations = translations.filter(translation__in=keyword_ids)
+    public.delete()
+    _copy_public_translations(translations)
+
+
+def refresh_public_glosses(gloss_ids):
+    """
+    Bring the public copies of the glosses with these ids, and of their
+    translations, up to date with them
+    """
+    gloss_ids = set(gloss_ids)
+    crude = set(crude_glosses().filter(object_id__in=gloss_ids)
+                .values_list('object_id', flat=True))
+    new = [PublicGloss(gloss_id=pk, idgloss=idgloss, sn=sn, crude=pk in crude)
+           for (pk, idgloss, sn) in Gloss.objects.filter(
+               pk__in=gloss_ids, inWeb=True).values_list('pk', 'idgloss', 'sn')]
+    PublicTranslation.objects.filter(gloss__in=gloss_ids).delete()
+    PublicGloss.objects.filter(gloss__in=gloss_ids).delete()
+    PublicGloss.objects.bulk_create(new)
+    _copy_public_translations(Translation.objects.filter(
+        gloss__in=[gloss.gloss_id for gloss in new]))
+
+
+class MinimalPair(models.Model):
+    """
+    Two glosses whose phonology differs only in 'field', as found by
+    dictionary.minimal_pairs; 'first' is the one with the lower id
+    """
+    first = models.ForeignKey(Gloss, related_name='+')
+    second = models.ForeignKey(Gloss, related_name='+')
+    field = models.CharField(max_length=50)
+
+    class Meta:
+        unique_together = [['first', 'second', 'field']]
+
+
+class PhonologyDigest(models.Model):
+    """
+    A digest of the phonology of a gloss when its minimal pairs were last
+    found, so that finding them again need only look at the glosses whose
+    phonology has changed since
+    """
+    gloss = models.OneToOneField(Gloss, primary_key=True, related_name='+')
+    digest = models.CharField(max_length=40)
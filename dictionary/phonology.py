@@ -0,0 +1,190 @@
+"""
+Finding signs by their form: their handshapes, locations and orientations.
+
+The phonology fields of a gloss each take one of a few values from a fixed
+table of choices, so the index keeps a bitmap for every value of every
+field, with a bit for each gloss set if the gloss has that value. Each
+gloss is given a slot, its bit, when the index is loaded. A search for any
+of some values of a field is the OR of their bitmaps, and a search
+combining fields is the AND (or OR) of those, so it costs a few bitwise
+operations on Python integers however many signs there are. Bitmaps of
+the glosses in the web dictionary and of those tagged crude limit the
+result to the signs the searcher's tier can see.
+"""
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from tagging.models import TaggedItem
+
+from dictionary.indexes import InMemoryIndex
+from dictionary.models import (Gloss, CRUDE_TAG, STAFF_TIER, SAFE_TIER,
+    crude_glosses, tag_ids)
+
+
+PHONOLOGY_FIELDS = ['domhndsh', 'subhndsh', 'final_domhndsh', 'final_subhndsh',
+                    'locprim', 'final_loc', 'locsecond',
+                    'initial_secondary_loc', 'final_secondary_loc',
+                    'initial_palm_orientation', 'final_palm_orientation',
+                    'initial_relative_orientation', 'final_relative_orientation']
+
+# what else the index needs to know about a gloss
+GLOSS_FIELDS = ['sn', 'idgloss', 'inWeb']
+
+# the choices that say a field hasn't been set, as value_key() gives them
+UNSET = ('notset', '-1')
+
+
+def value_key(value):
+    """Return the key of the bitmap of a field value, as a form gives it"""
+    return u'%s' % value
+
+
+def bits(bitmap):
+    """Return the numbers of the bits set in 'bitmap', lowest first"""
+    return [slot for (slot, bit) in enumerate(reversed(bin(bitmap)[2:]))
+            if bit == '1']
+
+
+class PhonologyIndex(InMemoryIndex):
+    """
+    For each phonology field, a bitmap for each of its values, and the
+    bitmaps of the glosses in the web dictionary and tagged crude, with
+    the slot of each gloss and what a list of results shows of it.
+    """
+    name = 'phonology'
+
+    def build(self):
+        self._slots = {}
+        self._glosses = {}
+        self._free = []
+        self._bitmaps = dict((field, {}) for field in PHONOLOGY_FIELDS)
+        self._values = {}
+        self._in_web = 0
+        self._crude = 0
+        self._all = 0
+        crude = set(crude_glosses().values_list('object_id', flat=True))
+        for row in Gloss.objects.order_by('sn', 'pk').values_list(
+                'pk', *(GLOSS_FIELDS + PHONOLOGY_FIELDS)):
+            self._put(row[0], dict(zip(GLOSS_FIELDS + PHONOLOGY_FIELDS, row[1:])),
+                      row[0] in crude)
+
+    def _drop(self, pk):
+        if pk not in self._slots:
+            return
+        slot = self._slots.pop(pk)
+        del self._glosses[slot]
+        mask = ~(1 << slot)
+        for (field, value) in self._values.pop(slot).items():
+            bitmaps = self._bitmaps[field]
+            bitmaps[value] &= mask
+            if not bitmaps[value]:
+                del bitmaps[value]
+        self._in_web &= mask
+        self._crude &= mask
+        self._all &= mask
+        self._free.append(slot)
+
+    def _put(self, pk, values, crude):
+        self._drop(pk)
+        slot = self._free.pop() if self._free else len(self._slots)
+        bit = 1 << slot
+        self._slots[pk] = slot
+        self._glosses[slot] = (values['sn'], values['idgloss'], pk)
+        self._values[slot] = {}
+        for field in PHONOLOGY_FIELDS:
+            if values[field] is not None:
+                key = value_key(values[field])
+                self._values[slot][field] = key
+                bitmaps = self._bitmaps[field]
+                bitmaps[key] = bitmaps.get(key, 0) | bit
+        if values['inWeb']:
+            self._in_web |= bit
+        if crude:
+            self._crude |= bit
+        self._all |= bit
+
+    def _set_crude(self, pk, crude):
+        if pk in self._slots:
+            bit = 1 << self._slots[pk]
+            self._crude = self._crude | bit if crude else self._crude & ~bit
+
+    def gloss_saved(self, gloss):
+        """Index a gloss again with the values it has now"""
+        values = dict((field, getattr(gloss, field))
+                      for field in GLOSS_FIELDS + PHONOLOGY_FIELDS)
+        crude = crude_glosses().filter(object_id=gloss.pk).exists()
+        self.update(self._put, gloss.pk, values, crude)
+
+    def gloss_deleted(self, pk):
+        self.update(self._drop, pk)
+
+    def crude_changed(self, pk):
+        """Look up again whether a gloss is tagged crude"""
+        crude = crude_glosses().filter(object_id=pk).exists()
+        self.update(self._set_crude, pk, crude)
+
+    def _visible(self, tier):
+        if tier == STAFF_TIER:
+            return self._all
+        if tier == SAFE_TIER:
+            return self._in_web & ~self._crude
+        return self._in_web
+
+    def search(self, criteria, tier, match_all=True):
+        """
+        Return the ids of the glosses 'tier' can see that have one of the
+        values listed for a field in the dictionary 'criteria' (from field
+        names to lists of values), for every field listed if 'match_all'
+        and for any of them otherwise, in sign number order with the
+        glosses without one last. A search with no values finds nothing.
+        """
+        criteria = [(field, values) for (field, values) in criteria.items()
+                    if values]
+        if not criteria:
+            return []
+        self.ensure_built()
+        with self._lock:
+            found = None
+            for (field, values) in criteria:
+                bitmaps = self._bitmaps[field]
+                matched = 0
+                for value in values:
+                    matched |= bitmaps.get(value_key(value), 0)
+                if found is None:
+                    found = matched
+                elif match_all:
+                    found &= matched
+                else:
+                    found |= matched
+            glosses = [self._glosses[slot]
+                       for slot in bits(found & self._visible(tier))]
+        glosses.sort(key=lambda gloss: (gloss[0] is None, gloss[0], gloss[1], gloss[2]))
+        return [pk for (sn, idgloss, pk) in glosses]
+
+
+phonology_index = PhonologyIndex()
+
+
+@receiver(post_save, sender=Gloss)
+def gloss_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        phonology_index.invalidate()
+    elif any(instance.has_changed(field)
+             for field in GLOSS_FIELDS + PHONOLOGY_FIELDS):
+        phonology_index.gloss_saved(instance)
+
+
+@receiver(post_delete, sender=Gloss)
+def gloss_deleted(sender, instance, **kwargs):
+    phonology_index.gloss_deleted(instance.pk)
+
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def gloss_tagged(sender, instance, raw=False, **kwargs):
+    if raw:
+        phonology_index.invalidate()
+    elif (instance.content_type_id == ContentType.objects.get_for_model(Gloss).pk
+          and instance.tag_id == tag_ids.get(CRUDE_TAG)):
+        phonology_index.crude_changed(instance.object_id)
@@ -0,0 +1,126 @@
+"""
+The order of the signs in the dictionary, for "Sign X of Y" and the
+previous/next links on an entry page.
+
+Every entry page used to count the glosses before it and query for its
+neighbours. This index keeps the sign numbers of the glosses each tier can
+see in a sorted list, so a position or a neighbour is found with a bisect.
+"""
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from dictionary.indexes import InMemoryIndex
+from dictionary.models import Gloss, STAFF_TIER, PUBLIC_TIER
+
+
+# what a page needs to know to link to a neighbouring sign
+SignRef = namedtuple('SignRef', ['sn', 'pk', 'idgloss'])
+
+
+def position_tier(staff):
+    return STAFF_TIER if staff else PUBLIC_TIER
+
+
+class GlossPositions(InMemoryIndex):
+    """
+    For each tier, the glosses it can see that have a sign number as a
+    list of SignRefs sorted by sign number, and the number of glosses it
+    can see with or without a sign number.
+    """
+    name = 'positions'
+
+    def build(self):
+        self._glosses = {}
+        self._entries = {STAFF_TIER: [], PUBLIC_TIER: []}
+        self._counts = {STAFF_TIER: 0, PUBLIC_TIER: 0}
+        for (pk, sn, idgloss, in_web) in Gloss.objects.values_list(
+                'pk', 'sn', 'idgloss', 'inWeb'):
+            self._put(pk, sn, idgloss, in_web, sort=False)
+        for entries in self._entries.values():
+            entries.sort()
+
+    def _tiers(self, in_web):
+        return [STAFF_TIER, PUBLIC_TIER] if in_web else [STAFF_TIER]
+
+    def _drop(self, pk):
+        if pk not in self._glosses:
+            return
+        (sn, idgloss, in_web) = self._glosses.pop(pk)
+        for tier in self._tiers(in_web):
+            self._counts[tier] -= 1
+            if sn is not None:
+                entries = self._entries[tier]
+                i = bisect_left(entries, SignRef(sn, pk, idgloss))
+                del entries[i]
+
+    def _put(self, pk, sn, idgloss, in_web, sort=True):
+        self._drop(pk)
+        in_web = bool(in_web)
+        self._glosses[pk] = (sn, idgloss, in_web)
+        for tier in self._tiers(in_web):
+            self._counts[tier] += 1
+            if sn is not None:
+                if sort:
+                    insort(self._entries[tier], SignRef(sn, pk, idgloss))
+                else:
+                    self._entries[tier].append(SignRef(sn, pk, idgloss))
+
+    def gloss_saved(self, gloss):
+        """Move a gloss to where it now belongs"""
+        self.update(self._put, gloss.pk, gloss.sn, gloss.idgloss, gloss.inWeb)
+
+    def gloss_deleted(self, pk):
+        self.update(self._drop, pk)
+
+    def position(self, gloss, staff):
+        """
+        Return a tuple (position, count) giving the position of 'gloss'
+        among the glosses the tier can see, and their number
+        """
+        if gloss.sn is None:
+            return (0, 0)
+        self.ensure_built()
+        tier = position_tier(staff)
+        with self._lock:
+            position = bisect_left(self._entries[tier], (gloss.sn,)) + 1
+            return (position, self._counts[tier])
+
+    def neighbours(self, gloss, staff):
+        """
+        Return a dictionary with the SignRefs of the previous and next
+        signs to 'gloss' that the tier can see, or None where there isn't one
+        """
+        result = {'prev': None, 'next': None}
+        if gloss.sn is None:
+            return result
+        self.ensure_built()
+        with self._lock:
+            entries = self._entries[position_tier(staff)]
+            # sign numbers are unique integers
+            before = bisect_left(entries, (gloss.sn,))
+            after = bisect_left(entries, (gloss.sn + 1,))
+            if before > 0:
+                result['prev'] = entries[before-1]
+            if after < len(entries):
+                result['next'] = entries[after]
+        return result
+
+
+gloss_positions = GlossPositions()
+
+
+@receiver(post_save, sender=Gloss)
+def gloss_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        gloss_positions.invalidate()
+    elif (instance.has_changed('sn') or instance.has_changed('inWeb')
+          or instance.has_changed('idgloss')):
+        gloss_positions.gloss_saved(instance)
+
+
+@receiver(post_delete, sender=Gloss)
+def gloss_deleted(sender, instance, **kwargs):
+    gloss_positions.gloss_deleted(instance.pk)
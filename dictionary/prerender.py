@@ -0,0 +1,251 @@
+"""
+Rendering the pages an anonymous visitor sees to static HTML files, so that
+a web server can send them without asking Django.
+
+Every public word page, gloss page and the search page for each letter from
+A to Z (with every page of its results) is rendered by its own view, as an
+anonymous visitor would see it, and written under a directory laid out like
+the site's URLs: the page at /words/jet-1/ to words/jet-1/index.html and
+the page at /search/?query=J&page=2 to search/query=J&page=2.html. Other
+searches, and the "Next" links of a search that pages by keyword, are left
+to Django.
+
+A state file in the directory records which glosses each page shows (by
+their surrogate keys, see conditional.py) and the revision of every gloss.
+An incremental run renders only the pages showing a gloss whose revision
+has changed since, and the pages that are new or show different glosses,
+and removes the files of pages that have gone. Anything that moves the
+signs around (publishing a sign, giving it a new sign number or idgloss)
+changes the "Sign X of Y" and the previous/next links of other pages, so
+it makes an incremental run render every page.
+"""
+import errno
+import json
+import multiprocessing
+import os
+import string
+import tempfile
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.urlresolvers import resolve, reverse
+from django.db import connections
+from django.http import Http404
+from django.test import RequestFactory
+from django.utils.http import urlunquote
+
+from dictionary.models import (PublicGloss, ORDINAL_FIELDS, SAFE_TIER,
+    viewer_tier, visible_translations)
+from dictionary.conditional import digest, gloss_key
+from dictionary.views import find_keywords, keyword_glosses
+
+
+STATE_FILE = '.prerender.json'
+
+# the number of keywords on a page of search results
+SEARCH_PAGE_SIZE = 50
+
+# the number of pages a worker process is given at a time
+CHUNK_SIZE = 50
+
+
+def anonymous_request(url):
+    """Return a GET request for 'url' from a visitor who isn't logged in"""
+    request = RequestFactory().get(url)
+    request.user = AnonymousUser()
+    return request
+
+
+def _keys(gloss_ids):
+    return [gloss_key(gloss_id) for gloss_id in sorted(set(gloss_ids))]
+
+
+def site_pages(tier):
+    """
+    Return a dictionary from the URL of every page 'tier' can see to the
+    surrogate keys of the glosses it shows, and for a search page a key
+    for the list of keywords it shows as well
+    """
+    pages = {}
+    idglosses = {}
+    for (pk, idgloss) in PublicGloss.objects.values_list('gloss', 'idgloss'):
+        idglosses.setdefault(idgloss, []).append(pk)
+    for (idgloss, pks) in idglosses.items():
+        # the page of an idgloss that more than one gloss has is a 404
+        if len(pks) == 1:
+            pages[reverse('dictionary:gloss', args=[idgloss])] = _keys(pks)
+    # a word page shows how many signs its keyword has, so it depends on
+    # all of them
+    words = {}
+    for (text, n, gloss_id) in visible_translations(tier).values_list(
+            'translation__text', ORDINAL_FIELDS[tier], 'gloss'):
+        if n is not None:
+            words.setdefault(text, []).append((n, gloss_id))
+    for (text, translations) in words.items():
+        keys = _keys(gloss_id for (n, gloss_id) in translations)
+        for (n, gloss_id) in translations:
+            pages[reverse('dictionary:word', args=[text, n])] = keys
+    url = reverse('dictionary:search')
+    for letter in string.ascii_uppercase:
+        found = find_keywords(letter, tier)
+        ids = [word.pk for word in found]
+        keys = ['keywords-%s' % digest(*ids)] + _keys(keyword_glosses(found, tier))
+        npages = max(1, (len(ids) + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE)
+        pages['%s?query=%s' % (url, letter)] = keys
+        for page in range(2, npages + 1):
+            pages['%s?query=%s&page=%d' % (url, letter, page)] = keys
+    return pages
+
+
+def site_layout(tier):
+    """
+    Return a digest of the order, sign numbers and idglosses of the public
+    signs, and of the signs 'tier' can't see, which every page depends on
+    """
+    signs = list(PublicGloss.objects.order_by('sn', 'gloss')
+                 .values_list('sn', 'gloss', 'idgloss'))
+    if tier == SAFE_TIER:
+        hidden = list(PublicGloss.objects.filter(crude=True).order_by('gloss')
+                      .values_list('gloss', flat=True))
+    else:
+        hidden = []
+    return digest(tier, signs, hidden)
+
+
+def page_file(root, url):
+    """
+    Return the name of the file the page at 'url' is written to, or None
+    if it would be outside 'root'
+    """
+    (path, _, query) = url.partition('?')
+    root = os.path.abspath(root)
+    name = os.path.normpath(os.path.join(root, urlunquote(path).lstrip('/'),
+                                         (query or 'index') + '.html'))
+    if not name.startswith(os.path.join(root, '')):
+        return None
+    return name
+
+
+def render_page(url):
+    """
+    Return the HTML of the page at 'url' as an anonymous visitor sees it,
+    or None if there is no such page
+    """
+    request = anonymous_request(url)
+    match = resolve(request.path_info)
+    try:
+        response = match.func(request, *match.args, **match.kwargs)
+    except Http404:
+        return None
+    if response.status_code != 200:
+        # a search that redirects to the one keyword it finds
+        return None
+    return response.content
+
+
+def write_file(name, content):
+    """Replace the file 'name' with 'content', so it is never seen half written"""
+    directory = os.path.dirname(name)
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    (fd, temporary) = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    # mkstemp makes a file only its owner can read
+    os.chmod(temporary, 0o644)
+    os.rename(temporary, name)
+
+
+def remove_file(name):
+    try:
+        os.remove(name)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def _render_pages(task):
+    """Render some pages into 'root'; return the URLs of those there were"""
+    (root, urls) = task
+    rendered = []
+    for url in urls:
+        name = page_file(root, url)
+        content = render_page(url) if name else None
+        if content is None:
+            if name:
+                remove_file(name)
+        else:
+            write_file(name, content)
+            rendered.append(url)
+    return rendered
+
+
+def render_pages(root, urls, processes=1):
+    """
+    Render the pages at 'urls' into 'root', in 'processes' worker
+    processes if it is more than 1, and return the URLs of those there were
+    """
+    tasks = [(root, urls[start:start + CHUNK_SIZE])
+             for start in range(0, len(urls), CHUNK_SIZE)]
+    if processes < 2 or len(tasks) < 2:
+        return [url for task in tasks for url in _render_pages(task)]
+    # the workers can't share the database connections they would inherit,
+    # so they each open their own
+    connections.close_all()
+    pool = multiprocessing.Pool(processes)
+    try:
+        return [url for rendered in pool.imap_unordered(_render_pages, tasks)
+                for url in rendered]
+    finally:
+        pool.close()
+        pool.join()
+
+
+def read_state(root):
+    """Return the state the last run left in 'root', or None"""
+    try:
+        with open(os.path.join(root, STATE_FILE)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def write_state(root, state):
+    write_file(os.path.join(root, STATE_FILE),
+               json.dumps(state, sort_keys=True).encode('utf-8'))
+
+
+def prerender(root, processes=1, incremental=False):
+    """
+    Render the public pages into the directory 'root', only those that
+    have changed since the last run if 'incremental', and remove the ones
+    that have gone. Return the numbers of pages rendered and removed.
+    """
+    tier = viewer_tier(anonymous_request('/'))
+    pages = site_pages(tier)
+    layout = site_layout(tier)
+    revisions = dict((str(pk), revision) for (pk, revision) in
+                     PublicGloss.objects.values_list('gloss', 'gloss__revision'))
+    state = read_state(root) or {'layout': None, 'revisions': {}, 'pages': {}}
+    if incremental and state['layout'] == layout:
+        changed = set(gloss_key(int(pk)) for (pk, revision) in revisions.items()
+                      if state['revisions'].get(pk) != revision)
+        urls = sorted(url for (url, keys) in pages.items()
+                      if state['pages'].get(url) != keys or changed.intersection(keys))
+    else:
+        urls = sorted(pages)
+    gone = [url for url in state['pages'] if url not in pages]
+    for url in gone:
+        name = page_file(root, url)
+        if name:
+            remove_file(name)
+    rendered = set(render_pages(root, urls, processes))
+    # a page that wasn't there is tried again next time
+    missing = set(urls) - rendered
+    write_state(root, {'layout': layout,
+                       'revisions': revisions,
+                       'pages': dict((url, keys) for (url, keys) in pages.items()
+                                     if url not in missing)})
+    return (len(rendered), len(gone))
@@ -0,0 +1,262 @@
+"""
+The graph of the relations between signs: their variants, synonyms,
+antonyms, homophones and the signs to see also.
+
+The index keeps, for each gloss and role, the glosses it is related to in
+either direction, with the idgloss of every gloss and whether each tier can
+see it, so the related signs an entry page shows, however many hops away,
+are found without going to the database. The RELATION_HOPS setting says
+how many hops away the entry pages look for each role; the variants of a
+sign are followed as far as they go, so a page shows its whole cluster of
+variants. A tier's search for related signs doesn't go through signs it
+can't see.
+
+A related sign's name and visibility are part of an entry page, so a
+change to a relation, or to the idgloss, publication or crude tag of a
+sign, gives a new revision to the entries that show it (see signals.py
+and entry_cache.py).
+"""
+from collections import namedtuple, deque
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from tagging.models import TaggedItem
+
+from dictionary.indexes import InMemoryIndex
+from dictionary.models import (Gloss, Relation, RELATION_ROLE_CHOICES,
+    CRUDE_TAG, STAFF_TIER, SAFE_TIER, crude_glosses, tag_ids, bump_revisions)
+from dictionary.conditional import glosses_changed
+
+
+# how many hops away the entry pages look for each role, None for as far
+# as the relations go
+DEFAULT_HOPS = {'variant': None, 'synonym': 1, 'antonym': 1, 'seealso': 1,
+                'homophone': 1}
+
+# what a page needs to know to link to a related sign
+RelatedSign = namedtuple('RelatedSign', ['pk', 'idgloss', 'hops'])
+
+
+def entry_hops():
+    """Return how far the entry pages look for each role"""
+    hops = dict(DEFAULT_HOPS)
+    hops.update(getattr(settings, 'RELATION_HOPS', {}))
+    return hops
+
+
+class RelationGraph(InMemoryIndex):
+    """
+    For each gloss, a dictionary from each role to the glosses it is
+    related to in either direction, with the number of relations between
+    them; the source, target and role of each relation; and the idgloss,
+    publication and crude tag of every gloss.
+    """
+    name = 'relations'
+
+    def build(self):
+        self._edges = {}
+        self._relations = {}
+        self._glosses = {}
+        crude = set(crude_glosses().values_list('object_id', flat=True))
+        for (pk, idgloss, in_web) in Gloss.objects.values_list(
+                'pk', 'idgloss', 'inWeb'):
+            self._glosses[pk] = (idgloss, bool(in_web), pk in crude)
+        for (pk, source, target, role) in Relation.objects.values_list(
+                'pk', 'source', 'target', 'role'):
+            self._add(pk, source, target, role)
+
+    def _link(self, a, b, role, count):
+        neighbours = self._edges.setdefault(a, {}).setdefault(role, {})
+        neighbours[b] = neighbours.get(b, 0) + count
+        if not neighbours[b]:
+            del neighbours[b]
+
+    def _add(self, pk, source, target, role):
+        self._remove(pk)
+        self._relations[pk] = (source, target, role)
+        self._link(source, target, role, 1)
+        if target != source:
+            self._link(target, source, role, 1)
+
+    def _remove(self, pk):
+        if pk not in self._relations:
+            return
+        (source, target, role) = self._relations.pop(pk)
+        self._link(source, target, role, -1)
+        if target != source:
+            self._link(target, source, role, -1)
+
+    def _put_gloss(self, pk, idgloss, in_web, crude):
+        self._glosses[pk] = (idgloss, bool(in_web), crude)
+
+    def _set_crude(self, pk, crude):
+        if pk in self._glosses:
+            (idgloss, in_web, old) = self._glosses[pk]
+            self._glosses[pk] = (idgloss, in_web, crude)
+
+    def _drop_gloss(self, pk):
+        # its relations go with it, and are removed one by one
+        self._glosses.pop(pk, None)
+
+    def relation_saved(self, relation):
+        self.update(self._add, relation.pk, relation.source_id,
+                    relation.target_id, relation.role)
+
+    def ends(self, pk):
+        """
+        Return the source and target ids of the relation 'pk' as this
+        process last saw them, or an empty list if it doesn't know
+        """
+        with self._lock:
+            if self._built and pk in self._relations:
+                return list(self._relations[pk][:2])
+        return []
+
+    def relation_deleted(self, pk):
+        self.update(self._remove, pk)
+
+    def gloss_saved(self, gloss):
+        crude = crude_glosses().filter(object_id=gloss.pk).exists()
+        self.update(self._put_gloss, gloss.pk, gloss.idgloss, gloss.inWeb, crude)
+
+    def gloss_deleted(self, pk):
+        self.update(self._drop_gloss, pk)
+
+    def crude_changed(self, pk):
+        """Look up again whether a gloss is tagged crude"""
+        crude = crude_glosses().filter(object_id=pk).exists()
+        self.update(self._set_crude, pk, crude)
+
+    def _visible(self, pk, tier):
+        if pk not in self._glosses:
+            return False
+        (idgloss, in_web, crude) = self._glosses[pk]
+        if tier == STAFF_TIER:
+            return True
+        if tier == SAFE_TIER:
+            return in_web and not crude
+        return in_web
+
+    def _reachable(self, pks, role, hops, tier):
+        # a breadth-first search from 'pks' along the relations of 'role'
+        found = dict((pk, 0) for pk in pks)
+        queue = deque(pks)
+        while queue:
+            pk = queue.popleft()
+            if hops is not None and found[pk] >= hops:
+                continue
+            for other in self._edges.get(pk, {}).get(role, ()):
+                if other not in found and self._visible(other, tier):
+                    found[other] = found[pk] + 1
+                    queue.append(other)
+        return found
+
+    def reachable(self, pk, role, hops=1, tier=STAFF_TIER):
+        """
+        Return a list of RelatedSigns for the glosses 'tier' can see that
+        are related to the gloss 'pk' by 'role' through at most 'hops'
+        relations (any number if it is None), nearest first
+        """
+        self.ensure_built()
+        with self._lock:
+            found = self._reachable([pk], role, hops, tier)
+            signs = [RelatedSign(other, self._glosses[other][0], distance)
+                     for (other, distance) in found.items() if other != pk]
+        signs.sort(key=lambda sign: (sign.hops, sign.idgloss, sign.pk))
+        return signs
+
+    def related(self, pk, tier=STAFF_TIER, hops=None):
+        """
+        Return a list of (role name, RelatedSigns) pairs for each role the
+        gloss 'pk' has related signs 'tier' can see by, as far as 'hops'
+        (a dictionary from role to hops, entry_hops() if it is None) says
+        """
+        if hops is None:
+            hops = entry_hops()
+        related = []
+        for (role, name) in RELATION_ROLE_CHOICES:
+            if role in hops:
+                signs = self.reachable(pk, role, hops[role], tier)
+                if signs:
+                    related.append((name, signs))
+        return related
+
+    def neighbourhood(self, pks):
+        """
+        Return the ids of the glosses whose entry pages show any of the
+        glosses 'pks' as a related sign
+        """
+        self.ensure_built()
+        pks = [pk for pk in pks if pk is not None]
+        found = set()
+        with self._lock:
+            # the relations are followed both ways, so these are the glosses
+            # the entry pages of 'pks' would show to staff
+            for (role, hops) in entry_hops().items():
+                found.update(self._reachable(pks, role, hops, STAFF_TIER))
+        return found.difference(pks)
+
+
+relation_graph = RelationGraph()
+
+
+def related_entries_changed(pks, bumped=()):
+    """
+    Give new revisions to the entries of the glosses 'pks' and those that
+    show any of them as a related sign, other than the glosses 'bumped',
+    whose revisions the change has bumped already
+    """
+    gloss_ids = relation_graph.neighbourhood(pks).union(pks).difference(bumped)
+    gloss_ids.discard(None)
+    if gloss_ids:
+        bump_revisions(gloss_ids)
+        glosses_changed(gloss_ids)
+
+
+@receiver(post_save, sender=Relation)
+def relation_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        relation_graph.invalidate()
+        return
+    ends = [instance.source_id, instance.target_id]
+    # a relation moved from one sign to another changes the old ones too
+    old = [] if created else relation_graph.ends(instance.pk)
+    relation_graph.relation_saved(instance)
+    related_entries_changed(ends + old, bumped=ends)
+
+
+@receiver(post_delete, sender=Relation)
+def relation_deleted(sender, instance, **kwargs):
+    ends = [instance.source_id, instance.target_id]
+    relation_graph.relation_deleted(instance.pk)
+    related_entries_changed(ends, bumped=ends)
+
+
+@receiver(post_save, sender=Gloss)
+def gloss_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        relation_graph.invalidate()
+    elif (created or instance.has_changed('idgloss')
+          or instance.has_changed('inWeb')):
+        relation_graph.gloss_saved(instance)
+        if not created:
+            related_entries_changed([instance.pk], bumped=[instance.pk])
+
+
+@receiver(post_delete, sender=Gloss)
+def gloss_deleted(sender, instance, **kwargs):
+    relation_graph.gloss_deleted(instance.pk)
+
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def gloss_tagged(sender, instance, raw=False, **kwargs):
+    if raw:
+        relation_graph.invalidate()
+    elif (instance.content_type_id == ContentType.objects.get_for_model(Gloss).pk
+          and instance.tag_id == tag_ids.get(CRUDE_TAG)):
+        relation_graph.crude_changed(instance.object_id)
+        related_entries_changed([instance.object_id])
@@ -0,0 +1,174 @@
+"""
+Sending the dictionary pages' reads for everyone but staff to read replicas
+of the database.
+
+To use it, list the aliases of the replicas in the REPLICA_DATABASES
+setting, add ReplicaRouter to DATABASE_ROUTERS and ReplicaMiddleware to
+MIDDLEWARE. The search, word, gloss and autocomplete views then read the
+dictionary's tables (and the tags) from one of the replicas, chosen at
+random, unless:
+
+* the user is staff, who see and edit unpublished signs;
+* the user has saved something in the last REPLICA_STICKY_SECONDS seconds,
+  which the middleware remembers in a cookie, so that editors see their
+  own edits;
+* the dictionary was edited less recently than the view's entry in the
+  REPLICA_LAG setting, the number of seconds the replicas may take to
+  catch up that the view shouldn't show. A view with no entry reads a
+  replica however recent the last edit is.
+
+Everything else, and every write, uses the default database, and so do
+the in-memory indexes, which are loaded once and kept until the next edit
+(see primary()). The router remembers when each write was committed in the
+cache named by INDEX_CACHE_ALIAS, for REPLICA_LAG.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from dictionary.models import viewer
+
+
+# the apps whose tables the replicas are used for
+ROUTED_APPS = ('dictionary', 'tagging')
+
+STICKY_COOKIE = 'dictionary_primary_until'
+
+EDITED_KEY = 'dictionary:edited'
+
+_state = threading.local()
+
+
+def replicas():
+    return getattr(settings, 'REPLICA_DATABASES', ())
+
+
+def _cache():
+    return caches[getattr(settings, 'INDEX_CACHE_ALIAS', 'default')]
+
+
+def edited():
+    """Remember that an edit to the dictionary has just been committed"""
+    _cache().set(EDITED_KEY, time.time(), None)
+
+
+def last_edit():
+    """Return the time the last edit to the dictionary was committed"""
+    cache = _cache()
+    when = cache.get(EDITED_KEY)
+    if when is None:
+        # nobody knows when the last edit was, so say it was now
+        cache.add(EDITED_KEY, time.time(), None)
+        when = cache.get(EDITED_KEY)
+    return when
+
+
+@contextmanager
+def primary():
+    """
+    Read from the default database in this thread, even in a view that
+    reads from a replica
+    """
+    previous = getattr(_state, 'replica', None)
+    _state.replica = None
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def replica_for(request, name):
+    """
+    Return the alias of the replica the view 'name' should read from for
+    'request', or None if it should read from the default database
+    """
+    aliases = replicas()
+    if not aliases or viewer(request).staff:
+        return None
+    try:
+        if float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time():
+            return None
+    except ValueError:
+        pass
+    lag = getattr(settings, 'REPLICA_LAG', {}).get(name, 0)
+    if lag and time.time() - last_edit() < lag:
+        return None
+    return random.choice(aliases)
+
+
+def replica_reads(name):
+    """
+    Make a view read the dictionary from a replica when replica_for() says
+    it may, 'name' being its entry in the REPLICA_LAG setting
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            alias = replica_for(request, name)
+            if alias is None:
+                return view(request, *args, **kwargs)
+            previous = getattr(_state, 'replica', None)
+            _state.replica = alias
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                _state.replica = previous
+        return wrapper
+    return decorator
+
+
+class ReplicaRouter(object):
+    """
+    Reads the dictionary from the replica chosen for the current view, if
+    any, and writes it to the default database, which also remembers that
+    the current request has written something, and when it commits.
+    """
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in ROUTED_APPS:
+            return getattr(_state, 'replica', None)
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label in ROUTED_APPS:
+            _state.wrote = True
+            # once for each transaction; outside one, on_commit() calls it now
+            if not any(func is edited for (sids, func)
+                       in connections[DEFAULT_DB_ALIAS].run_on_commit):
+                transaction.on_commit(edited, using=DEFAULT_DB_ALIAS)
+            # not the database an instance was read from, which may be a replica
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = set(replicas())
+        aliases.add(DEFAULT_DB_ALIAS)
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class ReplicaMiddleware(object):
+    """
+    Sends the requests of a user who has just saved something to the
+    default database for REPLICA_STICKY_SECONDS seconds
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.wrote = False
+        try:
+            response = self.get_response(request)
+            if _state.wrote:
+                seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+                response.set_cookie(STICKY_COOKIE, '%.3f' % (time.time() + seconds),
+                                    max_age=seconds, httponly=True)
+            return response
+        finally:
+            _state.wrote = False
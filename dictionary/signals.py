@@ -0,0 +1,154 @@
+"""
+Signal handlers that keep the columns the dictionary copies from one table
+into another (such as the translation counts on Keyword) in step with edits,
+bump the revision of each gloss whose entry page an edit changes, and tell
+the purge hooks which pages are out of date.
+"""
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from tagging.models import Tag, TaggedItem
+
+from dictionary.models import (Translation, Gloss, Keyword, Definition,
+    Relation, CRUDE_TAG, tag_ids, update_keyword_translations, bump_revisions,
+    refresh_public_glosses)
+from dictionary.entry_cache import entry_cache
+from dictionary.conditional import dictionary_changed, glosses_changed
+from dictionary.keyword_index import fold
+from dictionary.stemming import stem
+
+
+def entries_changed(gloss_ids):
+    gloss_ids = set(gloss_ids)
+    gloss_ids.discard(None)
+    bump_revisions(gloss_ids)
+    glosses_changed(gloss_ids)
+
+
+@receiver(post_save, sender=Translation)
+@receiver(post_delete, sender=Translation)
+def translation_changed(sender, instance, raw=False, **kwargs):
+    dictionary_changed()
+    # a fixture's counts and ordinals are worked out again as it loads,
+    # since it may be older than them; its gloss and keyword may not have
+    # loaded yet, and recount the keyword when they do
+    if raw:
+        update_keyword_translations([instance.translation_id])
+    else:
+        keyword_ids = set([instance.translation_id,
+                           instance.loaded_value('translation_id')])
+        keyword_ids.discard(None)
+        update_keyword_translations(keyword_ids)
+        entries_changed([instance.gloss_id, instance.loaded_value('gloss_id')])
+
+
+@receiver(pre_save, sender=Gloss)
+def gloss_saving(sender, instance, raw=False, **kwargs):
+    # bump the revision in the database, where this instance's copy of it
+    # may be out of date
+    if not raw:
+        instance.modified = timezone.now()
+        if not instance._state.adding:
+            instance.revision = F('revision') + 1
+
+
+@receiver(post_save, sender=Gloss)
+def gloss_changed(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        # the revisions in a fixture may repeat ones already cached
+        entry_cache.clear()
+        dictionary_changed()
+        refresh_public_glosses([instance.pk])
+        update_keyword_translations(instance.translation_set
+                                    .values_list('translation', flat=True))
+        return
+    if created:
+        dictionary_changed()
+        if instance.inWeb:
+            refresh_public_glosses([instance.pk])
+        return
+    instance.refresh_from_db(fields=['revision'])
+    glosses_changed([instance.pk])
+    if (instance.has_changed('inWeb') or instance.has_changed('idgloss')
+            or instance.has_changed('sn')):
+        refresh_public_glosses([instance.pk])
+    # publishing a gloss changes what the public can see, and renaming
+    # it changes the order of the translations
+    if instance.has_changed('inWeb') or instance.has_changed('idgloss'):
+        update_keyword_translations(instance.translation_set
+                                    .values_list('translation', flat=True))
+    # and moving it changes the position of every sign
+    if (instance.has_changed('inWeb') or instance.has_changed('idgloss')
+            or instance.has_changed('sn')):
+        dictionary_changed()
+
+
+@receiver(post_delete, sender=Gloss)
+def gloss_deleted(sender, instance, **kwargs):
+    # its public copy went with it
+    dictionary_changed()
+    glosses_changed([instance.pk])
+
+
+@receiver(pre_save, sender=Keyword)
+def keyword_saving(sender, instance, **kwargs):
+    # fixtures too, since these only depend on the text
+    instance.folded = fold(instance.text)
+    instance.stem = stem(instance.text)
+
+
+@receiver(post_save, sender=Keyword)
+def keyword_renamed(sender, instance, created, raw=False, **kwargs):
+    if raw or (not created and instance.has_changed('text')):
+        dictionary_changed()
+    if raw:
+        # its counts in the fixture may be older than its translations
+        update_keyword_translations([instance.pk])
+    elif not created and instance.has_changed('text'):
+        entries_changed(Translation.objects.filter(translation=instance)
+                        .values_list('gloss', flat=True))
+
+
+@receiver(post_save, sender=Definition)
+@receiver(post_delete, sender=Definition)
+def definition_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        entries_changed([instance.gloss_id])
+
+
+@receiver(post_save, sender=Relation)
+@receiver(post_delete, sender=Relation)
+def relation_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        entries_changed([instance.source_id, instance.target_id])
+
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def gloss_tagged(sender, instance, raw=False, **kwargs):
+    if instance.content_type_id != ContentType.objects.get_for_model(Gloss).pk:
+        return
+    # tags change what the category filters find
+    dictionary_changed()
+    # and tagging a gloss crude changes what safe search can see
+    if instance.tag_id != tag_ids.get(CRUDE_TAG):
+        return
+    refresh_public_glosses([instance.object_id])
+    update_keyword_translations(Translation.objects.filter(
+        gloss=instance.object_id).values_list('translation', flat=True))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_saved(sender, instance, **kwargs):
+    # a tag has been made, renamed or deleted
+    tag_ids.invalidate()
+
+
+@receiver(post_save, sender=Tag)
+def tag_renamed(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        dictionary_changed()
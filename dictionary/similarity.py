@@ -0,0 +1,263 @@
+"""
+Finding the signs that look like a sign, by comparing their phonology.
+
+Every gloss is a row of a NumPy matrix of small integers, one column for
+each phonology field (see phonology.py) and one for whether the sign is
+made with two hands, worked out from its subordinate handshape. A value
+is coded by its place in the field's choices, and 0 means the field isn't
+set. The distance from one sign to another is the total weight of the
+fields in which they differ, leaving out those the first sign hasn't set,
+so comparing a sign with all the others is one pass over the matrix. The
+weights are in DEFAULT_WEIGHTS and can be changed with the
+SIMILARITY_WEIGHTS setting.
+
+NumPy is optional: without it available() is False, similar_signs()
+raises ImproperlyConfigured and the index isn't kept.
+"""
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from tagging.models import TaggedItem
+
+from dictionary.indexes import InMemoryIndex
+from dictionary.models import (Gloss, CRUDE_TAG, STAFF_TIER, SAFE_TIER,
+    crude_glosses, tag_ids)
+from dictionary.phonology import (PHONOLOGY_FIELDS, GLOSS_FIELDS, UNSET,
+    value_key)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+TWO_HANDED = 'two_handed'
+
+FEATURES = PHONOLOGY_FIELDS + [TWO_HANDED]
+
+DEFAULT_WEIGHTS = {'domhndsh': 3, 'subhndsh': 2,
+                   'final_domhndsh': 2, 'final_subhndsh': 1,
+                   'locprim': 3, 'final_loc': 2, 'locsecond': 1,
+                   'initial_secondary_loc': 1, 'final_secondary_loc': 1,
+                   'initial_palm_orientation': 2, 'final_palm_orientation': 1,
+                   'initial_relative_orientation': 1,
+                   'final_relative_orientation': 1,
+                   TWO_HANDED: 2}
+
+# the subordinate handshape of a sign made with one hand
+ONE_HANDED = '0.0'
+
+
+def available():
+    """Return True if NumPy is installed"""
+    return numpy is not None
+
+
+def _codes():
+    codes = {}
+    for field in PHONOLOGY_FIELDS:
+        choices = [value_key(value) for (value, label)
+                   in Gloss._meta.get_field(field).choices]
+        codes[field] = dict((value, n + 1) for (n, value) in enumerate(choices)
+                            if value not in UNSET)
+    return codes
+
+
+def features(values, codes):
+    """
+    Return the row of the matrix for a gloss with 'values', a dictionary
+    from each phonology field to its value
+    """
+    row = [codes[field].get(value_key(values[field]), 0)
+           for field in PHONOLOGY_FIELDS]
+    handshape = values['subhndsh']
+    if handshape is None or handshape in UNSET:
+        row.append(0)
+    else:
+        row.append(1 if handshape == ONE_HANDED else 2)
+    return row
+
+
+def weights():
+    """Return the weight of each feature, as SIMILARITY_WEIGHTS changes them"""
+    chosen = dict(DEFAULT_WEIGHTS)
+    chosen.update(getattr(settings, 'SIMILARITY_WEIGHTS', {}))
+    return numpy.array([chosen.get(feature, 0) for feature in FEATURES],
+                       dtype=numpy.float64)
+
+
+class SimilarityIndex(InMemoryIndex):
+    """
+    The features of every gloss as the rows of a matrix, with arrays of the
+    id and sign number of the gloss in each row and of which rows hold a
+    gloss, one in the web dictionary or one tagged crude. The arrays have
+    room to spare; a gloss that is deleted leaves its row for the next.
+    """
+    name = 'similarity'
+
+    def build(self):
+        crude = set(crude_glosses().values_list('object_id', flat=True))
+        self._load((row[0], dict(zip(GLOSS_FIELDS + PHONOLOGY_FIELDS, row[1:])),
+                    row[0] in crude)
+                   for row in Gloss.objects.values_list(
+                       'pk', *(GLOSS_FIELDS + PHONOLOGY_FIELDS)).iterator())
+
+    def _load(self, glosses, capacity=1024):
+        self._codes = _codes()
+        self._rows = {}
+        self._free = []
+        self._size = 0
+        self._allocate(capacity)
+        for (pk, values, crude) in glosses:
+            self._put(pk, values, crude)
+
+    def _allocate(self, capacity):
+        self._features = numpy.zeros((capacity, len(FEATURES)), dtype=numpy.uint8)
+        self._pks = numpy.full(capacity, -1, dtype=numpy.int64)
+        # a sign without a sign number comes after the others
+        self._sns = numpy.full(capacity, numpy.inf)
+        self._used = numpy.zeros(capacity, dtype=bool)
+        self._in_web = numpy.zeros(capacity, dtype=bool)
+        self._crude = numpy.zeros(capacity, dtype=bool)
+
+    def _grow(self):
+        size = self._size
+        old = (self._features, self._pks, self._sns, self._used,
+               self._in_web, self._crude)
+        self._allocate(2 * len(self._pks))
+        for (new, array) in zip((self._features, self._pks, self._sns, self._used,
+                                 self._in_web, self._crude), old):
+            new[:size] = array[:size]
+
+    def _drop(self, pk):
+        if pk not in self._rows:
+            return
+        row = self._rows.pop(pk)
+        self._features[row] = 0
+        self._pks[row] = -1
+        self._sns[row] = numpy.inf
+        self._used[row] = self._in_web[row] = self._crude[row] = False
+        self._free.append(row)
+
+    def _put(self, pk, values, crude):
+        if pk in self._rows:
+            row = self._rows[pk]
+        elif self._free:
+            row = self._free.pop()
+        else:
+            if self._size == len(self._pks):
+                self._grow()
+            row = self._size
+            self._size += 1
+        self._rows[pk] = row
+        self._features[row] = features(values, self._codes)
+        self._pks[row] = pk
+        self._sns[row] = numpy.inf if values['sn'] is None else values['sn']
+        self._used[row] = True
+        self._in_web[row] = bool(values['inWeb'])
+        self._crude[row] = crude
+
+    def _set_crude(self, pk, crude):
+        if pk in self._rows:
+            self._crude[self._rows[pk]] = crude
+
+    def gloss_saved(self, gloss):
+        """Put the features a gloss has now in its row"""
+        values = dict((field, getattr(gloss, field))
+                      for field in GLOSS_FIELDS + PHONOLOGY_FIELDS)
+        crude = crude_glosses().filter(object_id=gloss.pk).exists()
+        self.update(self._put, gloss.pk, values, crude)
+
+    def gloss_deleted(self, pk):
+        self.update(self._drop, pk)
+
+    def crude_changed(self, pk):
+        """Look up again whether a gloss is tagged crude"""
+        crude = crude_glosses().filter(object_id=pk).exists()
+        self.update(self._set_crude, pk, crude)
+
+    def _visible(self, tier):
+        size = self._size
+        if tier == STAFF_TIER:
+            return self._used[:size]
+        if tier == SAFE_TIER:
+            return self._in_web[:size] & ~self._crude[:size]
+        return self._in_web[:size]
+
+    def similar(self, pk, tier, k):
+        """
+        Return a list of (gloss id, distance) pairs for the 'k' glosses
+        'tier' can see that are nearest to the gloss 'pk', nearest first
+        and in sign number order among those as near as each other
+        """
+        self.ensure_built()
+        with self._lock:
+            return self._similar(pk, tier, k)
+
+    def _similar(self, pk, tier, k):
+        if pk not in self._rows or k < 1:
+            return []
+        row = self._rows[pk]
+        size = self._size
+        target = self._features[row]
+        # the fields the gloss hasn't set don't count
+        distances = (self._features[:size] != target).dot(
+            weights() * (target != 0))
+        visible = self._visible(tier).copy()
+        visible[row] = False
+        candidates = numpy.flatnonzero(visible)
+        if len(candidates) > k:
+            # keep those no further than the k-th nearest, then sort them
+            near = distances[candidates]
+            candidates = candidates[near <= numpy.partition(near, k - 1)[k - 1]]
+        order = numpy.lexsort((self._sns[candidates], distances[candidates]))
+        return [(int(self._pks[i]), float(distances[i]))
+                for i in candidates[order[:k]]]
+
+
+similarity_index = SimilarityIndex()
+
+
+def similar_signs(gloss, k=10, tier=STAFF_TIER):
+    """
+    Return a list of (gloss, distance) pairs for the 'k' signs 'tier' can
+    see that look most like 'gloss', nearest first
+    """
+    if not available():
+        raise ImproperlyConfigured('Finding similar signs needs NumPy')
+    found = similarity_index.similar(gloss.pk, tier, k)
+    glosses = Gloss.objects.in_bulk([pk for (pk, distance) in found])
+    # a gloss deleted since it was found is left out
+    return [(glosses[pk], distance) for (pk, distance) in found if pk in glosses]
+
+
+@receiver(post_save, sender=Gloss)
+def gloss_saved(sender, instance, raw=False, **kwargs):
+    if not available():
+        return
+    if raw:
+        similarity_index.invalidate()
+    elif any(instance.has_changed(field)
+             for field in GLOSS_FIELDS + PHONOLOGY_FIELDS):
+        similarity_index.gloss_saved(instance)
+
+
+@receiver(post_delete, sender=Gloss)
+def gloss_deleted(sender, instance, **kwargs):
+    if available():
+        similarity_index.gloss_deleted(instance.pk)
+
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def gloss_tagged(sender, instance, raw=False, **kwargs):
+    if not available():
+        return
+    if raw:
+        similarity_index.invalidate()
+    elif (instance.content_type_id == ContentType.objects.get_for_model(Gloss).pk
+          and instance.tag_id == tag_ids.get(CRUDE_TAG)):
+        similarity_index.crude_changed(instance.object_id)
@@ -0,0 +1,123 @@
+"""
+Reducing English keywords and search terms to a common root, so that a
+search for "running", "ran" or "runs" finds the keyword "run".
+
+A keyword's root is worked out when it is saved and kept in its stem
+column; a search term is reduced the same way and looked up by its root.
+The roots are only compared with each other, never shown, so they needn't
+be words: "make", "making" and "made" all become "mak".
+"""
+from dictionary.keyword_index import fold
+
+
+# irregular verb forms and plurals, and their base forms
+IRREGULAR_FORMS = {
+    'am': 'be', 'are': 'be', 'is': 'be', 'was': 'be', 'were': 'be',
+    'been': 'be', 'being': 'be',
+    'has': 'have', 'had': 'have', 'having': 'have',
+    'does': 'do', 'did': 'do', 'done': 'do',
+    'ate': 'eat', 'eaten': 'eat',
+    'began': 'begin', 'begun': 'begin',
+    'bought': 'buy', 'brought': 'bring', 'built': 'build',
+    'came': 'come', 'caught': 'catch', 'chose': 'choose', 'chosen': 'choose',
+    'drank': 'drink', 'drunk': 'drink', 'drove': 'drive', 'driven': 'drive',
+    'fell': 'fall', 'fallen': 'fall', 'felt': 'feel', 'fought': 'fight',
+    'found': 'find', 'flew': 'fly', 'flown': 'fly', 'forgot': 'forget',
+    'forgotten': 'forget', 'gave': 'give', 'given': 'give',
+    'went': 'go', 'gone': 'go', 'goes': 'go', 'got': 'get', 'gotten': 'get',
+    'grew': 'grow', 'grown': 'grow', 'heard': 'hear', 'held': 'hold',
+    'kept': 'keep', 'knew': 'know', 'known': 'know', 'left': 'leave',
+    'led': 'lead', 'lost': 'lose', 'made': 'make', 'meant': 'mean',
+    'met': 'meet', 'paid': 'pay', 'ran': 'run', 'rode': 'ride',
+    'ridden': 'ride', 'rang': 'ring', 'rung': 'ring', 'rose': 'rise',
+    'risen': 'rise', 'said': 'say', 'saw': 'see', 'seen': 'see',
+    'sold': 'sell', 'sent': 'send', 'sang': 'sing', 'sung': 'sing',
+    'sat': 'sit', 'slept': 'sleep', 'spoke': 'speak', 'spoken': 'speak',
+    'spent': 'spend', 'stood': 'stand', 'stole': 'steal', 'stolen': 'steal',
+    'swam': 'swim', 'swum': 'swim', 'took': 'take', 'taken': 'take',
+    'taught': 'teach', 'told': 'tell', 'thought': 'think', 'threw': 'throw',
+    'thrown': 'throw', 'understood': 'understand', 'woke': 'wake',
+    'woken': 'wake', 'wore': 'wear', 'worn': 'wear', 'won': 'win',
+    'wrote': 'write', 'written': 'write',
+    'died': 'die', 'dies': 'die', 'dying': 'die',
+    'lied': 'lie', 'lies': 'lie', 'lying': 'lie',
+    'tied': 'tie', 'ties': 'tie', 'tying': 'tie',
+    'children': 'child', 'men': 'man', 'women': 'woman', 'people': 'person',
+    'mice': 'mouse', 'feet': 'foot', 'teeth': 'tooth', 'geese': 'goose',
+    'knives': 'knife', 'wives': 'wife', 'lives': 'life', 'leaves': 'leaf',
+    'halves': 'half', 'wolves': 'wolf', 'shelves': 'shelf',
+}
+
+# (ending, replacement, shortest root it may leave) in the order they are
+# tried; only the first ending a word has is considered, and a word whose
+# root would be too short, or have no vowel, is left alone
+SUFFIX_RULES = (
+    ('sses', 'ss', 1),
+    ('ies', 'y', 2),
+    ('ied', 'y', 2),
+    ('eed', 'ee', 2),
+    ('ches', 'ch', 1),
+    ('shes', 'sh', 1),
+    ('xes', 'x', 1),
+    ('zes', 'z', 1),
+    ('ing', '', 2),
+    ('ed', '', 2),
+    ('ss', 'ss', 0),
+    ('us', 'us', 0),
+    ('is', 'is', 0),
+    ('s', '', 2),
+)
+
+VOWELS = set('aeiouy')
+
+# consonants that are often doubled in a base form ("fall", "miss")
+KEEP_DOUBLED = set('lsz')
+
+
+def _root(word):
+    """
+    Return the root of a single lower case word and a description of what
+    was taken off it, or None if nothing was
+    """
+    change = None
+    if word in IRREGULAR_FORMS:
+        change = u'"%s" is a form of "%s"' % (word, IRREGULAR_FORMS[word])
+        word = IRREGULAR_FORMS[word]
+    else:
+        for (ending, replacement, shortest) in SUFFIX_RULES:
+            if word.endswith(ending):
+                root = word[:len(word) - len(ending)]
+                if (ending != replacement and len(root) >= shortest
+                        and VOWELS.intersection(root + replacement)):
+                    change = u'the ending "-%s"' % ending
+                    word = root + replacement
+                break
+    # running -> runn -> run, and so add -> ad as well as adding -> ad
+    if (len(word) > 2 and word[-1] == word[-2]
+            and word[-1] not in VOWELS and word[-1] not in KEEP_DOUBLED):
+        word = word[:-1]
+    # make, making -> mak
+    if len(word) > 3 and word.endswith('e') and not word.endswith('ee'):
+        word = word[:-1]
+    return (word, change)
+
+
+def normalize(text):
+    """
+    Return a pair (root, changes) for a keyword or search term, where
+    'changes' describes the endings and irregular forms that reducing
+    it undid, or is empty if it only needed its case folding
+    """
+    roots = []
+    changes = []
+    for word in fold(text).split():
+        (root, change) = _root(word)
+        roots.append(root)
+        if change:
+            changes.append(change)
+    return (u' '.join(roots), u', '.join(changes))
+
+
+def stem(text):
+    """Return the root of a keyword or search term"""
+    return normalize(text)[0]
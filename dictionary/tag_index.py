@@ -0,0 +1,110 @@
+"""
+An index from tags to the glosses tagged with them.
+
+Filtering search results by category used to read the tags of every gloss
+of every keyword in the results. This index keeps the set of gloss ids for
+each tag, and the tags of each gloss, so a category filter is a set
+intersection and the search page can count the results in every category.
+"""
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from tagging.models import Tag, TaggedItem
+
+from dictionary.indexes import InMemoryIndex
+from dictionary.models import Gloss
+
+
+def gloss_tags():
+    """Return the tagged items that tag glosses"""
+    return TaggedItem.objects.filter(
+        content_type=ContentType.objects.get_for_model(Gloss))
+
+
+class TagIndex(InMemoryIndex):
+    name = 'tags'
+
+    def build(self):
+        self._glosses = {}
+        self._tags = {}
+        for (gloss_id, tag) in gloss_tags().values_list('object_id', 'tag__name'):
+            self._add(gloss_id, tag)
+
+    def _add(self, gloss_id, tag):
+        self._glosses.setdefault(tag, set()).add(gloss_id)
+        self._tags.setdefault(gloss_id, set()).add(tag)
+
+    def _drop(self, gloss_id):
+        for tag in self._tags.pop(gloss_id, ()):
+            self._glosses[tag].discard(gloss_id)
+
+    def _reload(self, gloss_id):
+        self._drop(gloss_id)
+        for tag in (gloss_tags().filter(object_id=gloss_id)
+                    .values_list('tag__name', flat=True)):
+            self._add(gloss_id, tag)
+
+    def refresh(self, gloss_id):
+        """Reload the tags of a gloss from the database"""
+        self.update(self._reload, gloss_id)
+
+    def remove(self, gloss_id):
+        """Forget a gloss that has been deleted"""
+        self.update(self._drop, gloss_id)
+
+    def glosses(self, tag):
+        """Return the set of ids of the glosses tagged 'tag'"""
+        self.ensure_built()
+        with self._lock:
+            return frozenset(self._glosses.get(tag, ()))
+
+    def filter_keywords(self, keyword_glosses, tag):
+        """
+        Given (keyword id, gloss ids) pairs, return the ids of the keywords
+        with at least one gloss tagged 'tag', in the same order
+        """
+        tagged = self.glosses(tag)
+        return [kid for (kid, gloss_ids) in keyword_glosses
+                if tagged.intersection(gloss_ids)]
+
+    def facet_counts(self, keyword_glosses, tags):
+        """
+        Given (keyword id, gloss ids) pairs, return a list of (tag, count)
+        pairs giving the number of keywords with a gloss tagged with each
+        of 'tags' that has any
+        """
+        self.ensure_built()
+        counts = dict((tag, 0) for tag in tags)
+        with self._lock:
+            for (kid, gloss_ids) in keyword_glosses:
+                found = set()
+                for gloss_id in gloss_ids:
+                    found.update(self._tags.get(gloss_id, ()))
+                for tag in found:
+                    if tag in counts:
+                        counts[tag] += 1
+        return [(tag, counts[tag]) for tag in tags if counts[tag]]
+
+
+tag_index = TagIndex()
+
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def tagged_item_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        tag_index.invalidate()
+    elif instance.content_type_id == ContentType.objects.get_for_model(Gloss).pk:
+        tag_index.refresh(instance.object_id)
+
+
+@receiver(post_save, sender=Tag)
+def tag_renamed(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        tag_index.invalidate()
+
+
+@receiver(post_delete, sender=Gloss)
+def gloss_deleted(sender, instance, **kwargs):
+    tag_index.remove(instance.pk)
@@ -11,6 +11,24 @@ urlpatterns = [
     url(r'^$', views.search, name='index'),
     # ex: search/
     url(r'^search/$', views.search, name="search"),
+    # ex: autocomplete/?q=ab
+    url(r'^autocomplete/$', views.autocomplete, name="autocomplete"),
+    # ex: definitions/?query=water
+    url(r'^definitions/$',
+        permission_required('dictionary.search_gloss')(views.search_definitions),
+        name="search_definitions"),
+    # ex: phonology/?domhndsh=1.1&locprim=2
+    url(r'^phonology/$', views.search_phonology, name="search_phonology"),
+    # ex: similar/jet/?k=10
+    url(r'^similar/(?P<idgloss>.+)/$', views.similar, name="similar"),
+    # ex: minimal-pairs/?field=locprim
+    url(r'^minimal-pairs/$',
+        permission_required('dictionary.search_gloss')(views.minimal_pairs),
+        name="minimal_pairs"),
+    # ex: export/
+    url(r'^export/$',
+        permission_required('dictionary.export_csv')(views.export),
+        name="export"),
     # ex: words/jet-1
     url(r'^words/(?P<keyword>.+)-(?P<n>\d+)/$',
             views.word, name='word'),
@@ -1,28 +1,68 @@
+from functools import wraps
+
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
+from django.core.urlresolvers import reverse
+from django.template.loader import render_to_string
+from django.db.models import Prefetch
+from django.db.models.query import QuerySet
+from django.core.cache import cache
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from tagging.models import Tag, TaggedItem
-from django.http import HttpResponse, Http404
+from django.http import (HttpResponse, Http404, JsonResponse,
+    StreamingHttpResponse)
+from django.views.decorators.http import condition
+from django.utils import six
 
-from dictionary.forms import UserSignSearchForm, TagUpdateForm
-from dictionary.models import Gloss, Keyword
+from dictionary.forms import (UserSignSearchForm, DefinitionSearchForm,
+    TagUpdateForm, PhonologySearchForm)
+from dictionary.models import (Gloss, Keyword, Translation, Definition,
+    viewer, viewer_tier, visible_translations, crude_glosses,
+    tag_ids, STAFF_TIER, COUNT_FIELDS, ORDINAL_FIELDS)
+from dictionary.keyword_index import keyword_index, KeywordList, fold
+from dictionary.tag_index import tag_index, gloss_tags
+from dictionary.positions import gloss_positions
+from dictionary.fuzzy import fuzzy_index
+from dictionary.stemming import normalize
+from dictionary.definition_search import definition_search
+from dictionary.phonology import phonology_index, PHONOLOGY_FIELDS
+from dictionary.minimal_pairs import minimal_pairs_csv
+from dictionary.similarity import similar_signs, available as similarity_available
+from dictionary.relations import relation_graph
+from dictionary.exporter import export_csv, Echo
+from dictionary.entry_cache import entry_cache, entry_viewer
+from dictionary.conditional import (dictionary_revision, dictionary_modified,
+    make_etag, digest, latest, surrogate_keys)
+from dictionary.routers import replica_reads
 
 
 def login_required_config(function):
     '''
     Like @login_required if the ALWAYS_REQUIRE_LOGIN setting is True.
     '''
+    decorated_function = login_required(function)
+
+    @wraps(function)
     def wrapper(*args, **kwargs):
         if settings.ALWAYS_REQUIRE_LOGIN:
-            decorated_function = login_required(function)
             return decorated_function(*args, **kwargs)
         else:
             return function(*args, **kwargs)
     return wrapper
    
+
+def search_etag(request):
+    return make_etag('search', entry_viewer(request), dictionary_revision(),
+                     request.GET.urlencode())
+
+
+def search_last_modified(request):
+    return dictionary_modified()
+
         
 @login_required_config
+@replica_reads('search')
+@condition(etag_func=search_etag, last_modified_func=search_last_modified)
 def search(request):
     '''
     Get-variables are either passed to this view or not passed to this view.
@@ -33,80 +73,395 @@ def search(request):
     then returns all corresponding signs to the user.
     '''
     term = ''
+    category = ''
+    narrowed = ''
     words = []
+    facets = []
+    fuzzy = False
+    normalized = None
+    # the tier takes care of safe search for non-authenticated users
+    tier = viewer_tier(request)
     form = UserSignSearchForm(request.GET)
     if form.is_valid():
         # need to transcode the query to our encoding
         term = form.cleaned_data['query']
         category = form.cleaned_data['category']
-        # safe search for non-authenticated users if the setting says so
-        if request.user.has_perm('dictionary.search_gloss'):
-            # staff get to see all the words that have at least one translation
-            words = Keyword.objects.filter(text__istartswith=term, 
-                translation__isnull=False).distinct()
-        else:
-            # regular users see either everything that's published
-            # not sure what is going on here...
-            words = Keyword.objects.filter(text__istartswith=term,
-                translation__gloss__inWeb__exact=True).distinct()        
-        safe = (not request.user.is_authenticated()) and settings.ANON_SAFE_SEARCH
-        if safe:
-            words = remove_crude_words(words)    
         if not category in ['all', '']:
-            words = remove_words_not_belonging_to_category(words, category)    
+            narrowed = category
+        if form.cleaned_data['fuzzy']:
+            words = fuzzy_keywords(term, tier)
+            fuzzy = True
+        else:
+            words = find_keywords(term, tier)
+            if count_keywords(words, tier, term, '', False, False) == 0:
+                # if no keyword starts with the term, look for the keywords
+                # with the same root (running, ran -> run), and failing that
+                # for the ones spelled like it
+                (words, normalized) = stemmed_keywords(term, tier)
+                if count_keywords(words, tier, term, '', False, True) == 0:
+                    normalized = None
+                    if getattr(settings, 'FUZZY_SEARCH', True):
+                        words = fuzzy_keywords(term, tier)
+                        fuzzy = True
+        # count the matches in each category before narrowing them down
+        if settings.ANON_TAG_SEARCH:
+            facets = tag_facets(words, tier)
+        if narrowed:
+            words = remove_words_not_belonging_to_category(words, category,
+                                                           tier)
             
+    # the same search without a category was counted above under the same key
+    wordcount = count_keywords(words, tier, term, narrowed, fuzzy,
+                               normalized is not None)
     # display the keyword page if there's only one hit and it is an exact match
-    if len(words) == 1 and words[0].text == term:
+    if wordcount == 1 and words[0].text == term:
         return redirect('/dictionary/words/'+words[0].text+'-1')
-    # Display the keywords, 50 per page...
-    (result_page, paginator) = paginate(request, words, 50)
-    return render(request, "dictionary/search_result.html",
+    # Display the keywords, 50 per page, following the keyword in 'after'
+    # if there is one and by page number otherwise. Close matches aren't
+    # in alphabetical order, so they can only be paged by number.
+    if 'after' in request.GET and form.is_valid() and not fuzzy:
+        result_page = keyset_page(words, request.GET['after'], 50)
+        paginator = None
+    else:
+        (result_page, paginator) = paginate(request, words, 50, wordcount)
+        result_page.object_list = list(result_page.object_list)
+    if result_page.has_next():
+        next_after = result_page.object_list[-1].text
+    else:
+        next_after = None
+    response = render(request, "dictionary/search_result.html",
                               {'query' : term,
+                               'category': category,
+                               'facets': facets,
+                               'fuzzy': fuzzy,
+                               'normalized': normalized,
                                'form': form,
                                'paginator' : paginator,
-                               'wordcount' : len(words),
+                               'wordcount' : wordcount,
                                'page' : result_page,
+                               'next_after': next_after,
                                'ANON_SAFE_SEARCH': settings.ANON_SAFE_SEARCH,                                         
                                'ANON_TAG_SEARCH': settings.ANON_TAG_SEARCH,
                                'language': settings.LANGUAGE_NAME,
+                               'viewer': viewer(request),
                                })
+    response['Surrogate-Key'] = surrogate_keys(
+        keyword_glosses(result_page.object_list, tier))
+    return response
 
 
-def remove_crude_words(words):
+@login_required_config
+@replica_reads('autocomplete')
+def autocomplete(request):
+    '''
+    Return a JSON list of the first few keywords starting with the 'q'
+    get-variable that the user can see, for the search box to suggest.
+    The keyword index answers it without going to the database.
+    '''
+    prefix = request.GET.get('q', '').strip()
     try:
-        crudetag = Tag.objects.get(name='lexis:crude')
-    except:
-        crudetag = None 
-    if crudetag != None:    
-        crude = TaggedItem.objects.get_by_model(Gloss, crudetag)
-        # remove crude words from result 
-        result = []
-        for w in words:
-            # remove word if all glosses for any translation are tagged crude
-            trans = w.translation_set.all()
-            glosses = [t.gloss for t in trans]
-            if not all([g in crude for g in glosses]):
-                result.append(w)
-        words = result
-    return words
+        limit = min(int(request.GET.get('limit', 10)),
+                    getattr(settings, 'AUTOCOMPLETE_LIMIT', 20))
+    except ValueError:
+        limit = 10
+    if prefix and limit > 0:
+        texts = keyword_index.complete(prefix, viewer_tier(request), limit)
+    else:
+        texts = []
+    return JsonResponse(texts, safe=False,
+                        json_dumps_params={'separators': (',', ':')})
+
+
+def search_definitions(request):
+    '''
+    Staff search of the text of definitions. The definitions containing
+    every word of the query are listed with their signs, best match first;
+    unpublished ones are included for users who may see them.
+    '''
+    query = ''
+    hits = []
+    form = DefinitionSearchForm(request.GET)
+    if form.is_valid():
+        query = form.cleaned_data['query']
+        hits = definition_search().search(
+            query, viewer(request).can_view_unpub_defs,
+            getattr(settings, 'DEFINITION_SEARCH_LIMIT', 500))
+    (result_page, paginator) = paginate(request, hits, 50)
+    definitions = Definition.objects.select_related('gloss').in_bulk(
+        [did for (did, score) in result_page.object_list])
+    # a definition deleted since it was found is left out
+    result_page.object_list = [definitions[did] for (did, score)
+                               in result_page.object_list if did in definitions]
+    return render(request, "dictionary/definition_search.html",
+                  {'query': query,
+                   'form': form,
+                   'paginator': paginator,
+                   'count': len(hits),
+                   'page': result_page,
+                   })
+
+
+@login_required_config
+def search_phonology(request):
+    '''
+    Find a sign by its form. The signs the user can see with any of the
+    handshapes, locations or orientations picked for each field, and with
+    every field picked (or any of them), are listed in sign number order.
+    The phonology index answers it without going to the database.
+    '''
+    form = PhonologySearchForm(request.GET)
+    glosses = []
+    if form.is_valid():
+        glosses = phonology_index.search(form.criteria(), viewer_tier(request),
+                                         form.cleaned_data['match'] != 'any')
+    (result_page, paginator) = paginate(request, glosses, 50)
+    found = Gloss.objects.in_bulk(result_page.object_list)
+    # a gloss deleted since it was found is left out
+    result_page.object_list = [found[pk] for pk in result_page.object_list
+                               if pk in found]
+    query = request.GET.copy()
+    query.pop('page', None)
+    return render(request, "dictionary/phonology_search.html",
+                  {'form': form,
+                   'searched': form.is_valid() and any(form.criteria().values()),
+                   'query': query.urlencode(),
+                   'paginator': paginator,
+                   'count': len(glosses),
+                   'page': result_page,
+                   })
+
+
+@login_required_config
+def similar(request, idgloss):
+    '''
+    Return a JSON list of the signs the user can see that look most like
+    the sign 'idgloss', nearest first, the 'k' get-variable saying how
+    many (at most SIMILAR_SIGNS_LIMIT). It is a 404 without NumPy.
+    '''
+    if not similarity_available():
+        raise Http404
+    tier = viewer_tier(request)
+    if tier == STAFF_TIER:
+        glosses = Gloss.objects.filter(idgloss=idgloss)
+    else:
+        glosses = Gloss.objects.filter(public__idgloss=idgloss)
+    glosses = list(glosses[:2])
+    if len(glosses) != 1:
+        raise Http404
+    try:
+        k = min(int(request.GET.get('k', 10)),
+                getattr(settings, 'SIMILAR_SIGNS_LIMIT', 50))
+    except ValueError:
+        k = 10
+    return JsonResponse([{'idgloss': gloss.idgloss,
+                          'sn': gloss.sn,
+                          'distance': distance,
+                          'url': reverse('dictionary:gloss', args=[gloss.idgloss])}
+                         for (gloss, distance) in similar_signs(glosses[0], k, tier)],
+                        safe=False)
+
+
+def minimal_pairs(request):
+    '''
+    Send the minimal pairs last found by the find_minimal_pairs command as
+    CSV, those differing in the 'field' get-variables if there are any.
+    '''
+    fields = [field for field in request.GET.getlist('field')
+              if field in PHONOLOGY_FIELDS] or PHONOLOGY_FIELDS
+    response = StreamingHttpResponse(minimal_pairs_csv(Echo(), fields),
+                                     content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="minimal-pairs.csv"'
+    return response
+
+
+def export(request):
+    '''
+    Send every sign as CSV. The rows are sent as they are made, so the
+    download starts at once and the server doesn't hold the whole file.
+    '''
+    response = StreamingHttpResponse(
+        export_csv(Echo(), viewer(request).can_view_unpub_defs),
+        content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="signs.csv"'
+    return response
+
+
+def find_keywords(term, tier):
+    '''
+    Return the keywords starting with 'term' that 'tier' can see.
+    
+    The in-memory keyword index answers this unless the KEYWORD_INDEX
+    setting is False, in which case the database is queried.
+    '''
+    if getattr(settings, 'KEYWORD_INDEX', True):
+        return keyword_index.search(term, tier)
+    words = Keyword.objects.filter(**prefix_filter('folded', fold(term)))
+    # a keyword is found if it has a translation the tier can see
+    return words.filter(**{COUNT_FIELDS[tier] + '__gt': 0})
+
+
+def prefix_filter(field, prefix):
+    '''
+    Return the filter arguments that find the values of 'field' starting
+    with 'prefix'. A LIKE can't use an index on every database, so the
+    values are also limited to the range of strings that could start with
+    the prefix, which can.
+    '''
+    if not prefix:
+        return {}
+    following = prefix[:-1] + six.unichr(ord(prefix[-1]) + 1)
+    return {field + '__gte': prefix, field + '__lt': following,
+            field + '__startswith': prefix}
+
+
+def stemmed_keywords(term, tier):
+    '''
+    Return the keywords 'tier' can see with the same root as 'term', and
+    a description of the word endings and irregular forms that were
+    undone to find them. The roots of the keywords are worked out when
+    they are saved, so this is a single lookup.
+    '''
+    (root, changes) = normalize(term)
+    if getattr(settings, 'KEYWORD_INDEX', True):
+        words = KeywordList(keyword_index.stemmed(root, tier))
+    else:
+        words = Keyword.objects.filter(stem=root).filter(
+            **{COUNT_FIELDS[tier] + '__gt': 0})
+    return (words, changes)
+
+
+def fuzzy_keywords(term, tier):
+    '''
+    Return a KeywordList of the keywords 'tier' can see that are spelled
+    like 'term', closest first, for when no keyword starts with it.
+    '''
+    ids = fuzzy_index.search(term)
+    if getattr(settings, 'KEYWORD_INDEX', True):
+        ids = keyword_index.visible(ids, tier)
+    else:
+        visible = set(Keyword.objects.filter(pk__in=ids).filter(
+            **{COUNT_FIELDS[tier] + '__gt': 0}).values_list('id', flat=True))
+        ids = [kid for kid in ids if kid in visible]
+    return KeywordList(ids[:getattr(settings, 'FUZZY_LIMIT', 50)])
+
+
+def keyword_glosses(words, tier):
+    '''
+    Return the ids of the glosses of a list of keywords that 'tier' can see.
+    '''
+    ids = [w.pk for w in words]
+    if getattr(settings, 'KEYWORD_INDEX', True):
+        return [gloss_id for (kid, gloss_ids) in keyword_index.glosses(ids, tier)
+                for gloss_id in gloss_ids]
+    return visible_translations(tier).filter(
+        translation__in=ids).values_list('gloss', flat=True)
+
+
+def remove_crude_words(words):
+    '''
+    Remove the keywords from a queryset whose translations are all
+    of signs tagged crude. The result is still a lazy queryset.
+    '''
+    return words.filter(pk__in=Translation.objects.exclude(
+        gloss__in=crude_glosses()).values('translation'))
     
     
-def remove_words_not_belonging_to_category(words, category):
-    tag = Tag.objects.get(name=category)
-    result = []
-    for w in words:
-        trans = w.translation_set.all()
-        glosses = [t.gloss for t in trans]
-        for g in glosses:
-            if tag in g.tags:
-                result.append(w)
-    words = result
-    return words
+def remove_words_not_belonging_to_category(words, category, tier=STAFF_TIER):
+    '''
+    Keep the keywords with a sign tagged 'category' that 'tier' can see.
+    Keywords found by the keyword index are filtered with the tag index,
+    a queryset of keywords is filtered by the database.
+    '''
+    if isinstance(words, KeywordList):
+        return KeywordList(tag_index.filter_keywords(
+            keyword_index.glosses(words.ids, tier), category))
+    tagged = gloss_tags().filter(tag_id=tag_ids.get(category)).values('object_id')
+    return words.filter(pk__in=visible_translations(tier).filter(
+        gloss__in=tagged).values('translation'))
+
+
+def tag_facets(words, tier):
+    '''
+    Return a list of (tag, count) pairs giving how many of the keywords
+    in 'words' have a sign with each of the ALLOWED_TAGS.
+    '''
+    if isinstance(words, KeywordList):
+        keyword_glosses = keyword_index.glosses(words.ids, tier)
+    else:
+        glosses = {}
+        for (kid, gloss_id) in visible_translations(tier).filter(
+                translation__in=words).values_list('translation', 'gloss'):
+            glosses.setdefault(kid, []).append(gloss_id)
+        keyword_glosses = glosses.items()
+    return tag_index.facet_counts(keyword_glosses,
+                                  [t for t in settings.ALLOWED_TAGS if t])
     
     
-def paginate(request, objects, npages):
+def count_keywords(words, *search):
+    '''
+    Return the number of keywords found by a search. Counting a queryset
+    costs as much as the search, so the count is cached under the terms
+    of the search until the dictionary changes.
+    '''
+    if not isinstance(words, QuerySet):
+        return len(words)
+    key = 'dictionary:count:%s' % digest(dictionary_revision(), *search)
+    count = cache.get(key)
+    if count is None:
+        count = words.count()
+        cache.set(key, count)
+    return count
+
+
+class CountedPaginator(Paginator):
+    '''
+    A Paginator that is told how many objects there are instead of
+    counting them.
+    '''
+    def __init__(self, object_list, per_page, count):
+        super(CountedPaginator, self).__init__(object_list, per_page)
+        self.count = count
+
+
+class KeysetPage(object):
+    '''
+    A page of keywords that sort after a given keyword text. Unlike a
+    page found by its number, fetching it costs the same however far
+    into the results it is.
+    '''
+    number = None
+
+    def __init__(self, object_list, has_next):
+        self.object_list = object_list
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return True
+
+
+def keyset_page(words, after, per_page):
+    '''
+    Return a KeysetPage of the first 'per_page' keywords in 'words'
+    that sort after the text 'after'.
+    '''
+    if isinstance(words, KeywordList):
+        following = words.after(after)
+        return KeysetPage(following[:per_page], len(following) > per_page)
+    # fetch one more than a page to see if there is another
+    following = list(words.filter(text__gt=after).order_by('text')
+                     [:per_page+1])
+    return KeysetPage(following[:per_page], len(following) > per_page)
+
+
+def paginate(request, objects, npages, count=None):
     # There might be many matches, so let's paginate them...
-    paginator = Paginator(objects, npages)
+    if count is None:
+        paginator = Paginator(objects, npages)
+    else:
+        paginator = CountedPaginator(objects, npages, count)
     if 'page' in request.GET:    
         page = request.GET['page']
         try:
@@ -120,6 +475,91 @@ def paginate(request, objects, npages):
     return (result_page, paginator)
     
     
+def entry_glosses(glosses):
+    '''
+    Fetch a queryset of glosses along with the keywords and published
+    definitions that their entry pages show, so that rendering a page
+    costs the same few queries for any sign. The related signs come
+    from the relation graph.
+    '''
+    return glosses.prefetch_related(
+        Prefetch('translation_set', queryset=Translation.objects
+                 .select_related('translation').order_by('index')),
+        Prefetch('definition_set', to_attr='published_definitions',
+                 queryset=Definition.objects.filter(published=True)
+                 .order_by('role', 'count')))
+
+
+def definition_groups(gloss):
+    '''
+    Return a list of (role name, definitions) pairs, one for each role in
+    DEFINITION_FIELDS that the gloss has published definitions for,
+    in that order. The gloss must come from entry_glosses().
+    '''
+    names = dict(settings.DEFINITION_ROLE_CHOICES)
+    by_role = {}
+    for definition in gloss.published_definitions:
+        by_role.setdefault(definition.role, []).append(definition)
+    return [(names.get(role, role), by_role[role])
+            for role in settings.DEFINITION_FIELDS if role in by_role]
+
+
+def sign_entry(request, gloss, translation, n, viewname):
+    '''
+    Return the rendered sign entry block of a word or gloss page, from
+    the entry cache if it holds this revision of the gloss for this kind
+    of viewer. 'translation' is the one the page was reached by, and
+    'n' its number among the translations of its keyword.
+    '''
+    key = entry_cache.key(gloss, translation.translation_id, n,
+                          entry_viewer(request))
+    entry = entry_cache.get(key)
+    if entry is None:
+        gloss = entry_glosses(Gloss.objects.filter(pk=gloss.pk)).get()
+        entry = render_to_string('dictionary/sign_entry.html',
+                                 {'translation': translation,
+                                  'viewname': viewname,
+                                  'gloss': gloss,
+                                  'allkwds': gloss.translation_set.all(),
+                                  'n': n,
+                                  'definitions': definition_groups(gloss),
+                                  'related': relation_graph.related(
+                                      gloss.pk, viewer_tier(request)),
+                                  'DEFINITION_FIELDS': settings.DEFINITION_FIELDS,
+                                  }, request)
+        entry_cache.set(key, entry)
+    return entry
+
+
+def word_revision(request, keyword, n):
+    '''
+    Return the revision and modification time of the gloss a word page
+    shows, or None if the page will be a 404. The result is kept on the
+    request, which the ETag and Last-Modified functions both look at.
+    '''
+    if not hasattr(request, '_word_revision'):
+        field = ORDINAL_FIELDS[viewer_tier(request)]
+        request._word_revision = (Translation.objects
+            .filter(translation__text=keyword, **{field: int(n)})
+            .values_list('gloss__revision', 'gloss__modified').first())
+    return request._word_revision
+
+
+def word_etag(request, keyword, n):
+    revision = word_revision(request, keyword, n)
+    if revision is not None:
+        return make_etag('word', keyword, n, entry_viewer(request),
+                         dictionary_revision(), revision[0])
+
+
+def word_last_modified(request, keyword, n):
+    revision = word_revision(request, keyword, n)
+    if revision is not None:
+        return latest(revision[1], dictionary_modified())
+
+
+@replica_reads('word')
+@condition(etag_func=word_etag, last_modified_func=word_last_modified)
 def word(request, keyword, n):
     '''
     View of a single keyword that may have more than one sign.
@@ -128,21 +568,18 @@ def word(request, keyword, n):
     word = get_object_or_404(Keyword, text=keyword)
     # returns (matching translation, number of matches)
     (trans, total) =  word.match_request(request, n)
-    # and all the keywords associated with this sign
-    allkwds = trans.gloss.translation_set.all()
+    trans.translation = word
     '''
     videourl = trans.gloss.get_video_url()
     if not os.path.exists(os.path.join(settings.MEDIA_ROOT, videourl)):
         videourl = None
     '''
-    trans.homophones = trans.gloss.relation_sources.filter(role='homophone')
-
-    can_view_not_inWeb = request.user.has_perm('dictionary.search_gloss')
+    can_view_not_inWeb = viewer(request).staff
     gloss = trans.gloss
     (glossposn, glosscount) = get_gloss_position(gloss, can_view_not_inWeb)
     
     # navigation gives us the next and previous signs
-    nav = gloss.navigation(request.user.has_perm('dictionary.search_gloss'))
+    nav = gloss.navigation(can_view_not_inWeb)
     
     '''
     if request.user.has_perm('dictionary.search_gloss'):
@@ -165,12 +602,10 @@ def word(request, keyword, n):
     '''
     
     
-    return render(request, 'dictionary/word.html',
+    response = render(request, 'dictionary/word.html',
                     {'translation': trans,
                    'viewname': 'words',
-                   'definitions': trans.gloss.definitions(),
-                   'gloss': trans.gloss,
-                   'allkwds': allkwds,
+                   'entry': sign_entry(request, gloss, trans, n, 'words'),
                    'n': n,
                    'total': total,
                    'matches': range(1, total+1),
@@ -186,6 +621,7 @@ def word(request, keyword, n):
                    #'update_form': update_form,
                    #'videoform': video_form,
                    'gloss': gloss,
+                   'viewer': viewer(request),
                    'glosscount': glosscount,
                    'glossposn': glossposn,
                    #'feedback' : True,
@@ -194,8 +630,40 @@ def word(request, keyword, n):
                    'SIGN_NAVIGATION' : settings.SIGN_NAVIGATION,
                    'DEFINITION_FIELDS' : settings.DEFINITION_FIELDS,
                    })
+    response['Surrogate-Key'] = surrogate_keys([gloss.pk])
+    return response
+
+
+def gloss_revision(request, idgloss):
+    '''
+    Like word_revision(), for the gloss page of 'idgloss'.
+    '''
+    if not hasattr(request, '_gloss_revision'):
+        if viewer(request).staff:
+            glosses = Gloss.objects.filter(idgloss=idgloss)
+        else:
+            glosses = Gloss.objects.filter(public__idgloss=idgloss)
+        found = list(glosses.values_list('revision', 'modified')[:2])
+        request._gloss_revision = found[0] if len(found) == 1 else None
+    return request._gloss_revision
+
+
+def gloss_etag(request, idgloss):
+    revision = gloss_revision(request, idgloss)
+    if revision is not None:
+        return make_etag('gloss', idgloss, entry_viewer(request),
+                         dictionary_revision(), revision[0])
+
+
+def gloss_last_modified(request, idgloss):
+    revision = gloss_revision(request, idgloss)
+    if revision is not None:
+        return latest(revision[1], dictionary_modified())
+
 
 @login_required_config
+@replica_reads('gloss')
+@condition(etag_func=gloss_etag, last_modified_func=gloss_last_modified)
 def gloss(request, idgloss):
     '''
     View of a gloss - mimics the word view, really for admin use
@@ -210,23 +678,22 @@ def gloss(request, idgloss):
     # we should only be able to get a single gloss, but since the URL
     # pattern could be spoofed, we might get zero or many
     # so we filter first and raise a 404 if we don't get one
-    can_view_not_inWeb = request.user.has_perm('dictionary.search_gloss')
+    can_view_not_inWeb = viewer(request).staff
     if can_view_not_inWeb:
         glosses = Gloss.objects.filter(idgloss=idgloss)
     else:
-        glosses = Gloss.objects.filter(inWeb__exact=True, idgloss=idgloss)
+        glosses = Gloss.objects.filter(public__idgloss=idgloss)
 
     if len(glosses) != 1:
         raise Http404
 
     gloss = glosses[0]
 
-    # and all the keywords associated with this sign
-    allkwds = gloss.translation_set.all()
-    if len(allkwds) == 0:
+    # the page is titled with the first keyword of the sign
+    trans = (gloss.translation_set.select_related('translation')
+             .order_by('index').first())
+    if trans is None:
         trans = Translation()
-    else:
-        trans = allkwds[0]
     '''
     videourl = gloss.get_video_url()
     if not os.path.exists(os.path.join(settings.MEDIA_ROOT, videourl)):
@@ -266,18 +733,19 @@ def gloss(request, idgloss):
         regional_template_content = None
     '''
 
-    return render(request, "dictionary/word.html",
+    response = render(request, "dictionary/word.html",
                               {'translation': trans,
-                               'definitions': gloss.definitions(),
-                               'allkwds': allkwds,
+                               'entry': sign_entry(request, gloss, trans,
+                                                   None, 'gloss'),
                                #'dialect_image': map_image_for_regions(gloss.region_set),
                                #'regions': regions,
                                #'regional_template_content': regional_template_content,
                                'lastmatch': lastmatch,
                                #'videofile': videourl,
-                               'viewname': word,
+                               'viewname': 'gloss',
                                #'feedback': None,
                                'gloss': gloss,
+                               'viewer': viewer(request),
                                'glosscount': glosscount,
                                'glossposn': glossposn,
                                'navigation': nav,
@@ -288,6 +756,8 @@ def gloss(request, idgloss):
                                'SIGN_NAVIGATION' : settings.SIGN_NAVIGATION,
                                'DEFINITION_FIELDS' : settings.DEFINITION_FIELDS,
                                })
+    response['Surrogate-Key'] = surrogate_keys([gloss.pk])
+    return response
 
 
 def get_gloss_position(gloss, can_view_not_inWeb):
@@ -297,25 +767,7 @@ def get_gloss_position(gloss, can_view_not_inWeb):
     to all of the other glosses, and the second value
     is the total number of glosses.
     
-    If gloss_must_be_in_web is true, then only glosses
+    If can_view_not_inWeb is false, then only glosses
     that are in the web will be considered.
     '''
-    if gloss.sn != None:
-        if  can_view_not_inWeb:
-            glosscount = Gloss.objects.count()
-            glossposn = Gloss.objects.filter(sn__lt=gloss.sn).count()+1
-        else:
-            glosscount = Gloss.objects.filter(inWeb__exact=True).count()
-            glossposn = Gloss.objects.filter(inWeb__exact=True, 
-                sn__lt=gloss.sn).count()+1
-    else:
-        glosscount = 0
-        glossposn = 0
-    return (glossposn, glosscount)
-    
-
-    
-    
-    
-    
-    
+    return gloss_positions.position(gloss, can_view_not_inWeb)
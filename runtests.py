@@ -13,6 +13,11 @@ try:
         DATABASES={
             "default": {
                 "ENGINE": "django.db.backends.sqlite3",
+            },
+            # the same database, for the tests of the replica router
+            "replica": {
+                "ENGINE": "django.db.backends.sqlite3",
+                "TEST": {"MIRROR": "default"},
             }
         },
         ROOT_URLCONF="tests.urls",
@@ -40,9 +40,15 @@ setup(
     url='https://github.com/hujosh/signbank-dictionary',
     packages=[
         'dictionary',
+        'dictionary.management',
+        'dictionary.management.commands',
     ],
     include_package_data=True,
     install_requires=[],
+    extras_require={
+        # finding the signs that look like a sign
+        'similarity': ['numpy'],
+    },
     license="BSD",
     zip_safe=False,
     keywords='signbank-dictionary',
@@ -0,0 +1,14 @@
+from django.db import connections, DEFAULT_DB_ALIAS
+
+
+def commit(using=DEFAULT_DB_ALIAS):
+    '''
+    Run what is waiting for the test's transaction to commit, such as
+    the updates of the in-memory indexes, as if it had. A TestCase's
+    transaction is rolled back at the end instead.
+    '''
+    connection = connections[using]
+    while connection.run_on_commit:
+        (callbacks, connection.run_on_commit) = (connection.run_on_commit, [])
+        for (savepoints, func) in callbacks:
+            func()
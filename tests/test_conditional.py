@@ -0,0 +1,154 @@
+import threading
+
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils.six.moves.BaseHTTPServer import (HTTPServer,
+    BaseHTTPRequestHandler)
+
+from dictionary.indexes import clear_all
+from dictionary.entry_cache import entry_cache
+from dictionary.conditional import (http_purge, surrogate_keys,
+    dictionary_changed, dictionary_revision)
+from dictionary.models import Gloss, Keyword
+from tests import commit
+
+
+WORD_URL = '/words/Aborigine-1/'
+GLOSS_URL = '/gloss/Aborigine1/'
+
+
+@override_settings(ALWAYS_REQUIRE_LOGIN=False)
+class ConditionalGetTest(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+        entry_cache.clear()
+        self.gloss = Gloss.objects.get(idgloss='Aborigine1')
+
+    def test_pages_have_validators_and_surrogate_keys(self):
+        for url in (WORD_URL, GLOSS_URL):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response['ETag'].startswith('"'))
+            self.assertTrue(response.has_header('Last-Modified'))
+            self.assertEqual(response['Surrogate-Key'], 'dictionary gloss-1')
+        response = self.client.get('/search/', {'query': 'a'})
+        self.assertEqual(response['Surrogate-Key'], 'dictionary gloss-1')
+
+    def test_unchanged_page_is_not_modified(self):
+        '''
+        A request with the ETag of the current page should get a 304
+        for the price of looking the revision of the gloss up, if any.
+        '''
+        for (url, queries) in ((WORD_URL, 1), (GLOSS_URL, 1),
+                               ('/search/?query=a', 0)):
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(queries):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+    def test_edits_change_the_etags(self):
+        '''
+        A definition changes the entry pages of its gloss but not the
+        search results; a new keyword changes them all.
+        '''
+        urls = (WORD_URL, GLOSS_URL, '/search/?query=a')
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        self.gloss.definition_set.create(role='general', count=1, text='text')
+        new_etags = [self.client.get(url)['ETag'] for url in urls]
+        self.assertNotEqual(new_etags[0], etags[0])
+        self.assertNotEqual(new_etags[1], etags[1])
+        self.assertEqual(new_etags[2], etags[2])
+        self.gloss.translation_set.create(
+            translation=Keyword.objects.create(text='Abacus'), index=2)
+        commit()
+        self.assertNotEqual(self.client.get(urls[2])['ETag'], etags[2])
+
+    def test_missing_page_has_no_validators(self):
+        response = self.client.get('/words/Aborigine-7/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(self.client.get('/gloss/Adam/').status_code, 404)
+
+
+purged = []
+
+
+def record_purge(keys):
+    purged.append(keys)
+
+
+class PurgeHookTest(TransactionTestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        del purged[:]
+
+    @override_settings(PURGE_HOOKS=['tests.test_conditional.record_purge'])
+    def test_edits_call_the_purge_hooks(self):
+        gloss = Gloss.objects.get(idgloss='Aborigine1')
+        gloss.definition_set.create(role='general', count=1, text='text')
+        self.assertEqual(purged, [['gloss-1']])
+        gloss.sn = 100
+        gloss.save()
+        self.assertIn(['dictionary'], purged)
+
+    @override_settings(PURGE_HOOKS=['tests.test_conditional.no_such_hook'])
+    def test_broken_hook_does_not_stop_an_edit(self):
+        gloss = Gloss.objects.get(idgloss='Aborigine1')
+        gloss.definition_set.create(role='general', count=1, text='text')
+        self.assertEqual(gloss.definition_set.count(), 1)
+
+
+class RevisionTest(TransactionTestCase):
+    fixtures = ["test_data.json"]
+
+    def test_revision_changes_when_the_edit_commits(self):
+        '''
+        A page rendered while an edit is being made mustn't get the
+        revision after it.
+        '''
+        revision = dictionary_revision()
+        with transaction.atomic():
+            dictionary_changed()
+            self.assertEqual(dictionary_revision(), revision)
+        self.assertGreater(dictionary_revision(), revision)
+        revision = dictionary_revision()
+        try:
+            with transaction.atomic():
+                dictionary_changed()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(dictionary_revision(), revision)
+
+
+class PurgeRecorder(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_PURGE(self):
+        self.requests.append((self.path, self.headers['Surrogate-Key']))
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class HTTPPurgeTest(TestCase):
+
+    def test_purge_request_reaches_the_proxy(self):
+        '''
+        http_purge should send the keys to a stand-in for the proxy.
+        '''
+        server = HTTPServer(('127.0.0.1', 0), PurgeRecorder)
+        thread = threading.Thread(target=server.handle_request)
+        thread.start()
+        url = 'http://127.0.0.1:%d/purge' % server.server_port
+        with override_settings(PURGE_URL=url):
+            http_purge(surrogate_keys([3, 1]).split())
+        thread.join()
+        server.server_close()
+        self.assertEqual(PurgeRecorder.requests,
+                         [('/purge', 'dictionary gloss-1 gloss-3')])
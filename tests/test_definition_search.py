@@ -0,0 +1,181 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+
+from dictionary.indexes import clear_all
+from dictionary.definition_search import (definition_search, tokenize,
+    DefinitionIndex)
+from dictionary.models import Gloss, Definition
+from dictionary.views import search_definitions
+from tests.test_views import create_request
+from tests import commit
+
+
+FTS5 = 'dictionary.definition_search.FTS5DefinitionIndex'
+
+TEXTS = [
+    ('Aborigine1', 'An indigenous person of Australia.', True),
+    ('Abraham', 'A man\'s name, from the Bible.', True),
+    ('Adam', 'A man\'s name. The first man in the Bible.', True),
+    ('Adelaide', 'The capital city of South Australia, a city on the sea.', True),
+    ('Africa', 'A continent south of Europe.', True),
+    ('African', 'A person from Africa; running away from Africa.', False),
+]
+
+
+class DefinitionSearchTests(object):
+    """Tests of a definition search backend on some definitions"""
+    fixtures = ["test_data.json"]
+    backend = None
+
+    def setUp(self):
+        clear_all()
+        self.backend_settings = override_settings(DEFINITION_SEARCH_BACKEND=self.backend)
+        self.backend_settings.enable()
+        for (idgloss, text, published) in TEXTS:
+            Definition.objects.create(
+                gloss=Gloss.objects.get(idgloss=idgloss), role='general',
+                count=1, text=text, published=published)
+        definition_search().rebuild()
+
+    def tearDown(self):
+        definition_search().invalidate()
+        self.backend_settings.disable()
+
+    def found(self, query, include_unpublished=False):
+        return [Definition.objects.get(pk=did).gloss.idgloss for (did, score)
+                in definition_search().search(query, include_unpublished)]
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.found('city australia'), ['Adelaide'])
+        self.assertEqual(sorted(self.found('Bible man')), ['Abraham', 'Adam'])
+        self.assertEqual(self.found('zebra'), [])
+        self.assertEqual(self.found('...'), [])
+        # the man who is only named is a weaker match
+        self.assertEqual(self.found('man')[0], 'Adam')
+
+    def test_unpublished_definitions_are_hidden(self):
+        self.assertEqual(self.found('persons'), ['Aborigine1'])
+        self.assertEqual(sorted(self.found('persons', True)),
+                         ['Aborigine1', 'African'])
+
+    def test_edits_update_the_index(self):
+        africa = Gloss.objects.get(idgloss='Africa')
+        self.assertEqual(self.found('continent'), ['Africa'])
+        definition = africa.definition_set.create(
+            role='note', count=1, text='The second largest continent.')
+        commit()
+        self.assertEqual(len(self.found('continent')), 2)
+        definition.text = 'No city.'
+        definition.save()
+        commit()
+        self.assertEqual(sorted(self.found('city')), ['Adelaide', 'Africa'])
+        definition.delete()
+        commit()
+        self.assertEqual(self.found('city'), ['Adelaide'])
+
+    def test_rebuild_command(self):
+        out = StringIO()
+        call_command('rebuild_definition_index', processes=2, stdout=out)
+        self.assertIn('Indexed 6 definitions', out.getvalue())
+        self.assertEqual(self.found('city australia'), ['Adelaide'])
+
+    def test_index_is_loaded_from_the_stored_words(self):
+        '''
+        The index is made from the words each definition stores, which
+        only a rebuild tokenizes again.
+        '''
+        Definition.objects.filter(text__startswith='A continent').update(
+            words='zebra')
+        definition_search().invalidate()
+        self.assertEqual(self.found('zebra'), ['Africa'])
+        definition_search().rebuild(processes=2)
+        self.assertEqual(self.found('zebra'), [])
+        self.assertEqual(self.found('continent'), ['Africa'])
+
+
+class DefinitionIndexTest(DefinitionSearchTests, TestCase):
+    backend = 'dictionary.definition_search.DefinitionIndex'
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize(u'Running, ran: RUNS!'), ['run', 'run', 'run'])
+        self.assertEqual(tokenize(u'  '), [])
+
+    def test_rebuild_is_seen_by_other_processes(self):
+        '''
+        A copy built before a rebuild elsewhere is thrown away.
+        '''
+        other = DefinitionIndex()
+        self.assertEqual(len(other.search('city')), 1)
+        Definition.objects.filter(text__startswith='A continent').update(
+            text='A city.')
+        definition_search().rebuild()
+        self.assertEqual(len(other.search('city')), 2)
+
+
+class FTS5DefinitionIndexTest(DefinitionSearchTests, TransactionTestCase):
+    '''
+    SQLite can't roll back the creation of the FTS5 table while statements
+    that read it are cached, so these tests don't run in a transaction.
+    '''
+    backend = FTS5
+
+    def test_backends_agree(self):
+        '''
+        Both backends score with FTS5's bm25(), so should rank the
+        definitions the same and give them nearly the same scores.
+        '''
+        for query in ('man', 'bible', 'a', 'south', 'city', 'africa run'):
+            fts5 = definition_search().search(query, True)
+            with override_settings(DEFINITION_SEARCH_BACKEND=
+                                   'dictionary.definition_search.DefinitionIndex'):
+                memory = definition_search().search(query, True)
+            self.assertEqual([did for (did, score) in memory],
+                             [did for (did, score) in fts5], query)
+            for ((did, score), (did, fts5_score)) in zip(memory, fts5):
+                self.assertAlmostEqual(score, fts5_score, places=5)
+
+    def test_only_rebuild_changes_the_schema(self):
+        '''
+        Throwing the index away refills the table rather than dropping
+        it, so a search never makes it.
+        '''
+        with CaptureQueriesContext(connection) as queries:
+            definition_search().invalidate()
+            self.assertEqual(self.found('city australia'), ['Adelaide'])
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'TABLE' in query['sql'].upper()])
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE %s' % definition_search().table)
+        self.assertRaises(ImproperlyConfigured, self.found, 'city')
+
+
+class DefinitionSearchView(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+        gloss = Gloss.objects.get(idgloss='Adam')
+        gloss.definition_set.create(role='general', count=1,
+                                    text='The first man.')
+        gloss.definition_set.create(role='note', count=1, published=False,
+                                    text='Not the man from the film.')
+
+    def test_staff_only(self):
+        response = self.client.get('/definitions/', {'query': 'man'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_unpublished_needs_permission(self):
+        request = create_request(data={'query': 'man'},
+                                 permission='Can Search/View Full Gloss Details')
+        response = search_definitions(request)
+        self.assertContains(response, '1 definition mentions')
+        self.assertContains(response, 'The first man.')
+        request = create_request(data={'query': 'man'},
+                                 permission='Can view unpublished defs')
+        response = search_definitions(request)
+        self.assertContains(response, '2 definitions mention')
+        self.assertContains(response, '<em>unpublished</em>')
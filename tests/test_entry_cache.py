@@ -0,0 +1,91 @@
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+
+from dictionary.entry_cache import (entry_cache, entry_viewer, STAFF_VIEWER,
+    USER_VIEWER, ANONYMOUS_VIEWER, ANONYMOUS_SAFE_VIEWER)
+from dictionary.models import Gloss, Keyword, Relation
+from tests.test_views import create_request
+
+
+class EntryCacheTest(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        entry_cache.clear()
+        self.gloss = Gloss.objects.get(idgloss='Aborigine1')
+
+    def revision(self):
+        return Gloss.objects.get(pk=self.gloss.pk).revision
+
+    def test_edits_bump_the_revision(self):
+        '''
+        Editing the gloss or anything its entry shows should give it a
+        new revision, and so a new cache key.
+        '''
+        keyword = Keyword.objects.get(text='Aborigine')
+        definition = self.gloss.definition_set.create(
+            role='general', count=1, text='text')
+        edits = [
+            lambda: self.gloss.save(),
+            lambda: definition.delete(),
+            lambda: self.gloss.translation_set.create(
+                translation=Keyword.objects.create(text='new'), index=2),
+            lambda: Relation.objects.create(
+                source=self.gloss, target=Gloss.objects.get(idgloss='Adam'),
+                role='homophone'),
+        ]
+        keyword.text = 'Aboriginal'
+        edits.append(keyword.save)
+        keys = set()
+        for edit in edits:
+            before = self.revision()
+            edit()
+            self.assertEqual(self.revision(), before + 1)
+            gloss = Gloss.objects.get(pk=self.gloss.pk)
+            keys.add(entry_cache.key(gloss, None, None, ANONYMOUS_VIEWER))
+        self.assertEqual(len(keys), len(edits))
+
+    def test_viewers(self):
+        '''
+        Each kind of viewer should get their own copy of an entry.
+        '''
+        self.assertEqual(entry_viewer(create_request()), USER_VIEWER)
+        staff = create_request(
+            permission='Can Search/View Full Gloss Details')
+        self.assertEqual(entry_viewer(staff), STAFF_VIEWER)
+        anonymous = create_request(logged_in=False)
+        self.assertEqual(entry_viewer(anonymous), ANONYMOUS_VIEWER)
+        # a request's viewer is worked out once, so this needs another
+        with override_settings(ANON_SAFE_SEARCH=True):
+            anonymous = create_request(logged_in=False)
+            self.assertEqual(entry_viewer(anonymous), ANONYMOUS_SAFE_VIEWER)
+
+    @override_settings(ENTRY_CACHE_ALIAS=None, ENTRY_CACHE_SIZE=2)
+    def test_least_recently_used_entry_is_evicted(self):
+        for key in ('a', 'b'):
+            entry_cache.set(key, key)
+        entry_cache.get('a')
+        entry_cache.set('c', 'c')
+        self.assertEqual(entry_cache.get('b'), None)
+        self.assertEqual(entry_cache.get('a'), 'a')
+        self.assertEqual(entry_cache.get('c'), 'c')
+
+    def test_file_based_cache(self):
+        '''
+        Entries should survive a round trip through a cache on disk, as
+        they would coming from another process.
+        '''
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        caches = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': location}}
+        with override_settings(CACHES=caches, ENTRY_CACHE_SIZE=0):
+            key = entry_cache.key(self.gloss, None, None, ANONYMOUS_VIEWER)
+            entry_cache.set(key, '<p>entry</p>')
+            self.assertEqual(entry_cache.get(key), '<p>entry</p>')
+            entry_cache.clear()
+            key = entry_cache.key(self.gloss, None, None, ANONYMOUS_VIEWER)
+            self.assertEqual(entry_cache.get(key), None)
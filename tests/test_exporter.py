@@ -0,0 +1,112 @@
+import csv
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from tagging.models import Tag
+
+from dictionary.exporter import export_csv, Echo
+from dictionary.indexes import clear_all
+from dictionary.importer import join, split
+from dictionary.models import Gloss, Keyword, Language, Dialect
+from dictionary.views import export
+from tests.test_views import create_request
+
+
+class ExportTest(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+        adam = Gloss.objects.get(idgloss='Adam')
+        adam.domhndsh = '0.1'
+        adam.save()
+        adam.definition_set.create(role='general', count=1, text='A name.')
+        adam.definition_set.create(role='general', count=2, text='Hidden.',
+                                   published=False)
+        adam.relation_sources.create(role='homophone',
+                                     target=Gloss.objects.get(idgloss='Abraham'))
+        Tag.objects.add_tag(adam, 'semantic:people')
+        language = Language.objects.create(name='Auslan', description='')
+        adam.region_set.create(dialect=Dialect.objects.create(
+            language=language, name='Southern', description=''), frequency='')
+
+    def rows(self, lines):
+        rows = list(csv.DictReader(lines))
+        return dict((row['idgloss'], row) for row in rows)
+
+    def test_rows(self):
+        rows = self.rows(export_csv(Echo(), include_unpublished=False))
+        self.assertEqual(len(rows), 6)
+        adam = rows['Adam']
+        self.assertEqual(adam['keywords'], 'Adam')
+        self.assertEqual(adam['definition:general'], 'A name.')
+        self.assertEqual(adam['relation:homophone'], 'Abraham')
+        self.assertEqual(adam['tags'], 'semantic:people')
+        self.assertEqual(adam['dialects'], 'Southern')
+        # the label of the handshape, not its code
+        self.assertEqual(adam['domhndsh'], 'Round')
+        self.assertEqual(adam['sn'], '4')
+        self.assertNotIn('definition:general:unpublished', adam)
+
+    def test_view_streams_the_rows(self):
+        '''
+        The header is sent before the glosses are read, and each chunk of
+        glosses costs the same few queries.
+        '''
+        request = create_request(permission='Can view unpublished defs')
+        response = export(request)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = iter(response.streaming_content)
+        with self.assertNumQueries(0):
+            header = next(lines)
+        # the gloss query, then a query each for the keywords,
+        # definitions, tags, regions and relations of the chunk
+        with self.assertNumQueries(6):
+            first = next(lines)
+        rest = list(lines)
+        rows = self.rows([line.decode('utf-8') for line in [header, first] + rest])
+        self.assertEqual(rows['Adam']['definition:general'], 'A name.')
+        self.assertEqual(rows['Adam']['definition:general:unpublished'], 'Hidden.')
+
+    def test_export_needs_permission(self):
+        self.assertEqual(self.client.get('/export/').status_code, 302)
+
+    def test_command_round_trip(self):
+        '''
+        An export can be imported again without changing anything, even
+        the definitions that aren't published or text with a '|' in it.
+        '''
+        adam = Gloss.objects.get(idgloss='Adam')
+        adam.translation_set.create(index=2, translation=Keyword.objects.create(
+            text='this|that\\'))
+        adam.definition_set.create(role='note', count=1, text='Pipes | and \\|.')
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'signs.csv')
+            call_command('export_signs', path, chunk_size=2)
+            with open(path) as f:
+                before = f.read()
+            call_command('import_signs', path, stdout=StringIO())
+            call_command('export_signs', path, chunk_size=4)
+            with open(path) as f:
+                self.assertEqual(f.read(), before)
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(
+            list(adam.translation_set.values_list('translation__text', flat=True)),
+            ['Adam', 'this|that\\'])
+        self.assertEqual(
+            list(adam.definition_set.values_list('text', 'published')),
+            [('A name.', True), ('Hidden.', False), ('Pipes | and \\|.', True)])
+
+    def test_split_and_join(self):
+        for values in (['a', 'b'], ['a|b', 'c\\'], ['\\|', '|\\']):
+            self.assertEqual(split(join(values)), values)
+        # a backslash before anything else is kept
+        self.assertEqual(split('C:\\dir | b'), ['C:\\dir', 'b'])
+        self.assertEqual(split(' | a||'), ['a'])
@@ -0,0 +1,133 @@
+import random
+
+from django.test import TestCase, override_settings
+
+from dictionary.indexes import clear_all
+from dictionary.fuzzy import (FuzzyIndex, fuzzy_index, trigrams,
+    edit_distance, allowed_distance)
+from dictionary.models import Keyword, STAFF_TIER, PUBLIC_TIER
+from dictionary.views import fuzzy_keywords, search
+from tests.test_views import create_request
+from tests import commit
+
+
+class SyntheticIndex(FuzzyIndex):
+    """A fuzzy index of a list of words instead of the keywords"""
+    name = 'fuzzy-synthetic'
+
+    def __init__(self, words):
+        self.words = words
+        super(SyntheticIndex, self).__init__()
+
+    def build(self):
+        self._text = {}
+        self._trigrams = {}
+        self._postings = {}
+        for (kid, word) in enumerate(self.words):
+            self._add(kid, word)
+
+
+class FuzzyIndexTest(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+
+    def texts(self, ids):
+        return [Keyword.objects.get(pk=kid).text for kid in ids]
+
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance('adam', 'adma', 2), 2)
+        self.assertEqual(edit_distance('africa', 'afrika', 2), 1)
+        self.assertEqual(edit_distance('aborigine', 'adam', 2), 3)
+        self.assertEqual(trigrams('Ab'), frozenset(['  a', ' ab', 'ab ']))
+
+    def test_close_matches_come_first(self):
+        self.assertEqual(self.texts(fuzzy_index.search('Afrika')),
+                         ['Africa', 'African'])
+        self.assertEqual(self.texts(fuzzy_index.search('adan'))[0], 'Adam')
+        self.assertEqual(fuzzy_index.search('zzzz'), [])
+
+    def test_renaming_a_keyword_updates_the_index(self):
+        fuzzy_index.ensure_built()
+        keyword = Keyword.objects.get(text='Adam')
+        keyword.text = 'Zebra'
+        keyword.save()
+        commit()
+        self.assertEqual(self.texts(fuzzy_index.search('zebre')), ['Zebra'])
+        self.assertNotIn(keyword.pk, fuzzy_index.search('adam'))
+        keyword.delete()
+        commit()
+        self.assertEqual(fuzzy_index.search('zebre'), [])
+
+    def test_visibility(self):
+        '''
+        Only 'Aborigine' is in the web dictionary.
+        '''
+        for use_index in (True, False):
+            with override_settings(KEYWORD_INDEX=use_index):
+                self.assertEqual([w.text for w in fuzzy_keywords('Abrahm', STAFF_TIER)],
+                                 ['Abraham'])
+                self.assertEqual(list(fuzzy_keywords('Abrahm', PUBLIC_TIER)), [])
+
+    def test_agrees_with_a_scan(self):
+        '''
+        Drawing candidates from the rarest trigrams of a term mustn't
+        lose any keyword a comparison with every keyword would find.
+        '''
+        rand = random.Random(1)
+        words = [''.join(rand.choice('abcdeilmnorst')
+                         for i in range(rand.randint(3, 9)))
+                 for j in range(1500)]
+        index = SyntheticIndex(words)
+        for term in words[:30] + ['ablemost', 'xyz', 'ma']:
+            wanted = trigrams(term)
+            distance = allowed_distance(term)
+            expected = set()
+            for (kid, word) in enumerate(words):
+                shared = len(wanted & trigrams(word))
+                similarity = float(shared) / (len(wanted) + len(trigrams(word)) - shared)
+                if (similarity >= 0.3 or
+                        edit_distance(term, word, distance) <= distance):
+                    expected.add(kid)
+            self.assertEqual(set(index.search(term)), expected)
+
+    def test_candidates_are_limited(self):
+        '''
+        A term whose trigrams every keyword shares is compared with no
+        more than FUZZY_CANDIDATES of them.
+        '''
+        index = SyntheticIndex(['ma%d' % n for n in range(3000)])
+        self.assertGreater(len(index.search('ma1')), 1000)
+        with override_settings(FUZZY_CANDIDATES=100):
+            found = index.search('ma1')
+            self.assertTrue(0 < len(found) <= 100)
+            self.assertEqual(index.search('xyz'), [])
+
+
+@override_settings(ALWAYS_REQUIRE_LOGIN=False)
+class FuzzySearchView(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+
+    def test_search_with_no_hits_shows_close_matches(self):
+        request = create_request(data={'query': 'Abarigine'}, logged_in=False)
+        response = search(request)
+        self.assertContains(response, 'id="closematches"')
+        self.assertContains(response, 'Aborigine')
+
+    def test_fuzzy_search_can_be_asked_for(self):
+        request = create_request(data={'query': 'Adelaid', 'fuzzy': 'on'},
+                                 permission='Can Search/View Full Gloss Details')
+        response = search(request)
+        self.assertContains(response, 'id="closematches"')
+        self.assertContains(response, 'Adelaide')
+
+    @override_settings(FUZZY_SEARCH=False)
+    def test_fallback_can_be_turned_off(self):
+        request = create_request(data={'query': 'Abarigine'}, logged_in=False)
+        response = search(request)
+        self.assertNotContains(response, 'id="closematches"')
+        self.assertContains(response, 'There is no exact match')
@@ -0,0 +1,166 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+
+from dictionary.indexes import clear_all
+from dictionary.importer import SignImporter
+from dictionary.keyword_index import keyword_index
+from dictionary.models import (Gloss, Keyword, Relation, Language, Dialect,
+    PublicGloss, PublicTranslation, STAFF_TIER, PUBLIC_TIER)
+
+
+class ImportSignsTest(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+        self.directory = tempfile.mkdtemp()
+        language = Language.objects.create(name='Auslan', description='')
+        Dialect.objects.create(language=language, name='Southern',
+                               description='')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def import_signs(self, name, text, **options):
+        out = StringIO()
+        call_command('import_signs', self.write(name, text), stdout=out,
+                     **options)
+        return out.getvalue()
+
+    def test_jsonl(self):
+        records = [
+            {'idgloss': 'Adam', 'inWeb': True, 'keywords': ['Adam', 'man'],
+             'definitions': [{'role': 'general', 'text': 'A name.'},
+                             {'role': 'general', 'text': 'A man.'}],
+             'relations': [{'role': 'homophone', 'target': 'Zebra1'}]},
+            {'idgloss': 'Zebra1', 'sn': 100, 'keywords': ['zebra', 'man'],
+             'regions': [{'dialect': 'Auslan/Southern', 'frequency': 'rare'}]},
+        ]
+        out = self.import_signs('signs.jsonl', '\n'.join(
+            json.dumps(record) for record in records), chunk_size=1)
+        self.assertIn('Created 1 glosses and updated 1', out)
+        adam = Gloss.objects.get(idgloss='Adam')
+        zebra = Gloss.objects.get(idgloss='Zebra1')
+        self.assertTrue(adam.inWeb)
+        self.assertEqual(adam.revision, 1)
+        self.assertEqual(zebra.sn, 100)
+        self.assertEqual([t.translation.text for t in
+                          adam.translation_set.order_by('index')], ['Adam', 'man'])
+        self.assertEqual([(d.role, d.count, d.text) for d in adam.definition_set.all()],
+                         [('general', 1, 'A name.'), ('general', 2, 'A man.')])
+        # the relation's target was in a later chunk
+        self.assertEqual(Relation.objects.get(source=adam).target, zebra)
+        self.assertEqual(zebra.region_set.get().frequency, 'rare')
+        # what the signals would have kept up to date
+        man = Keyword.objects.get(text='man')
+        self.assertEqual((man.folded, man.stem), ('man', 'man'))
+        self.assertEqual((man.translation_count, man.inweb_count), (2, 1))
+        self.assertEqual(sorted(man.translation_set.values_list('staff_ordinal', flat=True)),
+                         [1, 2])
+        self.assertEqual([w.text for w in keyword_index.search('ze', STAFF_TIER)],
+                         ['zebra'])
+        self.assertEqual(list(keyword_index.search('ze', PUBLIC_TIER)), [])
+        # and the public copies of the glosses
+        self.assertEqual(list(PublicGloss.objects.order_by('sn')
+                              .values_list('idgloss', flat=True)),
+                         ['Aborigine1', 'Adam'])
+        self.assertEqual(sorted(PublicTranslation.objects.filter(gloss=adam.pk)
+                                .values_list('translation__text', 'public_ordinal')),
+                         [('Adam', 1), ('man', 1)])
+
+    def test_csv_updates_what_it_is_given(self):
+        adam = Gloss.objects.get(idgloss='Adam')
+        kept = adam.definition_set.create(role='general', count=1, text='Old.')
+        adam.definition_set.create(role='noun', count=1, text='Gone.')
+        self.import_signs('signs.csv',
+                          'idgloss,sn,definition:general,dialects\n'
+                          'Adam,,New.|Second.,Southern\n')
+        adam = Gloss.objects.get(idgloss='Adam')
+        self.assertIsNone(adam.sn)
+        self.assertEqual([(d.pk == kept.pk, d.text, d.words)
+                          for d in adam.definition_set.all()],
+                         [(True, 'New.', 'new'), (False, 'Second.', 'second')])
+        # the keywords weren't given, so are left alone
+        self.assertEqual(adam.translation_set.count(), 1)
+        self.assertEqual(adam.region_set.get().dialect.name, 'Southern')
+
+    def test_publishing_and_relations(self):
+        '''
+        Publishing a gloss should bring the counts and ordinals of the
+        keywords it already had up to date, and replacing its relations
+        should change the entries of the signs it was related to.
+        '''
+        adam = Gloss.objects.get(idgloss='Adam')
+        abraham = Gloss.objects.get(idgloss='Abraham')
+        Relation.objects.create(source=adam, target=abraham, role='variant')
+        before = Gloss.objects.get(pk=abraham.pk).revision
+        self.import_signs('signs.jsonl', json.dumps(
+            {'idgloss': 'Adam', 'inWeb': 'True', 'relations': []}))
+        keyword = adam.translation_set.get().translation
+        self.assertEqual(Keyword.objects.get(pk=keyword.pk).inweb_count, 1)
+        self.assertEqual(PublicTranslation.objects.get(gloss=adam.pk).public_ordinal, 1)
+        self.assertEqual(Gloss.objects.get(pk=abraham.pk).revision, before + 1)
+
+    def test_bad_record_keeps_the_chunks_before_it(self):
+        text = '\n'.join([json.dumps({'idgloss': 'New1', 'keywords': ['new']}),
+                          json.dumps({'idgloss': 'New2', 'colour': 'red'})])
+        with self.assertRaisesRegexp(CommandError, 'line 2: a gloss has no field'):
+            self.import_signs('signs.jsonl', text, chunk_size=1)
+        self.assertEqual(Keyword.objects.get(text='new').translation_count, 1)
+        self.assertFalse(Gloss.objects.filter(idgloss='New2').exists())
+        with self.assertRaisesRegexp(CommandError, "no gloss 'Nobody'"):
+            self.import_signs('signs.jsonl', json.dumps(
+                {'idgloss': 'New3', 'relations': [{'role': 'variant',
+                                                   'target': 'Nobody'}]}))
+
+    def test_queries_do_not_grow_with_the_chunk(self):
+        '''
+        A chunk costs a few queries in all, not a few for each record.
+        '''
+        def chunk(start, size):
+            return [(n, {'idgloss': 'Sign%d' % n, 'sn': 1000 + n,
+                         'keywords': ['word%d' % n, 'shared'],
+                         'definitions': [{'role': 'general', 'text': 'x'}]})
+                    for n in range(start, start + size)]
+        queries = []
+        for records in (chunk(0, 5), chunk(10, 50), chunk(0, 5), chunk(10, 50)):
+            importer = SignImporter()
+            with CaptureQueriesContext(connection) as context:
+                importer.import_chunk(records)
+            queries.append(len(context))
+        # creating, then updating
+        self.assertEqual(queries[0], queries[1])
+        self.assertEqual(queries[2], queries[3])
+
+    def test_finishing_updates_in_bulk(self):
+        '''
+        The counts and ordinals of the keywords are written with a few
+        UPDATEs, not one for each translation or keyword.
+        '''
+        updates = []
+        for (start, size) in ((0, 5), (10, 50)):
+            importer = SignImporter()
+            importer.import_chunk(
+                [(n, {'idgloss': 'Sign%03d' % n, 'sn': 1000 + n, 'inWeb': True,
+                      'keywords': ['word%d' % n, 'shared']})
+                 for n in range(start, start + size)])
+            with CaptureQueriesContext(connection) as context:
+                importer.finish()
+            updates.append(len([query for query in context.captured_queries
+                                if query['sql'].startswith('UPDATE')]))
+        self.assertEqual(updates[0], updates[1])
+        self.assertEqual(Keyword.objects.get(text='shared').inweb_count, 55)
@@ -0,0 +1,77 @@
+from django.test import TestCase, override_settings
+
+from dictionary.indexes import clear_all
+from dictionary.keyword_index import keyword_index
+from dictionary.models import (Keyword, Gloss, Translation, STAFF_TIER,
+    PUBLIC_TIER)
+from dictionary.views import find_keywords
+from tests import commit
+
+
+class KeywordIndexTest(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        # the indexes outlive the transaction each test is rolled back in
+        clear_all()
+
+    def texts(self, prefix, tier):
+        ids = keyword_index.lookup(prefix, tier)
+        return [Keyword.objects.get(pk=kid).text for kid in ids]
+
+    def test_prefix_lookup_ignores_case(self):
+        '''
+        Looking up a prefix should find every keyword starting
+        with it, whatever the case, in alphabetical order.
+        '''
+        self.assertEqual(self.texts('ad', STAFF_TIER), ['Adam', 'Adelaide'])
+        self.assertEqual(self.texts('AFRIC', STAFF_TIER),
+                         ['Africa', 'African'])
+
+    def test_public_tier_only_has_keywords_in_web(self):
+        '''
+        Only 'Aborigine' has a gloss in the web dictionary.
+        '''
+        self.assertEqual(self.texts('a', PUBLIC_TIER), ['Aborigine'])
+
+    def test_publishing_a_gloss_updates_the_index(self):
+        '''
+        Publishing and unpublishing a gloss should add and remove its
+        keywords from the public tier without a rebuild.
+        '''
+        keyword_index.ensure_built()
+        gloss = Gloss.objects.get(idgloss='Adam')
+        gloss.inWeb = True
+        gloss.save()
+        commit()
+        self.assertEqual(self.texts('ad', PUBLIC_TIER), ['Adam'])
+        gloss.inWeb = False
+        gloss.save()
+        commit()
+        self.assertEqual(self.texts('ad', PUBLIC_TIER), [])
+
+    def test_keyword_and_translation_changes_update_the_index(self):
+        '''
+        Renaming a keyword moves it in the index, and a keyword whose
+        last translation is deleted drops out of it.
+        '''
+        keyword_index.ensure_built()
+        keyword = Keyword.objects.get(text='Adam')
+        keyword.text = 'Zebra'
+        keyword.save()
+        commit()
+        self.assertEqual(self.texts('ad', STAFF_TIER), ['Adelaide'])
+        self.assertEqual(self.texts('z', STAFF_TIER), ['Zebra'])
+        Translation.objects.filter(translation=keyword).delete()
+        commit()
+        self.assertEqual(self.texts('z', STAFF_TIER), [])
+
+    def test_index_agrees_with_database(self):
+        '''
+        The index and the database fallback should find the same keywords.
+        '''
+        for tier in (STAFF_TIER, PUBLIC_TIER):
+            with override_settings(KEYWORD_INDEX=False):
+                expected = [w.text for w in find_keywords('a', tier)]
+            found = [w.text for w in find_keywords('a', tier)]
+            self.assertEqual(sorted(found), sorted(expected))
@@ -0,0 +1,83 @@
+import csv
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from dictionary.indexes import clear_all
+from dictionary.exporter import Echo
+from dictionary.minimal_pairs import (refresh_minimal_pairs, find_pairs,
+    gloss_forms, minimal_pairs_csv)
+from dictionary.models import Gloss, MinimalPair
+from dictionary.views import minimal_pairs
+from tests.test_phonology import set_form
+from tests.test_views import create_request
+
+
+class MinimalPairsTest(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+        set_form('Aborigine1', domhndsh='1.1', locprim=2,
+                 initial_palm_orientation='prone')
+        set_form('Abraham', domhndsh='1.1', locprim=2,
+                 initial_palm_orientation='supine')
+        set_form('Adam', domhndsh='2.1', locprim=2,
+                 initial_palm_orientation='supine')
+        # only the field it differs in is set
+        set_form('Adelaide', domhndsh='0.1')
+        # not set isn't a value
+        set_form('Africa', domhndsh='1.1', locprim=2,
+                 initial_palm_orientation='notset')
+
+    def pairs(self):
+        return sorted(MinimalPair.objects.values_list(
+            'field', 'first__idgloss', 'second__idgloss'))
+
+    def test_pairs(self):
+        self.assertEqual(refresh_minimal_pairs(), (6, 2))
+        self.assertEqual(self.pairs(),
+                         [('domhndsh', 'Abraham', 'Adam'),
+                          ('initial_palm_orientation', 'Aborigine1', 'Abraham')])
+
+    def test_processes(self):
+        forms = gloss_forms()
+        self.assertEqual(sorted(find_pairs(forms, processes=2)),
+                         sorted(find_pairs(forms)))
+
+    def test_incremental(self):
+        refresh_minimal_pairs()
+        self.assertEqual(refresh_minimal_pairs(incremental=True), (0, 0))
+        set_form('Africa', initial_palm_orientation='supine')
+        self.assertEqual(refresh_minimal_pairs(incremental=True), (1, 2))
+        set_form('Adam', domhndsh='1.1')
+        self.assertEqual(refresh_minimal_pairs(incremental=True), (1, 1))
+        incremental = self.pairs()
+        refresh_minimal_pairs()
+        self.assertEqual(self.pairs(), incremental)
+        self.assertEqual(incremental,
+                         [('initial_palm_orientation', 'Aborigine1', 'Abraham'),
+                          ('initial_palm_orientation', 'Aborigine1', 'Adam'),
+                          ('initial_palm_orientation', 'Aborigine1', 'Africa')])
+        Gloss.objects.get(idgloss='Abraham').delete()
+        self.assertEqual(len(self.pairs()), 2)
+
+    def test_report(self):
+        refresh_minimal_pairs()
+        rows = list(csv.reader(minimal_pairs_csv(Echo())))
+        self.assertEqual(rows, [['field', 'first', 'first value', 'second', 'second value'],
+                                ['domhndsh', 'Abraham', 'Point', 'Adam', 'Two'],
+                                ['initial_palm_orientation', 'Aborigine1', 'Prone',
+                                 'Abraham', 'Supine']])
+        request = create_request(data={'field': 'domhndsh'})
+        response = minimal_pairs(request)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines[1:], ['domhndsh,Abraham,Point,Adam,Two'])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('find_minimal_pairs', '-', field=['locprim'], processes=1,
+                     stdout=out, stderr=StringIO())
+        self.assertEqual(out.getvalue().splitlines(),
+                         ['field,first,first value,second,second value'])
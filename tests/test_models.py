@@ -1,6 +1,12 @@
-from django.test import TestCase
+from django.test import TestCase, RequestFactory, override_settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404
+from tagging.models import Tag
 
-from dictionary.models import Keyword, Gloss, Translation
+from dictionary.models import (Keyword, Gloss, Translation, PublicGloss,
+    PublicTranslation, crude_glosses, refresh_public_glosses,
+    update_keyword_translations, tag_ids, viewer, SAFE_TIER, PUBLIC_TIER)
+from dictionary.indexes import clear_all
 
 class TestKeyword(TestCase):
     fixtures = ["test_data.json"]
@@ -8,10 +14,116 @@ class TestKeyword(TestCase):
     def test_str_method(self):
         keyword = Keyword.objects.get(pk=1)
         self.assertEqual(str(keyword), keyword.text)
+
+    @override_settings(ANON_SAFE_SEARCH=True)
+    def test_match_request_hides_crude_signs(self):
+        '''
+        With safe search on, an anonymous user should not be able to
+        see a sign tagged crude through match_request.
+        '''
+        keyword = Keyword.objects.get(text='Aborigine')
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        (trans, total) = keyword.match_request(request, 1)
+        self.assertEqual(total, 1)
+        Tag.objects.update_tags(trans.gloss, 'lexis:crude')
+        keyword.refresh_from_db()
+        self.assertRaises(Http404, keyword.match_request, request, 1)
+        
+        
+    def test_fixture_counts_are_worked_out(self):
+        '''
+        The fixture has no counts or ordinals, and lists translations
+        before their glosses; they should be worked out as it loads.
+        '''
+        self.assertEqual(sorted(Keyword.objects.values_list(
+            'text', 'translation_count', 'inweb_count', 'safe_count')),
+            [('Aborigine', 1, 1, 1), ('Abraham', 1, 0, 0), ('Adam', 1, 0, 0),
+             ('Adelaide', 1, 0, 0), ('Africa', 1, 0, 0), ('African', 1, 0, 0)])
+        self.assertEqual(Translation.objects.get(translation__text='Aborigine')
+                         .public_ordinal, 1)
+        self.assertEqual(PublicTranslation.objects.count(), 1)
+
+    def test_translation_counts_follow_edits(self):
+        '''
+        The translation counts on a keyword should follow translations
+        being added and removed and glosses being published.
+        '''
+        keyword = Keyword.objects.get(text='Adam')
+        self.assertEqual((keyword.translation_count, keyword.inweb_count), (1, 0))
+        gloss = Gloss.objects.get(idgloss='Adelaide')
+        trans = Translation.objects.create(gloss=gloss, translation=keyword,
+                                           index=2)
+        gloss.inWeb = True
+        gloss.save()
+        keyword.refresh_from_db()
+        self.assertEqual((keyword.translation_count, keyword.inweb_count), (2, 1))
+        self.assertTrue(keyword.inWeb())
+        trans.delete()
+        keyword.refresh_from_db()
+        self.assertEqual((keyword.translation_count, keyword.inweb_count), (1, 0))
+        self.assertFalse(keyword.inWeb())
         
         
 class TestTranslation(TestCase):
     fixtures = ["test_data.json"]
+
+    def give_keyword_many_senses(self):
+        '''
+        Make 'run' a translation of every gloss in the fixture, and put
+        'Adam' and 'Africa' in the web dictionary.
+        '''
+        keyword = Keyword.objects.create(text='run')
+        for gloss in Gloss.objects.all():
+            Translation.objects.create(gloss=gloss, translation=keyword, index=1)
+        for gloss in Gloss.objects.filter(idgloss__in=['Adam', 'Africa']):
+            gloss.inWeb = True
+            gloss.save()
+        keyword.refresh_from_db()
+        return keyword
+
+    def test_ordinals_follow_gloss_order_for_each_tier(self):
+        '''
+        Each tier should number the translations it can see from 1,
+        in gloss order.
+        '''
+        keyword = self.give_keyword_many_senses()
+        staff = keyword.translation_set.order_by('staff_ordinal')
+        self.assertEqual([t.gloss.idgloss for t in staff],
+                         sorted(Gloss.objects.values_list('idgloss', flat=True)))
+        public = keyword.translation_set.filter(
+            public_ordinal__isnull=False).order_by('public_ordinal')
+        self.assertEqual([(t.public_ordinal, t.gloss.idgloss) for t in public],
+                         [(1, 'Aborigine1'), (2, 'Adam'), (3, 'Africa')])
+        self.assertEqual((keyword.translation_count, keyword.inweb_count), (6, 3))
+        # renaming a gloss moves its translation
+        gloss = Gloss.objects.get(idgloss='Aborigine1')
+        gloss.idgloss = 'Zulu'
+        gloss.save()
+        public = keyword.translation_set.filter(
+            public_ordinal__isnull=False).order_by('public_ordinal')
+        self.assertEqual([t.gloss.idgloss for t in public],
+                         ['Adam', 'Africa', 'Zulu'])
+
+    def test_match_request_is_one_lookup(self):
+        '''
+        Finding the nth match for a keyword shouldn't load the others.
+        '''
+        keyword = self.give_keyword_many_senses()
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        with self.assertNumQueries(1):
+            (trans, total) = keyword.match_request(request, 2)
+        self.assertEqual((trans.gloss.idgloss, total), ('Adam', 3))
+        # an n out of range gives the last match
+        (trans, total) = keyword.match_request(request, 9)
+        self.assertEqual(trans.gloss.idgloss, 'Africa')
+
+    def test_get_absolute_url(self):
+        keyword = self.give_keyword_many_senses()
+        trans = keyword.translation_set.get(gloss__idgloss='Adelaide')
+        self.assertEqual(trans.get_absolute_url(),
+                         '/dictionary/words/run-4.html')
     
     def test_str_method(self):
         translation = Translation.objects.get(pk=1)
@@ -26,3 +138,116 @@ class TestGloss(TestCase):
     def test_str_method(self):
         gloss = Gloss.objects.get(sn=1)
         self.assertTrue(str(gloss), '%s-%s'%(gloss.sn, gloss.idgloss))
+
+
+class TestPublicProjection(TestCase):
+    fixtures = ["test_data.json"]
+
+    def publish(self, *idglosses):
+        for gloss in Gloss.objects.filter(idgloss__in=idglosses):
+            gloss.inWeb = True
+            gloss.save()
+
+    def assertProjected(self):
+        '''
+        The public copies should be what copying the published glosses and
+        their translations again would make.
+        '''
+        glosses = Gloss.objects.filter(inWeb=True)
+        crude = set(crude_glosses().values_list('object_id', flat=True))
+        self.assertEqual(
+            sorted(PublicGloss.objects.values_list('gloss', 'idgloss', 'sn', 'crude')),
+            sorted((g.pk, g.idgloss, g.sn, g.pk in crude) for g in glosses))
+        self.assertEqual(
+            sorted(PublicTranslation.objects.values_list(
+                'source', 'translation', 'gloss', 'public_ordinal', 'safe_ordinal')),
+            sorted(Translation.objects.filter(gloss__inWeb=True)
+                   .exclude(public_ordinal=None).values_list(
+                'pk', 'translation', 'gloss', 'public_ordinal', 'safe_ordinal')))
+
+    def test_fixture_is_projected(self):
+        self.assertEqual(list(PublicGloss.objects.values_list('idgloss', flat=True)),
+                         ['Aborigine1'])
+        self.assertProjected()
+
+    def test_publishing_and_moving_signs(self):
+        self.publish('Adam', 'Africa')
+        self.assertProjected()
+        # to before the first sign
+        africa = Gloss.objects.get(idgloss='Africa')
+        africa.sn = 0
+        africa.save()
+        self.assertProjected()
+        africa.sn = None
+        africa.save()
+        self.assertProjected()
+        adam = Gloss.objects.get(idgloss='Adam')
+        adam.inWeb = False
+        adam.save()
+        self.assertProjected()
+        Gloss.objects.get(idgloss='Aborigine1').delete()
+        self.assertProjected()
+
+    def test_many_signs_at_once(self):
+        for (n, idgloss) in enumerate(['Adelaide', 'Abraham', 'Adam', 'African']):
+            Gloss.objects.filter(idgloss=idgloss).update(inWeb=True, sn=20 - n)
+        for sn in range(30, 42):
+            Gloss.objects.create(idgloss='new%d' % sn, sn=sn, inWeb=True)
+        # as the importer does after saving glosses without signals
+        refresh_public_glosses(Gloss.objects.values_list('pk', flat=True))
+        update_keyword_translations()
+        self.assertProjected()
+
+    def test_translations_and_tags(self):
+        keyword = Keyword.objects.create(text='run')
+        gloss = Gloss.objects.get(idgloss='Aborigine1')
+        trans = Translation.objects.create(gloss=gloss, translation=keyword, index=2)
+        self.assertProjected()
+        Tag.objects.update_tags(gloss, 'lexis:crude')
+        self.assertProjected()
+        self.assertTrue(PublicGloss.objects.get(pk=gloss.pk).crude)
+        self.assertIsNone(PublicTranslation.objects.get(pk=trans.pk).safe_ordinal)
+        trans.delete()
+        self.assertProjected()
+
+    @override_settings(ALWAYS_REQUIRE_LOGIN=False)
+    def test_public_pages_read_the_projection(self):
+        self.assertEqual(self.client.get('/gloss/Aborigine1/').status_code, 200)
+        PublicGloss.objects.all().delete()
+        self.assertEqual(self.client.get('/gloss/Aborigine1/').status_code, 404)
+        self.assertEqual(self.client.get('/words/Aborigine-1/').status_code, 404)
+
+
+class TestViewer(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+
+    @override_settings(ANON_SAFE_SEARCH=True)
+    def test_viewer_is_kept_on_the_request(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        user = viewer(request)
+        self.assertIs(viewer(request), user)
+        self.assertEqual((user.staff, user.authenticated, user.tier),
+                         (False, False, SAFE_TIER))
+        with override_settings(ANON_SAFE_SEARCH=False):
+            self.assertEqual(viewer(request).tier, SAFE_TIER)
+            request = RequestFactory().get('/')
+            request.user = AnonymousUser()
+            self.assertEqual(viewer(request).tier, PUBLIC_TIER)
+
+    def test_tag_ids_follow_tag_changes(self):
+        self.assertIsNone(tag_ids.get('lexis:crude'))
+        gloss = Gloss.objects.get(idgloss='Aborigine1')
+        Tag.objects.update_tags(gloss, 'lexis:crude')
+        crude = Tag.objects.get(name='lexis:crude')
+        self.assertEqual(tag_ids.get('lexis:crude'), crude.pk)
+        # no query for the tag
+        with self.assertNumQueries(1):
+            self.assertEqual(list(crude_glosses()), [{'object_id': gloss.pk}])
+        crude.name = 'lexis:rude'
+        crude.save()
+        self.assertIsNone(tag_ids.get('lexis:crude'))
+        self.assertEqual(list(crude_glosses()), [])
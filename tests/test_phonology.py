@@ -0,0 +1,114 @@
+from django.test import TestCase, override_settings
+
+from tagging.models import Tag
+
+from dictionary.indexes import clear_all
+from dictionary.models import Gloss, STAFF_TIER, PUBLIC_TIER, SAFE_TIER
+from dictionary.phonology import phonology_index, bits
+from tests import commit
+
+
+def set_form(idgloss, **values):
+    gloss = Gloss.objects.get(idgloss=idgloss)
+    for (field, value) in values.items():
+        setattr(gloss, field, value)
+    gloss.save()
+    commit()
+    return gloss
+
+
+class PhonologyIndexTest(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+        set_form('Aborigine1', domhndsh='1.1', locprim=2)
+        set_form('Adam', domhndsh='1.1', locprim=3, inWeb=True)
+        set_form('Abraham', domhndsh='2.1', locprim=2)
+
+    def ids(self, *idglosses):
+        return [Gloss.objects.get(idgloss=idgloss).pk for idgloss in idglosses]
+
+    def test_bits(self):
+        self.assertEqual(bits(0), [])
+        self.assertEqual(bits(0b100101), [0, 2, 5])
+
+    def test_fields_are_combined(self):
+        search = phonology_index.search
+        self.assertEqual(search({'domhndsh': ['1.1']}, STAFF_TIER),
+                         self.ids('Aborigine1', 'Adam'))
+        self.assertEqual(search({'domhndsh': ['1.1', '2.1']}, STAFF_TIER),
+                         self.ids('Aborigine1', 'Abraham', 'Adam'))
+        self.assertEqual(search({'domhndsh': ['1.1'], 'locprim': ['2']}, STAFF_TIER),
+                         self.ids('Aborigine1'))
+        self.assertEqual(search({'domhndsh': ['2.1'], 'locprim': [3]}, STAFF_TIER,
+                                match_all=False),
+                         self.ids('Abraham', 'Adam'))
+        self.assertEqual(search({'domhndsh': []}, STAFF_TIER), [])
+        self.assertEqual(search({'subhndsh': ['1.1']}, STAFF_TIER), [])
+
+    def test_tiers(self):
+        criteria = {'domhndsh': ['1.1', '2.1']}
+        self.assertEqual(phonology_index.search(criteria, PUBLIC_TIER),
+                         self.ids('Aborigine1', 'Adam'))
+        Tag.objects.add_tag(Gloss.objects.get(idgloss='Adam'), 'lexis:crude')
+        commit()
+        self.assertEqual(phonology_index.search(criteria, SAFE_TIER),
+                         self.ids('Aborigine1'))
+        self.assertEqual(phonology_index.search(criteria, PUBLIC_TIER),
+                         self.ids('Aborigine1', 'Adam'))
+
+    def test_edits_are_indexed(self):
+        '''
+        The index follows changes to the form, sign number and visibility
+        of a gloss, and forgets deleted glosses.
+        '''
+        phonology_index.ensure_built()
+        set_form('Abraham', domhndsh='1.1', sn=100)
+        self.assertEqual(phonology_index.search({'domhndsh': ['1.1']}, STAFF_TIER),
+                         self.ids('Aborigine1', 'Adam', 'Abraham'))
+        self.assertEqual(phonology_index.search({'domhndsh': ['2.1']}, STAFF_TIER), [])
+        set_form('Adam', inWeb=False)
+        self.assertEqual(phonology_index.search({'domhndsh': ['1.1']}, PUBLIC_TIER),
+                         self.ids('Aborigine1'))
+        Gloss.objects.get(idgloss='Aborigine1').delete()
+        commit()
+        self.assertEqual(phonology_index.search({'domhndsh': ['1.1']}, STAFF_TIER),
+                         self.ids('Adam', 'Abraham'))
+        # the slot Aborigine1 had is reused
+        set_form('Africa', domhndsh='1.1')
+        found = phonology_index.search({'domhndsh': ['1.1']}, STAFF_TIER)
+        self.assertEqual(found, self.ids('Adam', 'Africa', 'Abraham'))
+        clear_all()
+        self.assertEqual(phonology_index.search({'domhndsh': ['1.1']}, STAFF_TIER),
+                         found)
+
+
+@override_settings(ALWAYS_REQUIRE_LOGIN=False)
+class PhonologySearchViewTest(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+        set_form('Aborigine1', domhndsh='1.1', locprim=2)
+        set_form('Adam', domhndsh='1.1')
+
+    def test_search(self):
+        response = self.client.get('/phonology/', {'domhndsh': ['1.1', '2.1']})
+        self.assertEqual(response.status_code, 200)
+        # Adam isn't in the web dictionary
+        self.assertEqual(response.context['count'], 1)
+        self.assertContains(response, '/gloss/Aborigine1/')
+        response = self.client.get('/phonology/', {'domhndsh': '1.1',
+                                                   'locprim': '3'})
+        self.assertEqual(response.context['count'], 0)
+        response = self.client.get('/phonology/', {'domhndsh': '1.1',
+                                                   'locprim': '3',
+                                                   'match': 'any'})
+        self.assertEqual(response.context['count'], 1)
+
+    def test_empty_search(self):
+        response = self.client.get('/phonology/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['searched'])
+        self.assertEqual(response.context['count'], 0)
@@ -0,0 +1,120 @@
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+
+from dictionary.indexes import clear_all
+from dictionary.positions import gloss_positions
+from dictionary.models import Gloss
+from tests import commit
+
+
+class GlossPositionsTest(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+
+    def orm_position(self, gloss, staff):
+        glosses = Gloss.objects.all()
+        if not staff:
+            glosses = glosses.filter(inWeb=True)
+        return (glosses.filter(sn__lt=gloss.sn).count() + 1, glosses.count())
+
+    def test_positions_agree_with_database(self):
+        '''
+        Every gloss's position should be what counting in the
+        database gives, for staff and the public.
+        '''
+        for gloss in Gloss.objects.filter(inWeb=True):
+            self.assertEqual(gloss_positions.position(gloss, False),
+                             self.orm_position(gloss, False))
+        for gloss in Gloss.objects.all():
+            self.assertEqual(gloss_positions.position(gloss, True),
+                             self.orm_position(gloss, True))
+
+    def test_navigation_matches_next_and_previous_glosses(self):
+        '''
+        The neighbours from the index should be the glosses that
+        next_dictionary_gloss and prev_dictionary_gloss find.
+        '''
+        for gloss in Gloss.objects.all():
+            for staff in (True, False):
+                nav = gloss.navigation(staff)
+                for (ref, expected) in ((nav['next'], gloss.next_dictionary_gloss(staff)),
+                                        (nav['prev'], gloss.prev_dictionary_gloss(staff))):
+                    self.assertEqual(ref and ref.pk, expected and expected.pk)
+
+    def test_navigation_costs_no_queries(self):
+        gloss = Gloss.objects.get(sn=4)
+        gloss_positions.ensure_built()
+        with self.assertNumQueries(0):
+            nav = gloss.navigation(True)
+            position = gloss_positions.position(gloss, True)
+        self.assertEqual((nav['prev'].sn, nav['next'].sn), (3, 5))
+        self.assertEqual(position, (3, 6))
+
+    def test_publishing_and_renumbering_move_a_gloss(self):
+        '''
+        Publishing, renumbering and deleting a gloss should update
+        positions and navigation without a rebuild.
+        '''
+        first = Gloss.objects.get(sn=1)
+        gloss = Gloss.objects.get(sn=6)
+        self.assertEqual(gloss_positions.position(first, False), (1, 1))
+        gloss.inWeb = True
+        gloss.save()
+        commit()
+        self.assertEqual(gloss_positions.position(first, False), (1, 2))
+        self.assertEqual(first.navigation(False)['next'].idgloss, gloss.idgloss)
+        gloss.sn = 0
+        gloss.save()
+        commit()
+        self.assertEqual(gloss_positions.position(gloss, False), (1, 2))
+        self.assertEqual(first.navigation(False)['prev'].pk, gloss.pk)
+        gloss.delete()
+        commit()
+        self.assertEqual(gloss_positions.position(first, False), (1, 1))
+        self.assertEqual(first.navigation(False)['prev'], None)
+
+
+class RolledBackEditTest(TransactionTestCase):
+    '''
+    An edit should only reach the index once its transaction commits.
+    '''
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+        self.first = Gloss.objects.get(sn=1)
+
+    def publish_and_roll_back(self, during=None):
+        try:
+            with transaction.atomic():
+                gloss = Gloss.objects.get(sn=6)
+                gloss.inWeb = True
+                gloss.save()
+                if during is not None:
+                    during()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+
+    def test_rolled_back_edit_never_reaches_the_index(self):
+        gloss_positions.ensure_built()
+        self.publish_and_roll_back(during=lambda: self.assertEqual(
+            gloss_positions.position(self.first, False), (1, 1)))
+        self.assertEqual(gloss_positions.position(self.first, False), (1, 1))
+
+    def test_copy_loaded_before_a_rollback_is_thrown_away(self):
+        # loaded in the transaction, so with the published gloss
+        self.publish_and_roll_back(during=lambda: self.assertEqual(
+            gloss_positions.position(self.first, False), (1, 2)))
+        self.assertEqual(gloss_positions.position(self.first, False), (1, 1))
+
+    def test_committed_edit_reaches_the_index(self):
+        gloss_positions.ensure_built()
+        with transaction.atomic():
+            gloss = Gloss.objects.get(sn=6)
+            gloss.inWeb = True
+            gloss.save()
+            self.assertEqual(gloss_positions.position(self.first, False), (1, 1))
+        self.assertEqual(gloss_positions.position(self.first, False), (1, 2))
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command, CommandError
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+from dictionary.indexes import clear_all
+from dictionary.entry_cache import entry_cache
+from dictionary.models import Gloss
+from dictionary.prerender import prerender, page_file, STATE_FILE
+
+
+@override_settings(ALWAYS_REQUIRE_LOGIN=False)
+class PrerenderTest(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+        entry_cache.clear()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, *path):
+        with open(os.path.join(self.directory, *path), 'rb') as f:
+            return f.read().decode('utf-8')
+
+    def exists(self, *path):
+        return os.path.exists(os.path.join(self.directory, *path))
+
+    def test_renders_the_public_pages(self):
+        out = StringIO()
+        call_command('prerender_site', self.directory, processes=1, stdout=out)
+        # the gloss and word page of the one public sign, and a search
+        # page for each letter
+        self.assertIn('Rendered 28 pages and removed 0', out.getvalue())
+        self.assertIn('Aborigine', self.read('gloss', 'Aborigine1', 'index.html'))
+        self.assertIn('Aborigine', self.read('words', 'Aborigine-1', 'index.html'))
+        self.assertIn('Aborigine', self.read('search', 'query=A.html'))
+        self.assertTrue(self.exists('search', 'query=Z.html'))
+        self.assertTrue(self.exists(STATE_FILE))
+        self.assertFalse(self.exists('gloss', 'Adam'))
+        self.assertFalse(self.exists('words', 'Adam-1'))
+
+    def test_incremental(self):
+        self.assertEqual(prerender(self.directory), (28, 0))
+        self.assertEqual(prerender(self.directory, incremental=True), (0, 0))
+        gloss = Gloss.objects.get(idgloss='Aborigine1')
+        gloss.definition_set.create(role='general', count=1,
+                                    text='The first people of Australia.')
+        # the pages showing the sign, including the search for its keyword
+        self.assertEqual(prerender(self.directory, incremental=True), (3, 0))
+        self.assertIn('The first people',
+                      self.read('gloss', 'Aborigine1', 'index.html'))
+        # without --incremental every page is rendered
+        self.assertEqual(prerender(self.directory), (28, 0))
+
+    def test_moving_signs_renders_every_page(self):
+        prerender(self.directory)
+        adam = Gloss.objects.get(idgloss='Adam')
+        adam.inWeb = True
+        adam.save()
+        # "Sign 1 of 2" on every page, and the new sign's pages
+        self.assertEqual(prerender(self.directory, incremental=True), (30, 0))
+        self.assertTrue(self.exists('words', 'Adam-1', 'index.html'))
+        adam.inWeb = False
+        adam.save()
+        self.assertEqual(prerender(self.directory, incremental=True), (28, 2))
+        self.assertFalse(self.exists('words', 'Adam-1', 'index.html'))
+        self.assertFalse(self.exists('gloss', 'Adam', 'index.html'))
+
+    def test_page_file(self):
+        self.assertEqual(page_file('/site', '/words/caf%C3%A9-1/'),
+                         os.path.join('/site', 'words', u'caf\xe9-1', 'index.html'))
+        self.assertEqual(page_file('/site', '/search/?query=A&page=2'),
+                         os.path.join('/site', 'search', 'query=A&page=2.html'))
+        self.assertIsNone(page_file('/site', '/words/../../etc-1/'))
+
+    @override_settings(ALWAYS_REQUIRE_LOGIN=True)
+    def test_needs_public_pages(self):
+        with self.assertRaises(CommandError):
+            call_command('prerender_site', self.directory, stdout=StringIO())
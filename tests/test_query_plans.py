@@ -0,0 +1,97 @@
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+from dictionary.models import (Gloss, Keyword, Translation, Definition,
+    Relation, PublicTranslation, STAFF_TIER)
+from dictionary.views import find_keywords
+
+
+def query_plan(queryset):
+    """Return SQLite's plan for a queryset, one step per line"""
+    (sql, params) = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return '\n'.join(row[-1] for row in cursor.fetchall())
+
+
+class QueryPlanTest(TestCase):
+    '''
+    The queries the pages make most often should be answered from an
+    index, without reading the whole table or sorting the rows.
+    '''
+
+    def assertUsesIndex(self, queryset, table, columns, sorted=True):
+        plan = query_plan(queryset)
+        self.assertRegexpMatches(plan, 'SEARCH %s USING (COVERING )?INDEX' % table)
+        self.assertIn('(%s' % columns, plan)
+        if sorted:
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    @override_settings(KEYWORD_INDEX=False)
+    def test_keyword_prefix_search(self):
+        # the matches are sorted by their text, but aren't many
+        self.assertUsesIndex(find_keywords('Ab', STAFF_TIER),
+                             'dictionary_keyword', 'folded>? AND folded<?',
+                             sorted=False)
+
+    def test_gloss_by_idgloss(self):
+        self.assertUsesIndex(Gloss.objects.filter(idgloss='Adam'),
+                             'dictionary_gloss', 'idgloss=?')
+
+    def test_next_sign_in_web(self):
+        self.assertUsesIndex(
+            Gloss.objects.filter(sn__gt=3, inWeb__exact=True).order_by('sn'),
+            'dictionary_gloss', 'inWeb=? AND sn>?')
+
+    def test_next_public_sign(self):
+        self.assertUsesIndex(
+            Gloss.objects.filter(public__sn__gt=3).order_by('public__sn'),
+            'dictionary_publicgloss', 'sn>?')
+
+    def test_public_gloss_by_idgloss(self):
+        # there is only one to sort
+        self.assertUsesIndex(Gloss.objects.filter(public__idgloss='Adam'),
+                             'dictionary_publicgloss', 'idgloss=?', sorted=False)
+
+    def test_public_match(self):
+        self.assertUsesIndex(
+            PublicTranslation.objects.filter(translation=1, public_ordinal=2),
+            'dictionary_publictranslation', 'translation_id=? AND public_ordinal=?')
+
+    def test_translations_of_gloss(self):
+        self.assertUsesIndex(
+            Translation.objects.filter(gloss=1).order_by('index'),
+            'dictionary_translation', 'gloss_id=?')
+
+    def test_definitions_of_gloss(self):
+        self.assertUsesIndex(
+            Definition.objects.filter(gloss=1, published=True)
+            .order_by('role', 'count'),
+            'dictionary_definition', 'gloss_id=?')
+
+    def test_relations_of_gloss(self):
+        self.assertUsesIndex(
+            Relation.objects.filter(source=1, role='homophone').order_by(),
+            'dictionary_relation', 'source_id=?')
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(
+                cursor, 'dictionary_relation').values()
+        self.assertIn(['source_id', 'role'],
+                      [index['columns'] for index in indexes])
+
+
+class MigrationTest(TestCase):
+
+    def test_models_match_the_migrations(self):
+        out = StringIO()
+        try:
+            call_command('makemigrations', 'dictionary', check=True,
+                         dry_run=True, stdout=out)
+        except SystemExit:
+            self.fail(out.getvalue())
+
+    def test_keywords_are_folded(self):
+        keyword = Keyword.objects.create(text='Ice Cream')
+        self.assertEqual(Keyword.objects.get(pk=keyword.pk).folded, 'ice cream')
@@ -0,0 +1,161 @@
+from django.test import TestCase, override_settings
+from tagging.models import Tag
+
+from dictionary.indexes import clear_all
+from dictionary.models import (Gloss, Relation, STAFF_TIER, PUBLIC_TIER,
+    SAFE_TIER)
+from dictionary.relations import relation_graph
+from dictionary.views import gloss
+from tests.test_views import create_request
+from tests import commit
+
+
+class RelationGraphTest(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+        self.glosses = dict((g.idgloss, g) for g in Gloss.objects.all())
+
+    def relate(self, source, target, role='variant'):
+        relation = Relation.objects.create(source=self.glosses[source],
+                                           target=self.glosses[target], role=role)
+        commit()
+        return relation
+
+    def names(self, idgloss, role='variant', hops=None, tier=STAFF_TIER):
+        return [(sign.idgloss, sign.hops) for sign in relation_graph.reachable(
+            self.glosses[idgloss].pk, role, hops, tier)]
+
+    def publish(self, *idglosses):
+        for idgloss in idglosses:
+            self.glosses[idgloss].inWeb = True
+            self.glosses[idgloss].save()
+        commit()
+
+    def revision(self, idgloss):
+        return Gloss.objects.get(idgloss=idgloss).revision
+
+    def test_variant_clusters(self):
+        '''
+        The variants of a sign should be followed, both ways, as far as
+        they go, or only as many hops as asked.
+        '''
+        self.relate('Aborigine1', 'Abraham')
+        self.relate('Adam', 'Abraham')
+        self.relate('Adam', 'Adelaide')
+        self.relate('Africa', 'Adam', role='synonym')
+        self.assertEqual(self.names('Aborigine1'),
+                         [('Abraham', 1), ('Adam', 2), ('Adelaide', 3)])
+        self.assertEqual(self.names('Adelaide', hops=2),
+                         [('Adam', 1), ('Abraham', 2)])
+        self.assertEqual(self.names('Adam', role='synonym', hops=1),
+                         [('Africa', 1)])
+        self.assertEqual(relation_graph.related(self.glosses['Adam'].pk),
+                         [('Variant', [(self.glosses['Abraham'].pk, 'Abraham', 1),
+                                       (self.glosses['Adelaide'].pk, 'Adelaide', 1),
+                                       (self.glosses['Aborigine1'].pk, 'Aborigine1', 2)]),
+                          ('Synonym', [(self.glosses['Africa'].pk, 'Africa', 1)])])
+
+    @override_settings(RELATION_HOPS={'variant': 1})
+    def test_hops_setting(self):
+        self.relate('Aborigine1', 'Abraham')
+        self.relate('Adam', 'Abraham')
+        self.assertEqual(relation_graph.related(self.glosses['Aborigine1'].pk),
+                         [('Variant', [(self.glosses['Abraham'].pk, 'Abraham', 1)])])
+
+    def test_tiers(self):
+        '''
+        A tier should neither see nor go through signs it can't see.
+        '''
+        self.relate('Aborigine1', 'Abraham')
+        self.relate('Abraham', 'Adam')
+        self.relate('Aborigine1', 'Adelaide')
+        self.publish('Adam', 'Adelaide')
+        self.assertEqual(self.names('Aborigine1', tier=PUBLIC_TIER),
+                         [('Adelaide', 1)])
+        self.publish('Abraham')
+        self.assertEqual(self.names('Aborigine1', tier=PUBLIC_TIER),
+                         [('Abraham', 1), ('Adelaide', 1), ('Adam', 2)])
+        Tag.objects.update_tags(self.glosses['Abraham'], 'lexis:crude')
+        commit()
+        self.assertEqual(self.names('Aborigine1', tier=SAFE_TIER),
+                         [('Adelaide', 1)])
+        Tag.objects.update_tags(self.glosses['Abraham'], '')
+        commit()
+        self.assertEqual(self.names('Aborigine1', tier=SAFE_TIER),
+                         [('Abraham', 1), ('Adelaide', 1), ('Adam', 2)])
+
+    def test_edits(self):
+        '''
+        The graph should follow edits to the relations and the signs
+        without being built again, and match a graph built afresh.
+        '''
+        relation_graph.ensure_built()
+        relation = self.relate('Aborigine1', 'Abraham')
+        self.relate('Aborigine1', 'Abraham')
+        self.relate('Adam', 'Abraham', role='homophone')
+        relation.delete()
+        commit()
+        # there is still the other relation between them
+        self.assertEqual(self.names('Abraham'), [('Aborigine1', 1)])
+        relation = Relation.objects.get(role='variant')
+        relation.target = self.glosses['Adam']
+        relation.save()
+        commit()
+        self.assertEqual(self.names('Abraham'), [])
+        adam = self.glosses['Adam']
+        adam.idgloss = 'Adam2'
+        adam.save()
+        commit()
+        self.assertEqual(self.names('Abraham', role='homophone'), [('Adam2', 1)])
+        self.glosses['Aborigine1'].delete()
+        commit()
+        with self.assertNumQueries(0):
+            incremental = [self.names(idgloss, role) for idgloss in
+                           ('Abraham', 'Adam') for role in ('variant', 'homophone')]
+        clear_all()
+        self.assertEqual([self.names(idgloss, role) for idgloss in
+                          ('Abraham', 'Adam') for role in ('variant', 'homophone')],
+                         incremental)
+
+    def test_neighbours_get_new_revisions(self):
+        '''
+        A relation should change the entries of every sign that shows
+        one of its signs, and renaming a sign those that show it.
+        '''
+        self.relate('Aborigine1', 'Abraham')
+        self.relate('Adam', 'Adelaide')
+        self.relate('Africa', 'Adam', role='synonym')
+        before = dict((idgloss, self.revision(idgloss)) for idgloss in self.glosses)
+        self.relate('Abraham', 'Adam')
+        # Aborigine1 and Adelaide now show the whole cluster, and Africa
+        # is a neighbour too, though only its synonym shows on its page
+        self.assertEqual(dict((idgloss, self.revision(idgloss) - before[idgloss])
+                              for idgloss in self.glosses),
+                         {'Aborigine1': 1, 'Abraham': 1, 'Adam': 1,
+                          'Adelaide': 1, 'Africa': 1, 'African': 0})
+        before = dict((idgloss, self.revision(idgloss)) for idgloss in self.glosses)
+        adelaide = Gloss.objects.get(idgloss='Adelaide')
+        adelaide.idgloss = 'Adelaide2'
+        adelaide.save()
+        self.assertEqual(self.revision('Aborigine1'), before['Aborigine1'] + 1)
+        self.assertEqual(self.revision('African'), before['African'])
+
+    @override_settings(ALWAYS_REQUIRE_LOGIN=False)
+    def test_entry_page(self):
+        '''
+        The entry page should link to the related signs its viewer can
+        see, and show them once they are published.
+        '''
+        self.publish('Adam')
+        self.relate('Aborigine1', 'Abraham')
+        self.relate('Abraham', 'Adam')
+        request = create_request(logged_in=False)
+        response = gloss(request, 'Aborigine1')
+        self.assertNotContains(response, 'id="relatedblock"')
+        self.publish('Abraham')
+        response = gloss(create_request(logged_in=False), 'Aborigine1')
+        self.assertContains(response, 'id="relatedblock"')
+        self.assertContains(response, '/gloss/Abraham/')
+        self.assertContains(response, '/gloss/Adam/')
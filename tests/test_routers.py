@@ -0,0 +1,120 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from dictionary.indexes import clear_all
+from dictionary.entry_cache import entry_cache
+from dictionary.models import Gloss
+from dictionary.routers import (replica_reads, ReplicaMiddleware,
+    STICKY_COOKIE, EDITED_KEY)
+from dictionary import views
+from tests.test_views import create_request
+
+
+WORD_URL = '/words/Aborigine-1/'
+GLOSS_URL = '/gloss/Aborigine1/'
+
+
+def anonymous_request():
+    request = RequestFactory().get('/')
+    request.user = AnonymousUser()
+    return request
+
+
+@replica_reads('gloss')
+def rename_adam(request):
+    gloss = Gloss.objects.get(idgloss='Adam')
+    database = gloss._state.db
+    gloss.annotation_idgloss = 'ADAM'
+    gloss.save()
+    response = HttpResponse()
+    response.databases = (database, gloss._state.db)
+    return response
+
+
+@override_settings(DATABASE_ROUTERS=['dictionary.routers.ReplicaRouter'],
+                   REPLICA_DATABASES=['replica'],
+                   ALWAYS_REQUIRE_LOGIN=False)
+class ReplicaRouterTest(TransactionTestCase):
+    '''
+    The 'replica' database of the tests is the default database under
+    another name, so the queries sent to it can be counted.
+    '''
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+        entry_cache.clear()
+
+    def replica_queries(self, url, data=None, **extra):
+        entry_cache.clear()
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = self.client.get(url, data, **extra)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_anonymous_reads_use_the_replica(self):
+        self.assertTrue(self.replica_queries(WORD_URL))
+        self.assertTrue(self.replica_queries(GLOSS_URL))
+        self.assertTrue(self.replica_queries('/search/', {'query': 'a'}))
+
+    def test_indexes_are_loaded_from_the_default_database(self):
+        '''
+        An index loaded during a page read from a replica may be kept
+        until the next edit, so it mustn't come from a replica.
+        '''
+        clear_all()
+        self.assertEqual(self.replica_queries('/autocomplete/', {'q': 'ab'}), 0)
+
+    def test_staff_read_the_default_database(self):
+        request = create_request(WORD_URL, permission='Can Search/View Full Gloss Details')
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = views.word(request, 'Aborigine', '1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 0)
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_without_replicas(self):
+        self.assertEqual(self.replica_queries(WORD_URL), 0)
+
+    @override_settings(REPLICA_LAG={'word': 60})
+    def test_recent_edits_are_read_from_the_default_database(self):
+        cache.set(EDITED_KEY, time.time() - 120, None)
+        self.assertTrue(self.replica_queries(WORD_URL))
+        # an edit that doesn't change the dictionary's revision
+        Gloss.objects.get(idgloss='Aborigine1').definition_set.create(
+            role='general', count=1, text='text')
+        self.assertEqual(self.replica_queries(WORD_URL), 0)
+        # the gloss page doesn't mind the lag
+        self.assertTrue(self.replica_queries(GLOSS_URL))
+
+    def test_sticky_cookie(self):
+        later = {'HTTP_COOKIE': '%s=%d' % (STICKY_COOKIE, 2 ** 40)}
+        self.assertEqual(self.replica_queries(WORD_URL, **later), 0)
+        earlier = {'HTTP_COOKIE': '%s=1' % STICKY_COOKIE}
+        self.assertTrue(self.replica_queries(WORD_URL, **earlier))
+
+    def test_writes_use_the_default_database(self):
+        '''
+        A gloss read from a replica is saved to the default database.
+        '''
+        response = rename_adam(anonymous_request())
+        self.assertEqual(response.databases, ('replica', 'default'))
+        self.assertEqual(Gloss.objects.get(idgloss='Adam').annotation_idgloss,
+                         'ADAM')
+
+    @override_settings(REPLICA_STICKY_SECONDS=30)
+    def test_middleware_sets_the_cookie_after_a_write(self):
+        middleware = ReplicaMiddleware(lambda request: HttpResponse())
+        response = middleware(anonymous_request())
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+        response = ReplicaMiddleware(rename_adam)(anonymous_request())
+        self.assertEqual(response.cookies[STICKY_COOKIE]['max-age'], 30)
+        # the next request hasn't written anything
+        response = middleware(anonymous_request())
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
@@ -0,0 +1,96 @@
+from unittest import skipUnless
+
+from django.test import TestCase, override_settings
+
+from tagging.models import Tag
+
+from dictionary.indexes import clear_all
+from dictionary.models import Gloss, STAFF_TIER, PUBLIC_TIER, SAFE_TIER
+from dictionary.similarity import similar_signs, similarity_index, available
+from tests.test_phonology import set_form
+from tests import commit
+
+
+@skipUnless(available(), 'NumPy is not installed')
+class SimilarSignsTest(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+        self.jet = set_form('Aborigine1', domhndsh='1.1', subhndsh='0.0',
+                            locprim=2, initial_palm_orientation='prone')
+        set_form('Abraham', domhndsh='1.1', subhndsh='0.0', locprim=2,
+                 initial_palm_orientation='supine')
+        set_form('Adam', domhndsh='1.1', subhndsh='2.1', locprim=3,
+                 initial_palm_orientation='prone', inWeb=True)
+        set_form('Adelaide', domhndsh='2.1', subhndsh='2.1', locprim=5,
+                 initial_palm_orientation='supine')
+
+    def idglosses(self, gloss, k=10, tier=STAFF_TIER):
+        return [(found.idgloss, distance)
+                for (found, distance) in similar_signs(gloss, k, tier)]
+
+    def test_nearest_first(self):
+        '''
+        Abraham differs in palm orientation (2); Adam in the subordinate
+        handshape (2), location (3) and being two handed (2); the others in
+        everything. Fields Aborigine1 hasn't set don't count.
+        '''
+        found = self.idglosses(self.jet)
+        self.assertEqual(found[:2], [('Abraham', 2.0), ('Adam', 7.0)])
+        # Adelaide, Africa and African, the last two with nothing set
+        self.assertEqual(sorted(found[2:]), [('Adelaide', 12.0), ('Africa', 12.0),
+                                             ('African', 12.0)])
+        self.assertEqual(self.idglosses(self.jet, 1), [('Abraham', 2.0)])
+        self.assertEqual(self.idglosses(self.jet, 0), [])
+
+    def test_tiers(self):
+        self.assertEqual(self.idglosses(self.jet, tier=PUBLIC_TIER),
+                         [('Adam', 7.0)])
+        Tag.objects.add_tag(Gloss.objects.get(idgloss='Adam'), 'lexis:crude')
+        commit()
+        self.assertEqual(self.idglosses(self.jet, tier=SAFE_TIER), [])
+
+    @override_settings(SIMILARITY_WEIGHTS={'initial_palm_orientation': 10})
+    def test_weights(self):
+        self.assertEqual(self.idglosses(self.jet, 2),
+                         [('Adam', 7.0), ('Abraham', 10.0)])
+
+    def test_edits_are_indexed(self):
+        similarity_index.ensure_built()
+        set_form('Adelaide', domhndsh='1.1', subhndsh='0.0', locprim=2,
+                 initial_palm_orientation='prone')
+        self.assertEqual(self.idglosses(self.jet, 1), [('Adelaide', 0.0)])
+        Gloss.objects.get(idgloss='Adelaide').delete()
+        commit()
+        self.assertEqual(self.idglosses(self.jet, 1), [('Abraham', 2.0)])
+        # the rows grow past the room they were given
+        for i in range(1100):
+            Gloss.objects.create(idgloss='new%d' % i, domhndsh='1.1',
+                                 subhndsh='0.0', locprim=2,
+                                 initial_palm_orientation='prone')
+        commit()
+        self.assertEqual(self.idglosses(self.jet, 1), [('new0', 0.0)])
+        new = Gloss.objects.get(idgloss='new1099')
+        self.assertEqual(self.idglosses(new, 1), [('Aborigine1', 0.0)])
+
+
+@skipUnless(available(), 'NumPy is not installed')
+@override_settings(ALWAYS_REQUIRE_LOGIN=False)
+class SimilarViewTest(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+        set_form('Aborigine1', domhndsh='1.1', locprim=2)
+        set_form('Adam', domhndsh='1.1', locprim=3, inWeb=True)
+
+    def test_similar(self):
+        response = self.client.get('/similar/Aborigine1/', {'k': 5})
+        self.assertEqual(response.json(), [{'idgloss': 'Adam',
+                                            'sn': 4,
+                                            'distance': 3.0,
+                                            'url': '/gloss/Adam/'}])
+        # Abraham isn't in the web dictionary
+        response = self.client.get('/similar/Abraham/')
+        self.assertEqual(response.status_code, 404)
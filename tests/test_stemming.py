@@ -0,0 +1,68 @@
+from django.test import TestCase, override_settings
+
+from dictionary.indexes import clear_all
+from dictionary.stemming import normalize, stem
+from dictionary.models import Keyword, STAFF_TIER, PUBLIC_TIER
+from dictionary.views import stemmed_keywords, search
+from tests.test_views import create_request
+from tests import commit
+
+
+class StemTest(TestCase):
+
+    def test_forms_of_a_word_have_one_root(self):
+        for words in (('run', 'running', 'ran', 'runs'),
+                      ('make', 'making', 'made', 'makes'),
+                      ('fly', 'flies', 'flew'),
+                      ('cry', 'cried', 'cries'),
+                      ('box', 'boxes'),
+                      ('fall', 'falling', 'falls')):
+            self.assertEqual(set(stem(word) for word in words),
+                             set([stem(words[0])]), words)
+
+    def test_short_words_and_endings_are_left_alone(self):
+        for word in ('as', 'bus', 'glass', 'this', 'sing', 'red'):
+            self.assertEqual(stem(word), word)
+
+    def test_normalize_says_what_it_undid(self):
+        self.assertEqual(normalize('Ran'), ('run', '"ran" is a form of "run"'))
+        self.assertEqual(normalize('looking out'), ('look out', 'the ending "-ing"'))
+        self.assertEqual(normalize('Run'), ('run', ''))
+
+
+class StemmedKeywordsTest(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+
+    def test_keywords_are_found_by_their_root(self):
+        '''
+        Only 'Aborigine' is in the web dictionary.
+        '''
+        for use_index in (True, False):
+            with override_settings(KEYWORD_INDEX=use_index):
+                (words, changes) = stemmed_keywords('Abrahams', STAFF_TIER)
+                self.assertEqual([w.text for w in words], ['Abraham'])
+                self.assertEqual(changes, 'the ending "-s"')
+                (words, changes) = stemmed_keywords('Abrahams', PUBLIC_TIER)
+                self.assertEqual(list(words), [])
+
+    def test_a_renamed_keyword_has_a_new_root(self):
+        stemmed_keywords('Adam', STAFF_TIER)
+        keyword = Keyword.objects.get(text='Adam')
+        keyword.text = 'Running'
+        keyword.save()
+        commit()
+        self.assertEqual(Keyword.objects.get(pk=keyword.pk).stem, 'run')
+        (words, changes) = stemmed_keywords('ran', STAFF_TIER)
+        self.assertEqual([w.pk for w in words], [keyword.pk])
+        self.assertEqual(list(stemmed_keywords('Adams', STAFF_TIER)[0]), [])
+
+    @override_settings(ALWAYS_REQUIRE_LOGIN=False)
+    def test_search_with_no_hits_tries_the_root(self):
+        request = create_request(data={'query': 'Aborigines'}, logged_in=False)
+        response = search(request)
+        self.assertContains(response, 'id="normalized"')
+        self.assertContains(response, 'the ending &quot;-s&quot;')
+        self.assertNotContains(response, 'id="closematches"')
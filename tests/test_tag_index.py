@@ -0,0 +1,59 @@
+from django.test import TestCase, override_settings
+from tagging.models import Tag
+
+from dictionary.indexes import clear_all
+from dictionary.tag_index import tag_index
+from dictionary.models import Gloss, Translation, Keyword, STAFF_TIER
+from dictionary.views import (find_keywords, tag_facets,
+    remove_words_not_belonging_to_category)
+from tests import commit
+
+
+class TagIndexTest(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+        self.adam = Gloss.objects.get(idgloss='Adam')
+        self.adelaide = Gloss.objects.get(idgloss='Adelaide')
+        Tag.objects.update_tags(self.adam, 'semantic:people religion:other')
+        Tag.objects.update_tags(self.adelaide, 'semantic:city')
+
+    def test_tagging_a_gloss_updates_the_index(self):
+        '''
+        The index should follow tags being added and removed.
+        '''
+        self.assertEqual(tag_index.glosses('semantic:people'),
+                         set([self.adam.pk]))
+        Tag.objects.update_tags(self.adam, 'religion:other')
+        commit()
+        self.assertEqual(tag_index.glosses('semantic:people'), set())
+        self.assertEqual(tag_index.glosses('religion:other'),
+                         set([self.adam.pk]))
+
+    def test_facet_counts(self):
+        '''
+        Each tag should be counted once per keyword it applies to.
+        '''
+        words = find_keywords('ad', STAFF_TIER)
+        self.assertEqual(tag_facets(words, STAFF_TIER),
+                         [('religion:other', 1), ('semantic:city', 1),
+                          ('semantic:people', 1)])
+
+    def test_category_filter_has_no_duplicates(self):
+        '''
+        A keyword with two glosses in the category should only be
+        kept once, whether it is filtered by the index or the database.
+        'Adam' now translates both glosses.
+        '''
+        adam = Keyword.objects.get(text='Adam')
+        Translation.objects.create(gloss=self.adelaide, translation=adam,
+                                   index=2)
+        Tag.objects.update_tags(self.adelaide, 'semantic:people')
+        for use_index in (True, False):
+            with override_settings(KEYWORD_INDEX=use_index):
+                words = find_keywords('a', STAFF_TIER)
+                words = remove_words_not_belonging_to_category(
+                    words, 'semantic:people', STAFF_TIER)
+                self.assertEqual([w.text for w in words],
+                                 ['Adam', 'Adelaide'])
@@ -1,7 +1,7 @@
 from django.test import TestCase
 from django.core.urlresolvers import resolve
 
-from dictionary.views import search, word, gloss
+from dictionary.views import search, word, gloss, autocomplete
 
 
 class DictionaryURLs(TestCase):
@@ -21,6 +21,10 @@ class DictionaryURLs(TestCase):
         found = resolve('/search/')
         self.assertEqual(found.func, search)
 
+    def test_autocomplete_url_resolves_to_autocomplete_view(self):
+        found = resolve('/autocomplete/')
+        self.assertEqual(found.func, autocomplete)
+
     def test_word_url_resolves_to_word_view(self):
         '''
         '/words/jet-1/', for example, should be routed
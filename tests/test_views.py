@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import json
+
 from django.test import TestCase, RequestFactory, override_settings
 from django.conf import settings 
 from django.contrib.messages.storage.fallback import FallbackStorage
@@ -6,11 +8,20 @@ from django.contrib.auth.models import AnonymousUser, User, Permission
 from tagging.models import Tag
 from django.http import Http404
 from django.db.models import Max
+from django.db import connection
+from django.core.cache import cache
+from django.test.utils import CaptureQueriesContext
 
 from dictionary.views import (search, remove_crude_words, 
     remove_words_not_belonging_to_category, paginate, word, 
-    get_gloss_position, gloss)
-from dictionary.models import Keyword, Gloss
+    get_gloss_position, gloss, find_keywords, keyset_page, count_keywords,
+    autocomplete)
+from dictionary.keyword_index import keyword_index
+from dictionary.models import (Keyword, Gloss, SAFE_TIER, STAFF_TIER,
+    RELATION_ROLE_CHOICES)
+from dictionary.indexes import clear_all
+from dictionary.entry_cache import entry_cache
+from tests import commit
 
 
 def create_request(url=None, method='GET', data=None, permission=None, logged_in=True):
@@ -58,6 +69,22 @@ def create_user(permission=None):
     return user
    
 
+def add_keywords_and_definitions(gloss):
+    '''
+    Give a gloss five more keywords, six definitions in three roles and
+    relations to each of the other signs.
+    '''
+    for i in range(5):
+        keyword = Keyword.objects.create(text='kwd%d' % i)
+        gloss.translation_set.create(translation=keyword, index=i+2)
+    for (i, role) in enumerate(['general', 'noun', 'verb'] * 2):
+        gloss.definition_set.create(role=role, count=i,
+                                    text='definition %d' % i)
+    for (other, (role, name)) in zip(Gloss.objects.exclude(pk=gloss.pk),
+                                     RELATION_ROLE_CHOICES):
+        gloss.relation_sources.create(target=other, role=role)
+   
+
 class SearchView(TestCase):
     # Django will populate the database with the data
     # in the file 'test_data.json'.
@@ -66,6 +93,8 @@ class SearchView(TestCase):
     
     def setUp(self):
         self.login_url = '/accounts/login/?next=/None'
+        # the in-memory indexes outlive each test's transaction
+        clear_all()
              
     def test_search_view_no_get_variables(self):
         '''
@@ -121,6 +150,100 @@ class SearchView(TestCase):
         self.assertEqual(nunfiltered-1, len(filtered_words))
         self.assertNotIn(bad_word, filtered_words)
 
+    @override_settings(ALWAYS_REQUIRE_LOGIN=False, ANON_SAFE_SEARCH=True)
+    def test_safe_search_hides_crude_words(self):
+        '''
+        With ANON_SAFE_SEARCH on, an anonymous user should not find
+        a keyword whose only sign is tagged crude, whether the search
+        uses the keyword index or the database.
+        '''
+        gloss = Gloss.objects.get(idgloss='Aborigine1')
+        for use_index in (True, False):
+            with override_settings(KEYWORD_INDEX=use_index):
+                request = create_request(data={'query': 'A'}, logged_in=False)
+                response = search(request)
+                self.assertContains(response, 'Aborigine')
+                Tag.objects.update_tags(gloss, 'lexis:crude')
+                commit()
+                response = search(request)
+                self.assertNotContains(response, 'Aborigine')
+                Tag.objects.update_tags(gloss, '')
+                commit()
+
+    @override_settings(KEYWORD_INDEX=False)
+    def test_safe_search_is_a_single_query(self):
+        '''
+        Filtering crude words shouldn't cost a query per keyword.
+        '''
+        for g in Gloss.objects.all():
+            g.inWeb = True
+            g.save()
+            Tag.objects.update_tags(g, 'lexis:crude')
+        with self.assertNumQueries(1):
+            self.assertEqual(list(find_keywords('A', SAFE_TIER)), [])
+
+    @override_settings(ANON_TAG_SEARCH=True)
+    def test_search_shows_category_counts(self):
+        '''
+        The search page should show how many matches there are
+        in each category.
+        '''
+        permission = 'Can Search/View Full Gloss Details'
+        Tag.objects.update_tags(Gloss.objects.get(idgloss='Adam'),
+                                'semantic:people')
+        request = create_request(data={'query': 'A'}, permission=permission)
+        response = search(request)
+        self.assertContains(response, 'category=semantic%3Apeople')
+        self.assertContains(response, '(1)')
+
+    def test_search_results_cost_a_fixed_number_of_queries(self):
+        '''
+        Showing whether each keyword is in the web dictionary
+        shouldn't cost a query per keyword.
+        '''
+        permission = 'Can Search/View Full Gloss Details'
+        request = create_request(data={'query': 'A'}, permission=permission)
+        search(request)
+        with CaptureQueriesContext(connection) as few:
+            search(request)
+        gloss = Gloss.objects.get(sn=1)
+        for i in range(10):
+            keyword = Keyword.objects.create(text='Aa%d' % i)
+            gloss.translation_set.create(translation=keyword, index=i+2)
+        with CaptureQueriesContext(connection) as many:
+            search(request)
+        self.assertEqual(len(few), len(many))
+
+    @override_settings(KEYWORD_INDEX=False)
+    def test_search_counts_the_matches_once(self):
+        '''
+        A search without a category should count its matches once, not
+        once to see whether there are any and again for the pages.
+        '''
+        cache.clear()
+        permission = 'Can Search/View Full Gloss Details'
+        request = create_request(data={'query': 'A'}, permission=permission)
+        with CaptureQueriesContext(connection) as queries:
+            search(request)
+        counts = [q for q in queries if 'COUNT(' in q['sql'].upper()]
+        self.assertEqual(len(counts), 1)
+
+    def test_fuzzy_search_skips_the_exact_lookup(self):
+        '''
+        Asking for close matches shouldn't look for exact ones first.
+        '''
+        permission = 'Can Search/View Full Gloss Details'
+        request = create_request(data={'query': 'A', 'fuzzy': 'on'},
+                                 permission=permission)
+        lookups = []
+        exact = keyword_index.search
+        keyword_index.search = lambda *args: lookups.append(args)
+        try:
+            search(request)
+        finally:
+            keyword_index.search = exact
+        self.assertEqual(lookups, [])
+
     def test_remove_words_not_belonging_to_category(self):
         '''
         Words not belonging to the category
@@ -174,14 +297,79 @@ class SearchView(TestCase):
         with self.assertTemplateUsed('dictionary/search_result.html'):
                 response = search(request) 
         self.assertEqual(response.status_code, 200)
+
+    def test_search_view_after_a_keyword(self):
+        '''
+        Passing 'after' should show the keywords that follow it, with
+        a link to the next page.
+        '''
+        permission = 'Can Search/View Full Gloss Details'
+        for use_index in (True, False):
+            with override_settings(KEYWORD_INDEX=use_index):
+                request = create_request(method='get', permission=permission,
+                                         data={'query': 'a', 'after': 'Adam'})
+                response = search(request)
+                self.assertContains(response, 'Adelaide')
+                self.assertContains(response, 'African')
+                self.assertNotContains(response, '>Abraham<')
+                self.assertContains(response, '6 full or partial matches')
+                self.assertNotContains(response, 'id=\'nextpage\'')
     
     
+@override_settings(ALWAYS_REQUIRE_LOGIN=False)
+class AutocompleteView(TestCase):
+    fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
+
+    def suggestions(self, request):
+        response = autocomplete(request)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return response.content.decode('utf-8')
+
+    def test_suggestions_follow_the_visibility_rules(self):
+        '''
+        Staff should be offered every keyword, the public only
+        those of published signs.
+        '''
+        permission = 'Can Search/View Full Gloss Details'
+        request = create_request(data={'q': 'ad'}, permission=permission)
+        self.assertEqual(self.suggestions(request), '["Adam","Adelaide"]')
+        request = create_request(data={'q': 'A'}, logged_in=False)
+        self.assertEqual(self.suggestions(request), '["Aborigine"]')
+        Tag.objects.update_tags(Gloss.objects.get(idgloss='Aborigine1'),
+                                'lexis:crude')
+        commit()
+        with override_settings(ANON_SAFE_SEARCH=True):
+            request = create_request(data={'q': 'A'}, logged_in=False)
+            self.assertEqual(self.suggestions(request), '[]')
+
+    def test_limit(self):
+        permission = 'Can Search/View Full Gloss Details'
+        request = create_request(data={'q': 'a', 'limit': '2'},
+                                 permission=permission)
+        self.assertEqual(self.suggestions(request), '["Aborigine","Abraham"]')
+        request = create_request(data={'q': 'a', 'limit': 'x'},
+                                 permission=permission)
+        self.assertEqual(len(json.loads(self.suggestions(request))), 6)
+
+    def test_suggestions_cost_no_queries(self):
+        request = create_request(data={'q': 'ab'}, logged_in=False)
+        keyword_index.ensure_built()
+        with self.assertNumQueries(0):
+            autocomplete(request)
+
+
 class TestHelperMethods(TestCase):
     '''
     This class tests functions in views.py
     that are not views.
     ''' 
     fixtures = ["test_data.json"]
+
+    def setUp(self):
+        clear_all()
     
     def test_paginate_page_not_an_integer(self):
         '''
@@ -238,6 +426,31 @@ class TestHelperMethods(TestCase):
         (result_page, paginator) = paginate(request, objects ,npages)
         self.assertEqual(result_page.number, 1)  
         
+    def test_keyset_pages_cover_the_results(self):
+        '''
+        Following page after page of keywords should give every
+        keyword once, in order, from the index or the database.
+        '''
+        for use_index in (True, False):
+            with override_settings(KEYWORD_INDEX=use_index):
+                words = find_keywords('a', STAFF_TIER)
+                found = []
+                page = keyset_page(words, '', 4)
+                found.extend(w.text for w in page.object_list)
+                self.assertTrue(page.has_next())
+                page = keyset_page(words, found[-1], 4)
+                found.extend(w.text for w in page.object_list)
+                self.assertFalse(page.has_next())
+                self.assertEqual(found, [w.text for w in words])
+
+    @override_settings(KEYWORD_INDEX=False)
+    def test_count_is_cached(self):
+        words = find_keywords('a', STAFF_TIER)
+        with self.assertNumQueries(1):
+            self.assertEqual(count_keywords(words, 'a'), 6)
+        with self.assertNumQueries(0):
+            self.assertEqual(count_keywords(words, 'a'), 6)
+
     def test_get_gloss_position_first_gloss(self):
         '''
         get_gloss_position should return the right position of
@@ -295,6 +508,8 @@ class WordView(TestCase):
     fixtures = ["test_data.json"]
     
     def setUp(self):
+        clear_all()
+        entry_cache.clear()
         # A keyword that exists in the fixture
         self.keyword = 'Aborigine'
         self.n = 1
@@ -310,6 +525,57 @@ class WordView(TestCase):
                 response = word(request, self.keyword, self.n) 
         self.assertEqual(response.status_code, 200)
 
+    def test_viewer_is_worked_out_once(self):
+        '''
+        A word page should ask for the user's permissions once each,
+        however many parts of the page depend on them.
+        '''
+        request = create_request(method='get')
+        asked = []
+        has_perm = request.user.has_perm
+
+        def counted_has_perm(permission):
+            asked.append(permission)
+            return has_perm(permission)
+        request.user.has_perm = counted_has_perm
+        word(request, self.keyword, self.n)
+        self.assertEqual(sorted(asked), ['dictionary.can_view_unpub_defs',
+                                         'dictionary.search_gloss'])
+
+    def test_word_view_costs_a_fixed_number_of_queries(self):
+        '''
+        Rendering a word page should cost the same number of queries
+        however many keywords and definitions the sign has.
+        '''
+        request = create_request(method='get')
+        # let the indexes and the user's permissions load
+        word(request, self.keyword, self.n)
+        entry_cache.clear()
+        with self.assertNumQueries(5):
+            word(request, self.keyword, self.n)
+        # which also makes the cached entry out of date
+        add_keywords_and_definitions(Gloss.objects.get(idgloss='Aborigine1'))
+        with self.assertNumQueries(5):
+            response = word(request, self.keyword, self.n)
+        self.assertContains(response, 'kwd4')
+        self.assertContains(response, 'As a Verb or Adjective')
+        self.assertContains(response, 'definition 5')
+
+    def test_word_view_uses_the_cached_entry(self):
+        '''
+        A second view of a word should only look up the keyword and
+        its translation, until the sign is edited.
+        '''
+        request = create_request(method='get')
+        word(request, self.keyword, self.n)
+        with self.assertNumQueries(2):
+            response = word(request, self.keyword, self.n)
+        self.assertContains(response, 'id="definitionblock"')
+        Gloss.objects.get(idgloss='Aborigine1').definition_set.create(
+            role='general', count=1, text='a new definition')
+        response = word(request, self.keyword, self.n)
+        self.assertContains(response, 'a new definition')
+
     def test_word_view_returns_404_for_non_existent_keyword(self):
         '''
         'word' should return a 404 if the keyword passed to it
@@ -347,6 +613,8 @@ class Glossview(TestCase):
     fixtures = ["test_data.json"]
     
     def setUp(self):
+        clear_all()
+        entry_cache.clear()
         # An idgloss that exists in the fixture...
         self.idgloss = 'Aborigine1'
         self.login_url = '/accounts/login/?next=/None'
@@ -375,6 +643,16 @@ class Glossview(TestCase):
                 response = gloss(request, self.idgloss) 
         self.assertEqual(response.status_code, 200)
     
+    @override_settings(ALWAYS_REQUIRE_LOGIN=False)
+    def test_gloss_page_is_named_as_the_templates_expect(self):
+        '''
+        The page and its sign entry should be told they are a gloss
+        page, by the name the templates compare with.
+        '''
+        response = gloss(create_request(logged_in=False), self.idgloss)
+        self.assertContains(response, 'class="view-gloss"')
+        self.assertNotContains(response, 'function')
+
     def test_gloss_not_inWeb_and_user_not_admin(self):
         '''
         A user who is not an admin, but who
@@ -399,6 +677,22 @@ class Glossview(TestCase):
                 response = gloss(request, gloss_not_inWeb.idgloss)
         self.assertEqual(response.status_code, 200)
         
+    @override_settings(ALWAYS_REQUIRE_LOGIN=False)
+    def test_gloss_view_costs_a_fixed_number_of_queries(self):
+        '''
+        Rendering a gloss page should cost the same number of queries
+        however many keywords and definitions the sign has.
+        '''
+        request = create_request(logged_in=False)
+        gloss(request, self.idgloss)
+        entry_cache.clear()
+        with self.assertNumQueries(5):
+            gloss(request, self.idgloss)
+        add_keywords_and_definitions(Gloss.objects.get(idgloss=self.idgloss))
+        with self.assertNumQueries(5):
+            response = gloss(request, self.idgloss)
+        self.assertContains(response, 'definition 5')
+
     def test_gloss_does_not_exist(self):
         '''
         If a gloss that doesn't exist is passed to the 